@@ -0,0 +1,375 @@
+import asyncio
+import random
+import re
+import logging
+from typing import Dict, Any, Hashable, Optional, List, Set
+from pydantic import BaseModel, PrivateAttr
+from agents import (
+    Agent,
+    RunContextWrapper,
+    function_tool,
+    custom_span,
+    handoff,
+)
+from aviation_client import get_aviation_client
+from response_cache import cache_key
+from reference_index import get_reference_index
+from faq_engine import get_faq_engine
+from resources import get_conversation_store, get_seat_inventory
+from storage import ConversationStore
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Airline Agent Context
+class AirlineAgentContext(BaseModel):
+    passenger_name: Optional[str] = None
+    confirmation_number: Optional[str] = None
+    flight_number: Optional[str] = None
+    seat_number: Optional[str] = None
+    flight_status: Optional[Dict[str, Any]] = None
+    airport_info: Optional[Dict[str, Any]] = None
+    airline_info: Optional[Dict[str, Any]] = None
+    # Runtime-only state; private attributes are never persisted.
+    _conversation_id: Optional[str] = PrivateAttr(default=None)
+    _store: Optional[ConversationStore] = PrivateAttr(default=None)
+    _fetch_memo: Dict[Any, "asyncio.Task"] = PrivateAttr(default_factory=dict)
+    # Speculative fetches started this turn that no tool has asked for yet.
+    _prefetched: Set[Hashable] = PrivateAttr(default_factory=set)
+
+    @property
+    def conversation_id(self) -> Optional[str]:
+        return self._conversation_id
+
+    @property
+    def store(self) -> ConversationStore:
+        return self._store if self._store is not None else get_conversation_store()
+
+    def start_turn(self, conversation_id: str, store: Optional[ConversationStore] = None) -> None:
+        self._conversation_id = conversation_id
+        self._store = store
+        self._fetch_memo = {}
+        self._prefetched = set()
+
+# AviationStack API Helper
+def start_fetch(context: AirlineAgentContext, endpoint: str, params: Dict[str, Any]) -> "asyncio.Task":
+    """Start (or reuse) this turn's fetch for ``endpoint``/``params`` without awaiting it."""
+    key = cache_key(endpoint, params)
+    task = context._fetch_memo.get(key)
+    if task is None:
+        task = asyncio.ensure_future(get_aviation_client().get(endpoint, params))
+        context._fetch_memo[key] = task
+    return task
+
+async def fetch_aviation_data(endpoint: str, params: Dict[str, Any],
+                              context: Optional[AirlineAgentContext] = None) -> Optional[List[Dict[str, Any]]]:
+    with custom_span("aviation", {"endpoint": endpoint}):
+        if context is None:
+            return await get_aviation_client().get(endpoint, params)
+        context._prefetched.discard(cache_key(endpoint, params))
+        return await asyncio.shield(start_fetch(context, endpoint, params))
+
+# Tools
+@function_tool(description_override="Lookup frequently asked questions about the airline.")
+async def faq_lookup_tool(question: str) -> str:
+    return faq_answer(question)
+
+def faq_answer(question: str) -> str:
+    matches = get_faq_engine().search(question, k=3)
+    if not matches:
+        return "Sorry, I don't have information on that topic. Can I assist with something else?"
+    answer = matches[0].answer
+    related = [match.question for match in matches[1:] if match.score >= matches[0].score * 0.6]
+    if related:
+        answer += f" (Related questions: {'; '.join(related)})"
+    return answer
+
+@function_tool(description_override="Set the passenger's name in the context.")
+async def set_passenger_name(context: RunContextWrapper[AirlineAgentContext], name: str) -> str:
+    return await apply_passenger_name(context, name)
+
+# Shared with the fast-path router, which can set the name without an LLM call
+async def apply_passenger_name(context: RunContextWrapper[AirlineAgentContext], name: str) -> str:
+    if not name or not re.match(r"^[A-Za-z\s]{1,50}$", name):
+        return "Please provide a valid name (letters and spaces only, up to 50 characters). Example: John Smith"
+    
+    context.context.passenger_name = name.strip().title()
+    await update_context_in_storage(context)
+    return f"Your name has been set to {context.context.passenger_name}. How can I assist you further?"
+
+async def _flight_aircraft(context: AirlineAgentContext, flight_number: str) -> Optional[str]:
+    flight_data = await fetch_aviation_data("flights", {"flight_iata": flight_number}, context)
+    if not flight_data:
+        return None
+    return (flight_data[0].get("aircraft") or {}).get("iata") or "A320"
+
+@function_tool(description_override="Retrieve available seats for a flight, or blocks of adjacent free seats when adjacent > 1.")
+async def get_seat_map(context: RunContextWrapper[AirlineAgentContext], flight_number: str, adjacent: int = 1) -> str:
+    if not flight_number or not re.match(r"^[A-Za-z]{2}[0-9]{1,4}$", flight_number):
+        return "Please provide a valid IATA flight number (e.g., AA123)."
+
+    aircraft = await _flight_aircraft(context.context, flight_number)
+    if aircraft is None:
+        return f"No flight data found for {flight_number}. Please check the flight number (e.g., AA123)."
+
+    seat_map = await get_seat_inventory().get_map(flight_number.upper(), aircraft)
+    if adjacent > 1:
+        blocks = seat_map.adjacent(adjacent)
+        if not blocks:
+            return f"There are no {adjacent} adjacent free seats left on flight {flight_number} ({aircraft})."
+        return (f"Blocks of {adjacent} adjacent seats on flight {flight_number} ({aircraft}): "
+                f"{'; '.join('-'.join((block[0], block[-1])) for block in blocks)}")
+
+    seats = seat_map.available(limit=40)
+    more = "…" if seat_map.available_count() > len(seats) else ""
+    return (f"{seat_map.available_count()} of {seat_map.layout.seat_count} seats available on flight "
+            f"{flight_number} ({aircraft}): {', '.join(seats)}{more}")
+
+@function_tool(description_override="Update a passenger's seat assignment.")
+async def update_seat(context: RunContextWrapper[AirlineAgentContext], confirmation_number: str, new_seat: str) -> str:
+    if not confirmation_number or not re.match(r"^[A-Za-z0-9]{2,10}$", confirmation_number):
+        return "Please provide a valid confirmation number (2-10 alphanumeric characters). Example: ABC123"
+    if not new_seat or not re.match(r"^[0-9]{1,3}[A-Za-z]$", new_seat):
+        return f"Please provide a valid seat number (e.g., 12A). Use the seat map tool to see available seats."
+
+    flight_number = context.context.flight_number or "AA123"
+    aircraft = await _flight_aircraft(context.context, flight_number)
+    if aircraft is None:
+        return f"No flight data found for {flight_number}. Please check the flight number (e.g., AA123)."
+
+    inventory = get_seat_inventory()
+    result = await inventory.reserve(flight_number.upper(), confirmation_number.upper(), new_seat, aircraft)
+    if result.reason == "invalid_seat":
+        return f"Seat {result.seat} does not exist on this aircraft ({aircraft}). Use the seat map tool to see available seats."
+    if result.reason == "unavailable":
+        return "Seat changes are temporarily unavailable. Please try again in a moment."
+    if not result.ok:
+        seat_map = await inventory.get_map(flight_number.upper(), aircraft)
+        return f"Seat {result.seat} is not available. Available seats: {', '.join(seat_map.available(limit=12))}"
+
+    context.context.seat_number = result.seat
+    context.context.confirmation_number = confirmation_number
+    if not context.context.flight_number:
+        context.context.flight_number = flight_number
+
+    await update_context_in_storage(context)
+    return f"Your seat has been updated to {result.seat} for confirmation number {confirmation_number} on flight {context.context.flight_number}."
+
+@function_tool(description_override="Retrieve real-time or historical flight status.")
+async def get_flight_status(context: RunContextWrapper[AirlineAgentContext], flight_number: str) -> str:
+    if not re.match(r"^[A-Za-z]{2}[0-9]{1,4}$", flight_number):
+        return "Please provide a valid IATA flight number (e.g., AA123 or UA456)."
+
+    flight_data = await fetch_aviation_data("flights", {"flight_iata": flight_number}, context.context)
+    if not flight_data:
+        return f"No information found for flight {flight_number}. Please check the flight number (e.g., AA123) or try sites like FlightAware (flightaware.com)."
+
+    flight = flight_data[0]
+    status = {
+        "flight_number": flight.get("flight", {}).get("iata", flight_number),
+        "status": flight.get("flight_status", "Unknown"),
+        "departure": flight.get("departure", {}).get("airport", "Unknown"),
+        "arrival": flight.get("arrival", {}).get("airport", "Unknown"),
+        "scheduled_departure": flight.get("departure", {}).get("scheduled", "Unknown"),
+        "delay": flight.get("departure", {}).get("delay", 0)
+    }
+    context.context.flight_status = status
+    await update_context_in_storage(context)
+    return (f"Flight {flight_number}: Status - {status['status']}, "
+            f"Departure - {status['departure']}, Arrival - {status['arrival']}, "
+            f"Scheduled - {status['scheduled_departure']}, Delay - {status['delay']} minutes")
+
+async def lookup_reference(kind: str, iata_code: str,
+                           context: Optional[AirlineAgentContext] = None) -> Optional[Dict[str, Any]]:
+    # Static reference data is served from the local index; only misses use API quota.
+    index = get_reference_index(kind)
+    if index is not None:
+        record = index.get(iata_code)
+        if record is not None:
+            return record
+    data = await fetch_aviation_data(kind, {"iata_code": iata_code}, context)
+    return data[0] if data else None
+
+@function_tool(description_override="Retrieve airport information by IATA code.")
+async def get_airport_info(context: RunContextWrapper[AirlineAgentContext], iata_code: str) -> str:
+    if not re.match(r"^[A-Za-z]{3}$", iata_code):
+        return "Please provide a valid IATA airport code (e.g., SFO)."
+
+    airport = await lookup_reference("airports", iata_code.upper(), context.context)
+    if not airport:
+        return f"No information found for airport {iata_code}. Please check the code (e.g., SFO)."
+
+    return (f"Airport {iata_code}: {airport.get('airport_name', 'Unknown')}, "
+            f"Location: {airport.get('city_iata_code', 'Unknown')} ({airport.get('country_name', 'Unknown')}), "
+            f"Timezone: {airport.get('timezone', 'Unknown')}")
+
+@function_tool(description_override="Retrieve airline information by IATA code or airline name (e.g., AA or American Airlines).")
+async def get_airline_info(context: RunContextWrapper[AirlineAgentContext], iata_code: str) -> str:
+    if not re.match(r"^[A-Za-z0-9]{2}$", iata_code):
+        index = get_reference_index("airlines")
+        resolved = index.resolve(iata_code) if index is not None else None
+        if resolved is None:
+            return "Please provide a valid IATA airline code (e.g., AA)."
+        iata_code = resolved
+
+    airline = await lookup_reference("airlines", iata_code.upper(), context.context)
+    if not airline:
+        return f"No information found for airline {iata_code}. Please check the code (e.g., AA)."
+
+    return (f"Airline {iata_code}: {airline.get('airline_name', 'Unknown')}, "
+            f"Country: {airline.get('country_name', 'Unknown')}, "
+            f"Fleet Size: {airline.get('fleet_size', 'Unknown')}, Founded: {airline.get('date_founded', 'Unknown')}")
+
+async def update_context_in_storage(context: RunContextWrapper[AirlineAgentContext]) -> None:
+    # Staged only; the turn-end save triggers the actual write.
+    if context.context.conversation_id is not None:
+        await context.context.store.save(context.context.conversation_id, context.context.dict())
+
+async def on_seat_booking_handoff(context: RunContextWrapper[AirlineAgentContext]) -> None:
+    if not context.context.flight_number:
+        context.context.flight_number = f"FLT-{random.randint(100,999)}"
+    await update_context_in_storage(context)
+
+def build_agents(model: Any) -> Dict[str, Agent[AirlineAgentContext]]:
+    faq_agent = Agent[AirlineAgentContext](
+        name="FAQ Agent",
+        handoff_description="Answers common questions about the airline.",
+        instructions="""
+        You are an FAQ Agent for an airline, assisting with common questions in a polite, professional, and customer-friendly tone. Use the `faq_lookup_tool` to answer questions accurately. Follow this routine:
+        1. Greet the customer, using their name if available (e.g., "Hello, [passenger_name]! How can I assist you?").
+        2. Identify the last question and use `faq_lookup_tool` to answer it clearly.
+        3. If the tool fails or returns no answer, apologize and transfer to the triage agent (e.g., "I'm sorry, I couldn't find that information. Let me connect you with our triage agent.").
+        4. Confirm if the question was answered (e.g., "Does that help, or is there anything else?").
+        5. Close politely if no further questions (e.g., "Thank you for reaching out! Have a great day.").
+        Guidelines:
+        - Always use `faq_lookup_tool`.
+        - Use context (e.g., flight_number) when relevant.
+        - Log interactions for traceability.
+        - Transfer unrelated queries to the triage agent.
+        """,
+        tools=[faq_lookup_tool],
+        model=model
+    )
+
+    seat_booking_agent = Agent[AirlineAgentContext](
+        name="Seat Booking Agent",
+        handoff_description="Helps customers update their seat assignments.",
+        instructions="""
+        You are a Seat Booking Agent, assisting with seat assignments in a polite, professional tone. Use `update_seat` and `get_seat_map` tools. Follow this routine:
+        1. Greet the customer, using their name if available (e.g., "Hello, [passenger_name]! Let's update your seat.").
+        2. Confirm or request the confirmation number (e.g., "Please provide your confirmation number, like ABC123.").
+        3. Use `get_seat_map` to show available seats if needed (e.g., "Here are available seats: [seat_list].").
+        4. Validate inputs (confirmation number, seat number) and use `update_seat` to update the assignment.
+        5. Confirm the update (e.g., "Your seat is now [seat_number] for confirmation [confirmation_number].").
+        6. Close politely (e.g., "Enjoy your flight! Anything else I can help with?").
+        Guidelines:
+        - Validate inputs and provide examples (e.g., "Confirmation like ABC123, seat like 12A").
+        - Transfer unrelated queries to the triage agent.
+        - Log interactions for traceability.
+        """,
+        tools=[update_seat, get_seat_map],
+        model=model
+    )
+
+    flight_status_agent = Agent[AirlineAgentContext](
+        name="Flight Status Agent",
+        handoff_description="Retrieves real-time flight status.",
+        instructions="""
+        You are a Flight Status Agent, retrieving flight status in a polite, professional tone. Use `get_flight_status` tool. Follow this routine:
+        1. Greet the customer, using their name if available (e.g., "Hello, [passenger_name]! Let me check your flight.").
+        2. Confirm or request the flight number (e.g., "Please provide the flight number, like AA123.").
+        3. Use `get_flight_status` to retrieve and share status (e.g., "Flight [flight_number] is [status]...").
+        4. Confirm if the question was answered (e.g., "Does that cover it, or is there more I can help with?").
+        5. Close politely (e.g., "Safe travels! Let me know if you need more help.").
+        Guidelines:
+        - Always use `get_flight_status`.
+        - Validate flight numbers and provide examples (e.g., "AA123 or UA456").
+        - Transfer invalid or unrelated queries to the triage agent.
+        - Log interactions for traceability.
+        """,
+        tools=[get_flight_status],
+        model=model
+    )
+
+    airport_info_agent = Agent[AirlineAgentContext](
+        name="Airport Info Agent",
+        handoff_description="Provides information about airports.",
+        instructions="""
+        You are an Airport Info Agent, providing airport details in a polite, professional tone. Use `get_airport_info` tool. Follow this routine:
+        1. Greet the customer, using their name if available (e.g., "Hello, [passenger_name]! Let me get that airport info.").
+        2. Request or confirm the airport IATA code (e.g., "Please provide the airport code, like SFO.").
+        3. Use `get_airport_info` to retrieve and share details (e.g., "Airport [iata_code]: [airport_name]...").
+        4. Confirm if the question was answered (e.g., "Is that what you needed, or can I help with more?").
+        5. Close politely (e.g., "Thank you for reaching out! Safe travels.").
+        Guidelines:
+        - Always use `get_airport_info`.
+        - Validate IATA codes and provide examples (e.g., "SFO or JFK").
+        - Transfer unrelated queries to the triage agent.
+        - Log interactions for traceability.
+        """,
+        tools=[get_airport_info],
+        model=model
+    )
+
+    airline_info_agent = Agent[AirlineAgentContext](
+        name="Airline Info Agent",
+        handoff_description="Provides information about airlines.",
+        instructions="""
+        You are an Airline Info Agent, providing airline details in a polite, professional tone. Use `get_airline_info` tool. Follow this routine:
+        1. Greet the customer, using their name if available (e.g., "Hello, [passenger_name]! Let me get that airline info.").
+        2. Request or confirm the airline IATA code (e.g., "Please provide the airline code, like AA.").
+        3. Use `get_airline_info` to retrieve and share details (e.g., "Airline [iata_code]: [airline_name]...").
+        4. Confirm if the question was answered (e.g., "Is that what you needed, or can I help with more?").
+        5. Close politely (e.g., "Thank you for reaching out! Let me know if you need more help.").
+        Guidelines:
+        - Always use `get_airline_info`.
+        - Validate IATA codes and provide examples (e.g., "AA or UA").
+        - Transfer unrelated queries to the triage agent.
+        - Log interactions for traceability.
+        """,
+        tools=[get_airline_info],
+        model=model
+    )
+
+    triage_agent = Agent[AirlineAgentContext](
+        name="Triage Agent",
+        handoff_description="Delegates customer requests to the appropriate agent.",
+        instructions="""
+        You are a Triage Agent for an airline, delegating requests in a polite, professional tone. Follow this routine:
+        1. Greet the customer, using their name if available (e.g., "Hello, [passenger_name]! How can I assist you today?").
+        2. Analyze the request and delegate:
+           - "name" or "passenger name": Use `set_passenger_name` (e.g., extract "John Smith" from "My name is John Smith").
+           - General airline info (e.g., baggage, Wi-Fi): Transfer to FAQ Agent.
+           - Seat updates: Transfer to Seat Booking Agent (trigger `on_seat_booking_handoff`).
+           - Flight status: Transfer to Flight Status Agent.
+           - Airport info (e.g., "about SFO"): Transfer to Airport Info Agent.
+           - Airline info (e.g., "about American Airlines"): Transfer to Airline Info Agent.
+           - Flight search: Respond, "I can't search flights, but try FlightAware (flightaware.com) or FlightRadar24 (flightradar24.com) for active flight numbers."
+        3. If unclear, ask for clarification with examples (e.g., "Could you clarify? For example, say 'Check AA123 status' or 'Update seat to 12A'.").
+        4. If no agent fits, apologize (e.g., "I'm sorry, I can't assist with that. Please try again or contact support.").
+        Guidelines:
+        - Use context (e.g., flight_number) to streamline handoffs.
+        - Provide example inputs for unclear requests.
+        - Log interactions for traceability.
+        - Maintain a human-like, empathetic tone.
+        """,
+        tools=[set_passenger_name],
+        handoffs=[
+            faq_agent,
+            handoff(agent=seat_booking_agent, on_handoff=on_seat_booking_handoff),
+            flight_status_agent,
+            airport_info_agent,
+            airline_info_agent
+        ],
+        model=model
+    )
+
+    faq_agent.handoffs.append(triage_agent)
+    seat_booking_agent.handoffs.append(triage_agent)
+    flight_status_agent.handoffs.append(triage_agent)
+    airport_info_agent.handoffs.append(triage_agent)
+    airline_info_agent.handoffs.append(triage_agent)
+
+    get_telemetry().install()
+    agents = [triage_agent, faq_agent, seat_booking_agent, flight_status_agent, airport_info_agent, airline_info_agent]
+    return {agent.name: agent for agent in agents}
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+from faq_engine import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Context fields an answer may depend on. Derived blobs (flight_status, airport_info,
+# airline_info) follow from these and are left out so they don't split the cache.
+FINGERPRINT_FIELDS = ("passenger_name", "confirmation_number", "flight_number", "seat_number")
+
+# Tools whose output depends only on their arguments and that never touch the context.
+CACHEABLE_TOOLS = frozenset({"faq_lookup_tool", "get_airport_info", "get_airline_info"})
+
+# Cacheable tools whose arguments name what the answer is about. A near-duplicate
+# may only reuse such an answer if it mentions the same values ("jfk" vs "lga").
+ENTITY_ARGUMENTS = {"get_airport_info": ("iata_code",), "get_airline_info": ("iata_code",)}
+
+# Flight numbers, seat numbers, IATA codes: anything like these must match exactly,
+# "AA123" vs "AA124" is a near-duplicate string but a different question.
+ENTITY = re.compile(r"\b(?=[A-Za-z]*[0-9])[A-Za-z0-9]+\b|\b[A-Z]{2,3}\b")
+
+
+def normalize(text: str) -> str:
+    return " ".join(token for token in tokenize(text) if len(token) > 1)
+
+
+def entities(text: str) -> FrozenSet[str]:
+    return frozenset(match.group().upper() for match in ENTITY.finditer(text))
+
+
+def trigrams(normalized: str) -> FrozenSet[str]:
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def tool_entities(tool_calls: Iterable[Tuple[str, str]]) -> FrozenSet[str]:
+    """Normalized entity arguments from ``(tool name, JSON arguments)`` pairs."""
+    values = set()
+    for name, arguments in tool_calls:
+        fields = ENTITY_ARGUMENTS.get(name)
+        if not fields:
+            continue
+        try:
+            parsed = json.loads(arguments or "{}")
+        except ValueError:
+            parsed = {}
+        for field_name in fields:
+            value = normalize(str(parsed.get(field_name, "")))
+            if value:
+                values.add(value)
+    return frozenset(values)
+
+
+def context_fingerprint(agent: str, context: Dict[str, Any]) -> str:
+    relevant = {name: context.get(name) for name in FINGERPRINT_FIELDS}
+    return hashlib.sha1(json.dumps([agent, relevant], sort_keys=True).encode()).hexdigest()[:16]
+
+
+@dataclass
+class CachedAnswer:
+    replies: List[str]
+    agent: str
+    grams: FrozenSet[str]
+    bucket: Hashable
+    expires_at: float
+    # Entity arguments the answer was computed for; see ENTITY_ARGUMENTS
+    bound: FrozenSet[str] = frozenset()
+
+
+class AnswerCache:
+    """Near-duplicate cache of agent replies, in front of ``Runner.run``.
+
+    Keys are the normalized message plus a fingerprint of the starting agent
+    and the identifying context fields. Lookups first try an exact normalized
+    match, then character-trigram cosine similarity against entries in the same
+    bucket (same fingerprint and same flight/seat/IATA tokens). A near match is
+    only used if the message mentions every entity argument (airport or airline
+    code) the original answer was looked up with. Everything is dropped when
+    the FAQ source's version changes. Callers decide what may be stored; see
+    ``TurnRunner`` for the no-mutation rule.
+    """
+
+    def __init__(self, ttl: float = 3600.0, threshold: float = 0.85, max_entries: int = 2000,
+                 min_tokens: int = 2, source_version: Optional[Callable[[], int]] = None):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self.source_version = source_version
+        self._version: Optional[int] = None
+        self._entries: "OrderedDict[Tuple[Hashable, str], CachedAnswer]" = OrderedDict()
+        # bucket -> trigram -> normalized messages containing it
+        self._grams: Dict[Hashable, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "skipped": 0, "invalidations": 0,
+                       "entity_mismatches": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _key(self, message: str, agent: str, context: Dict[str, Any]) -> Optional[Tuple[Hashable, str]]:
+        normalized = normalize(message)
+        # One-word follow-ups ("why?", "and international") only make sense with the history.
+        if len(normalized.split()) < self.min_tokens:
+            return None
+        return (context_fingerprint(agent, context), entities(message)), normalized
+
+    def _check_version(self) -> None:
+        if self.source_version is None:
+            return
+        version = self.source_version()
+        if version != self._version:
+            if self._entries:
+                logger.info(f"FAQ source changed (version {version}); dropping {len(self._entries)} cached answers")
+                self.counts["invalidations"] += 1
+            self._entries.clear()
+            self._grams.clear()
+            self._version = version
+
+    def _remove(self, key: Tuple[Hashable, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        grams = self._grams.get(entry.bucket)
+        if grams is not None:
+            for gram in entry.grams:
+                holders = grams.get(gram)
+                if holders is not None:
+                    holders.discard(key[1])
+                    if not holders:
+                        del grams[gram]
+            if not grams:
+                del self._grams[entry.bucket]
+
+    def _nearest(self, bucket: Hashable, grams: FrozenSet[str]) -> Tuple[Optional[str], float]:
+        overlaps: Dict[str, int] = defaultdict(int)
+        index = self._grams.get(bucket, {})
+        for gram in grams:
+            for normalized in index.get(gram, ()):
+                overlaps[normalized] += 1
+        best, best_score = None, 0.0
+        for normalized, overlap in overlaps.items():
+            entry = self._entries[(bucket, normalized)]
+            score = overlap / math.sqrt(len(grams) * len(entry.grams))
+            if score > best_score:
+                best, best_score = normalized, score
+        return best, best_score
+
+    def get(self, message: str, agent: str, context: Dict[str, Any]) -> Optional[CachedAnswer]:
+        key = self._key(message, agent, context)
+        if key is None:
+            return None
+        bucket, normalized = key
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            exact = entry is not None
+            if entry is None:
+                nearest, score = self._nearest(bucket, trigrams(normalized))
+                if nearest is not None and score >= self.threshold:
+                    candidate = self._entries[(bucket, nearest)]
+                    words = f" {normalized} "
+                    if all(f" {value} " in words for value in candidate.bound):
+                        key, entry = (bucket, nearest), candidate
+                    else:
+                        self.counts["entity_mismatches"] += 1
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.counts["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counts["hits" if exact else "near_hits"] += 1
+        return entry
+
+    def put(self, message: str, agent: str, context: Dict[str, Any], replies: List[str],
+            final_agent: str, bound: FrozenSet[str] = frozenset()) -> bool:
+        key = self._key(message, agent, context)
+        if key is None or not replies:
+            self.counts["skipped"] += 1
+            return False
+        bucket, normalized = key
+        grams = trigrams(normalized)
+        with self._lock:
+            self._check_version()
+            self._remove(key)
+            self._entries[key] = CachedAnswer(list(replies), final_agent, grams, bucket,
+                                             time.monotonic() + self.ttl, bound)
+            index = self._grams[bucket]
+            for gram in grams:
+                index[gram].add(normalized)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self.counts["stores"] += 1
+        return True
+
+    def skip(self) -> None:
+        self.counts["skipped"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counts["hits"] + self.counts["near_hits"] + self.counts["misses"]
+        stats: Dict[str, Any] = {**self.counts, "size": len(self._entries)}
+        if lookups:
+            stats["hit_rate"] = round((self.counts["hits"] + self.counts["near_hits"]) / lookups, 3)
+        return stats
+
+
+def cacheable_run(tool_names: Iterable[str], context_before: Dict[str, Any], context_after: Dict[str, Any]) -> bool:
+    """A run may be replayed only if it used side-effect-free tools and left the context untouched."""
+    return context_before == context_after and all(name in CACHEABLE_TOOLS for name in tool_names)
+
+
+_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide answer cache, or None when ANSWER_CACHE_ENABLED is off."""
+    global _cache
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _cache is None:
+        from faq_engine import get_faq_engine
+
+        _cache = AnswerCache(
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.85")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000")),
+            source_version=get_faq_engine().current_version,
+        )
+    return _cache
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from io_loop import run_in_io_loop
+from response_cache import EndpointPolicy, ResponseCache, cache_key
+from singleflight import SingleFlight
+from telemetry import get_telemetry
+from upstream import UpstreamUnavailable, get_upstream
+
+logger = logging.getLogger(__name__)
+
+AVIATION_BASE_URL = "https://api.aviationstack.com/v1/"
+
+
+def cache_policies_from_env() -> Dict[str, EndpointPolicy]:
+    # Reference data barely changes; flight status only needs to be minutes fresh.
+    # "Not found" is only remembered briefly, since it may be a transient upstream error.
+    return {
+        "flights": EndpointPolicy(
+            ttl=float(os.getenv("AVIATION_FLIGHTS_TTL", "60")),
+            stale_ttl=float(os.getenv("AVIATION_FLIGHTS_STALE_TTL", "240")),
+            empty_ttl=float(os.getenv("AVIATION_FLIGHTS_EMPTY_TTL", "15")),
+        ),
+        "airports": EndpointPolicy(
+            ttl=float(os.getenv("AVIATION_AIRPORTS_TTL", "86400")),
+            stale_ttl=float(os.getenv("AVIATION_AIRPORTS_STALE_TTL", "604800")),
+            empty_ttl=float(os.getenv("AVIATION_AIRPORTS_EMPTY_TTL", "60")),
+        ),
+        "airlines": EndpointPolicy(
+            ttl=float(os.getenv("AVIATION_AIRLINES_TTL", "86400")),
+            stale_ttl=float(os.getenv("AVIATION_AIRLINES_STALE_TTL", "604800")),
+            empty_ttl=float(os.getenv("AVIATION_AIRLINES_EMPTY_TTL", "60")),
+        ),
+    }
+
+
+class AviationClient:
+    """Shared keep-alive HTTP client for the AviationStack API.
+
+    The underlying httpx pool is bound to the shared I/O loop, so callers on any
+    event loop (including each Streamlit ``asyncio.run``) reuse the same connections.
+    """
+
+    def __init__(
+        self,
+        base_url: str = AVIATION_BASE_URL,
+        api_key: Optional[str] = None,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        max_per_host: int = 8,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30.0,
+        )
+        self.max_per_host = max_per_host
+        self.cache = cache
+        self.inflight = SingleFlight()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def from_env(cls) -> "AviationClient":
+        return cls(
+            base_url=os.getenv("AVIATION_BASE_URL", AVIATION_BASE_URL),
+            api_key=os.getenv("AVIATION_API_KEY"),
+            connect_timeout=float(os.getenv("AVIATION_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("AVIATION_READ_TIMEOUT", "10")),
+            max_connections=int(os.getenv("AVIATION_MAX_CONNECTIONS", "20")),
+            max_keepalive=int(os.getenv("AVIATION_MAX_KEEPALIVE", "10")),
+            max_per_host=int(os.getenv("AVIATION_MAX_PER_HOST", "8")),
+            cache=ResponseCache(
+                cache_policies_from_env(),
+                max_entries=int(os.getenv("AVIATION_CACHE_MAX_ENTRIES", "2048")),
+            ),
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _request(self, endpoint: str, url: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        async with self._host_semaphore(url):
+            start = time.perf_counter()
+            try:
+                response = await self._get_client().get(url, params=query)
+                response.raise_for_status()
+                data = response.json().get("data", [])
+            except (httpx.HTTPError, ValueError) as e:
+                get_telemetry().observe_aviation(endpoint, time.perf_counter() - start, type(e).__name__)
+                raise
+            get_telemetry().observe_aviation(endpoint, time.perf_counter() - start, "ok")
+            return data
+
+    async def _get(self, endpoint: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        url = f"{self.base_url}{endpoint}"
+        query = {**params, "access_key": self.api_key}
+        try:
+            # Rate limits, retries and the circuit breaker are shared with every other session.
+            return await get_upstream("aviationstack").call(lambda: self._request(endpoint, url, query))
+        except (httpx.HTTPError, ValueError, UpstreamUnavailable) as e:
+            logger.error(f"Failed to fetch data from {endpoint}: {str(e)}")
+            return None
+
+    async def _cached_get(self, endpoint: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        key = cache_key(endpoint, params)
+
+        def fetch() -> Awaitable[Optional[List[Dict[str, Any]]]]:
+            return self.inflight.do(key, lambda: self._get(endpoint, params))
+
+        if self.cache is None:
+            return await fetch()
+        return await self.cache.get_or_fetch(endpoint, key, fetch)
+
+    async def get(self, endpoint: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        return await run_in_io_loop(self._cached_get(endpoint, params))
+
+    def cache_stats(self) -> Dict[str, int]:
+        stats = {f"inflight_{name}": value for name, value in self.inflight.stats().items()}
+        if self.cache is not None:
+            stats.update(self.cache.stats.as_dict(), size=len(self.cache))
+        return stats
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            client, self._client = self._client, None
+            await run_in_io_loop(client.aclose())
+
+
+_default_client: Optional[AviationClient] = None
+
+
+def get_aviation_client() -> AviationClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = AviationClient.from_env()
+    return _default_client
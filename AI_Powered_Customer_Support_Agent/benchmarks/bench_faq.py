@@ -0,0 +1,81 @@
+"""Benchmark FaqEngine lookups against a synthetic knowledge file.
+
+    python benchmarks/bench_faq.py --entries 10000 --queries 2000
+
+Reports build time and per-query latency percentiles; exits non-zero if the
+p99 lookup exceeds --budget-ms (1 ms by default).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faq_engine import FaqEngine  # noqa: E402
+
+TOPICS = ["baggage", "wifi", "seat", "meal", "pet", "refund", "upgrade", "lounge", "visa", "infant",
+          "wheelchair", "checkin", "boarding", "delay", "cancellation", "miles", "stroller", "sports equipment"]
+WORDS = ("policy fee allowance international domestic flight ticket cabin class economy business first "
+         "passenger online airport gate terminal member status partner purchase change request travel").split()
+
+
+def synthetic_entries(count: int, rng: random.Random):
+    for i in range(count):
+        topic = rng.choice(TOPICS)
+        words = rng.sample(WORDS, 6)
+        yield {
+            "question": f"What is the {topic} {' '.join(words[:3])} rule {i}?",
+            "keywords": [topic, words[3]],
+            "answer": f"Entry {i}: {topic} {' '.join(words)} " + " ".join(rng.choices(WORDS, k=30)),
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "faqs.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(list(synthetic_entries(args.entries, rng)), f)
+
+        start = time.perf_counter()
+        engine = FaqEngine(path, reload_interval=3600)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        queries = [f"what's the {rng.choice(TOPICS)} {' '.join(rng.sample(WORDS, 3))}?" for _ in range(args.queries)]
+        for query in queries[:50]:
+            engine.search(query)
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            engine.search(query, k=5)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(json.dumps({
+        "entries": args.entries,
+        "queries": args.queries,
+        "build_ms": round(build_ms, 1),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p50_ms": round(p50, 4),
+        "p99_ms": round(p99, 4),
+    }, indent=2))
+    return 0 if p99 <= args.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Contention benchmark for SeatInventory reservations on a single flight.
+
+    python benchmarks/bench_seats.py --passengers 2000 --attempts 5 --hot-fraction 0.05
+    python benchmarks/bench_seats.py --mongo-uri mongodb://localhost:27017 --processes 4
+
+Every passenger repeatedly tries to move to a random seat, with most
+attempts aimed at a small set of "hot" seats. At the end the flight is
+checked for double bookings: every seat has at most one holder, every
+passenger holds at most one seat and the occupancy bitmap agrees. Exits
+non-zero if any invariant is violated.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seat_inventory import SeatInventory, SeatMap, layout_for  # noqa: E402
+
+DATABASE = "airline_bench"
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))] if ordered else 0.0
+
+
+async def contend(inventory: SeatInventory, args: argparse.Namespace, worker: int) -> Dict[str, Any]:
+    layout = layout_for(args.aircraft)
+    seats = [layout.seat(i) for i in range(layout.seat_count)]
+    rng = random.Random(args.seed + worker)
+    hot = seats[:max(1, int(len(seats) * args.hot_fraction))]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+
+    async def passenger(index: int) -> None:
+        confirmation = f"W{worker}P{index}"
+        for _ in range(args.attempts):
+            seat = rng.choice(hot) if rng.random() < args.hot_ratio else rng.choice(seats)
+            async with semaphore:
+                start = time.perf_counter()
+                result = await inventory.reserve(args.flight, confirmation, seat, args.aircraft)
+                latencies.append((time.perf_counter() - start) * 1000)
+            outcomes[result.reason] = outcomes.get(result.reason, 0) + 1
+
+    await asyncio.gather(*(passenger(i) for i in range(args.passengers)))
+    return {"latencies": latencies, "outcomes": outcomes, **inventory.stats()}
+
+
+def check(seats: Dict[str, str], aircraft: str) -> List[str]:
+    """Return invariant violations for a flight's final seat assignments."""
+    problems = []
+    holders: Dict[str, str] = {}
+    for seat, confirmation in seats.items():
+        if confirmation in holders:
+            problems.append(f"{confirmation} holds both {holders[confirmation]} and {seat}")
+        holders[confirmation] = seat
+    seat_map = SeatMap.from_assignments(layout_for(aircraft), seats)
+    if seat_map.occupied.bit_count() != len(seats):
+        problems.append(f"bitmap has {seat_map.occupied.bit_count()} seats, assignments have {len(seats)}")
+    return problems
+
+
+def mongo_collection(uri: str):
+    from pymongo import MongoClient
+
+    return MongoClient(uri)[DATABASE]["seat_inventory"]
+
+
+def worker_main(args: argparse.Namespace, worker: int, queue: "multiprocessing.Queue[Any]") -> None:
+    inventory = SeatInventory(mongo_collection(args.mongo_uri), cache_ttl=args.cache_ttl)
+    queue.put(asyncio.run(contend(inventory, args, worker)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--passengers", type=int, default=2000)
+    parser.add_argument("--attempts", type=int, default=5, help="seat changes per passenger")
+    parser.add_argument("--concurrency", type=int, default=500, help="reservations in flight per process")
+    parser.add_argument("--hot-fraction", type=float, default=0.05, help="share of seats that are 'hot'")
+    parser.add_argument("--hot-ratio", type=float, default=0.8, help="share of attempts aimed at hot seats")
+    parser.add_argument("--aircraft", default="A320")
+    parser.add_argument("--flight", default="BENCH1")
+    parser.add_argument("--mongo-uri", help="benchmark Mongo compare-and-set instead of the in-memory path")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes (Mongo only)")
+    parser.add_argument("--cache-ttl", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.mongo_uri:
+        collection = mongo_collection(args.mongo_uri)
+        collection.delete_many({"flight_key": args.flight})
+        SeatInventory(collection).ensure_indexes()
+        queue: "multiprocessing.Queue[Any]" = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker_main, args=(args, i, queue)) for i in range(args.processes)]
+        for process in workers:
+            process.start()
+        results = [queue.get() for _ in workers]
+        for process in workers:
+            process.join()
+        final = collection.find_one({"flight_key": args.flight}) or {}
+        seats = final.get("seats", {})
+        passengers = final.get("passengers", {})
+    else:
+        inventory = SeatInventory()
+        results = [asyncio.run(contend(inventory, args, 0))]
+        seat_map = asyncio.run(inventory.get_map(args.flight, args.aircraft))
+        seats, passengers = dict(seat_map.seats), dict(seat_map.passengers)
+    duration = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result["latencies"])
+    outcomes: Dict[str, int] = {}
+    for result in results:
+        for reason, count in result["outcomes"].items():
+            outcomes[reason] = outcomes.get(reason, 0) + count
+    problems = check(seats, args.aircraft)
+    if {seat for seat in passengers.values()} != set(seats):
+        problems.append("passenger index disagrees with seat assignments")
+
+    print(json.dumps({
+        "backend": "mongo" if args.mongo_uri else "memory",
+        "processes": args.processes if args.mongo_uri else 1,
+        "reservations_attempted": len(latencies),
+        "duration_s": round(duration, 3),
+        "throughput_per_s": round(len(latencies) / duration, 1) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "outcomes": outcomes,
+        "retries": sum(result["retries"] for result in results),
+        "seats_taken": len(seats),
+        "violations": problems,
+    }, indent=2))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
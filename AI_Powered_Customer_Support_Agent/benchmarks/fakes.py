@@ -0,0 +1,313 @@
+"""Local stand-ins for Gemini (OpenAI chat completions), AviationStack and MongoDB.
+
+    python benchmarks/fakes.py --port 9100 --llm-latency-ms 300 --aviation-latency-ms 80
+
+The HTTP fakes run as one Starlette app: ``/v1/chat/completions`` plays the
+model and ``/aviation/{flights,airports,airlines}`` plays AviationStack. The
+model is scripted: it reads the latest user message, hands off to the agent
+that owns the matching tool, calls the tool with arguments parsed from the
+message, then answers with the tool output. ``FakeCollection`` is an
+in-process pymongo collection for ``ConversationStore``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+# Scripted intents
+
+
+@dataclass
+class Intent:
+    name: str
+    pattern: "re.Pattern[str]"
+    handoff: Optional[str]
+    tool: str
+    args: Callable[["re.Match[str]", str], Dict[str, Any]]
+
+
+INTENTS = [
+    Intent("name", re.compile(r"my name is (?P<name>[A-Za-z ]+)", re.I), None, "set_passenger_name",
+           lambda m, text: {"name": m["name"].strip()}),
+    Intent("seat", re.compile(r"seat for (?P<conf>[A-Z0-9]{2,10}) to (?P<seat>\d{1,3}[A-F])", re.I),
+           "transfer_to_seat_booking_agent", "update_seat",
+           lambda m, text: {"confirmation_number": m["conf"], "new_seat": m["seat"].upper()}),
+    Intent("status", re.compile(r"\b(?P<flight>[A-Z]{2}\d{1,4})\b.*status|status.*\b(?P<flight2>[A-Z]{2}\d{1,4})\b"),
+           "transfer_to_flight_status_agent", "get_flight_status",
+           lambda m, text: {"flight_number": m["flight"] or m["flight2"]}),
+    Intent("airline", re.compile(r"airline (?P<code>[A-Z0-9]{2})\b"), "transfer_to_airline_info_agent",
+           "get_airline_info", lambda m, text: {"iata_code": m["code"]}),
+    Intent("airport", re.compile(r"about (?P<code>[A-Z]{3})\b"), "transfer_to_airport_info_agent",
+           "get_airport_info", lambda m, text: {"iata_code": m["code"]}),
+    Intent("faq", re.compile(r".*", re.S), "transfer_to_faq_agent", "faq_lookup_tool",
+           lambda m, text: {"question": text}),
+]
+
+
+def _text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def plan_reply(messages: List[Dict[str, Any]], tool_names: List[str]) -> Dict[str, Any]:
+    """Decide the next assistant message for a chat-completions request."""
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    text = _text(messages[last_user]) if last_user >= 0 else ""
+    called = [call["function"]["name"] for m in messages[last_user + 1:] for call in m.get("tool_calls") or []]
+    intent, match = next((i, i.pattern.search(text)) for i in INTENTS if i.pattern.search(text))
+
+    if intent.tool not in called:
+        if intent.tool in tool_names:
+            return {"tool": intent.tool, "arguments": intent.args(match, text)}
+        if intent.handoff in tool_names and intent.handoff not in called:
+            return {"tool": intent.handoff, "arguments": {}}
+        if "transfer_to_triage_agent" in tool_names and "transfer_to_triage_agent" not in called:
+            return {"tool": "transfer_to_triage_agent", "arguments": {}}
+    outputs = [_text(m) for m in messages[last_user + 1:] if m.get("role") == "tool"]
+    answer = outputs[-1] if outputs else "Could you clarify? For example, say 'Check AA123 status'."
+    return {"content": f"Here is what I found: {answer}"}
+
+
+# Fake AviationStack data
+
+AIRCRAFT = ["A320", "B737", "A321"]
+STATUSES = ["scheduled", "active", "landed", "delayed"]
+
+
+def fake_flight(flight_iata: str) -> Dict[str, Any]:
+    rng = random.Random(flight_iata)
+    return {
+        "flight": {"iata": flight_iata},
+        "flight_status": rng.choice(STATUSES),
+        "departure": {"airport": "San Francisco International", "scheduled": "2025-01-01T10:00:00+00:00",
+                      "delay": rng.choice([0, 0, 15, 45])},
+        "arrival": {"airport": "John F. Kennedy International"},
+        "aircraft": {"iata": rng.choice(AIRCRAFT)},
+    }
+
+
+def fake_airport(code: str) -> Dict[str, Any]:
+    return {"iata_code": code, "airport_name": f"{code} International", "city_iata_code": code,
+            "country_name": "United States", "timezone": "America/Los_Angeles"}
+
+
+def fake_airline(code: str) -> Dict[str, Any]:
+    return {"iata_code": code, "airline_name": f"{code} Airlines", "country_name": "United States",
+            "fleet_size": "120", "date_founded": "1950"}
+
+
+# HTTP app
+
+
+@dataclass
+class FakeConfig:
+    llm_latency_ms: float = 300.0
+    llm_jitter_ms: float = 100.0
+    token_interval_ms: float = 5.0
+    aviation_latency_ms: float = 80.0
+    aviation_error_rate: float = 0.0
+
+
+def _sleep_ms(base: float, jitter: float = 0.0) -> "asyncio.Future[None]":
+    return asyncio.sleep(max(0.0, base + random.uniform(-jitter, jitter)) / 1000)
+
+
+def create_app(config: FakeConfig) -> Any:
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    counters: Counter = Counter()
+
+    def completion_id() -> str:
+        return f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        tool_names = [tool["function"]["name"] for tool in body.get("tools") or []]
+        reply = plan_reply(body.get("messages", []), tool_names)
+        counters["llm_calls"] += 1
+        counters[f"llm_{'tool:' + reply['tool'] if 'tool' in reply else 'text'}"] += 1
+        model = body.get("model", "fake-model")
+        usage = {"prompt_tokens": len(json.dumps(body)) // 4, "completion_tokens": 20, "total_tokens": 0}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if "tool" in reply:
+            tool_call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                         "function": {"name": reply["tool"], "arguments": json.dumps(reply["arguments"])}}
+            message: Dict[str, Any] = {"role": "assistant", "content": None, "tool_calls": [tool_call]}
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": reply["content"]}
+            finish_reason = "stop"
+
+        if not body.get("stream"):
+            await _sleep_ms(config.llm_latency_ms, config.llm_jitter_ms)
+            return JSONResponse({
+                "id": completion_id(), "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        async def events():
+            cid, created = completion_id(), int(time.time())
+
+            def chunk(delta: Dict[str, Any], finish: Optional[str] = None, **extra: Any) -> str:
+                choices = [{"index": 0, "delta": delta, "finish_reason": finish}] if delta or finish else []
+                payload = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                           "choices": choices, **extra}
+                return f"data: {json.dumps(payload)}\n\n"
+
+            # llm_latency_ms is time to first token; the rest trickles out per token
+            await _sleep_ms(config.llm_latency_ms, config.llm_jitter_ms)
+            if "tool_calls" in message:
+                yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **message["tool_calls"][0]}]})
+            else:
+                for i, word in enumerate(message["content"].split(" ")):
+                    yield chunk({"role": "assistant", "content": word if i == 0 else " " + word})
+                    await _sleep_ms(config.token_interval_ms)
+            yield chunk({}, finish_reason)
+            yield chunk({}, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def aviation(request: Request) -> JSONResponse:
+        endpoint = request.path_params["endpoint"]
+        counters[f"aviation_{endpoint}"] += 1
+        await _sleep_ms(config.aviation_latency_ms, config.aviation_latency_ms / 4)
+        if random.random() < config.aviation_error_rate:
+            counters["aviation_errors"] += 1
+            return JSONResponse({"error": {"code": "rate_limit_reached"}}, status_code=429)
+        params = request.query_params
+        if endpoint == "flights":
+            data = [fake_flight(params.get("flight_iata", "AA123").upper())]
+        elif endpoint == "airports":
+            data = [fake_airport(params.get("iata_code", "SFO").upper())]
+        elif endpoint == "airlines":
+            data = [fake_airline(params.get("iata_code", "AA").upper())]
+        else:
+            return JSONResponse({"error": {"code": "function_access_restricted"}}, status_code=404)
+        return JSONResponse({"data": data})
+
+    async def healthz(request: Request) -> JSONResponse:
+        return JSONResponse({"ok": True})
+
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(dict(counters))
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/aviation/{endpoint}", aviation, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+    ])
+
+
+# In-process Mongo stand-in
+
+
+class FakeCollection:
+    """Just enough of pymongo's Collection for ConversationStore, with fixed write latency.
+
+    Every ``bulk_write`` call's wall time is appended to ``write_latencies_ms``.
+    """
+
+    def __init__(self, latency_ms: float = 5.0):
+        self.latency_ms = latency_ms
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+        self.write_latencies_ms: List[float] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(filter_: Dict[str, Any]) -> Any:
+        return tuple(sorted(filter_.items()))
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> None:
+        start = time.perf_counter()
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            for request in requests:
+                filter_, update = request._filter, request._doc
+                key = self._key(filter_)
+                doc = self.docs.get(key)
+                inserted = doc is None
+                if inserted:
+                    doc = self.docs[key] = dict(filter_)
+                for path, value in update.get("$set", {}).items():
+                    target = doc
+                    *parents, leaf = path.split(".")
+                    for part in parents:
+                        target = target.setdefault(part, {})
+                    target[leaf] = value
+                for field_name, value in update.get("$max", {}).items():
+                    doc[field_name] = max(doc.get(field_name, value), value)
+                if inserted:
+                    doc.update(update.get("$setOnInsert", {}))
+        self.write_latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    _OPERATORS = {"$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b,
+                  "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b}
+
+    @classmethod
+    def _matches(cls, doc: Dict[str, Any], filter_: Dict[str, Any]) -> bool:
+        for name, condition in filter_.items():
+            value = doc.get(name)
+            if isinstance(condition, dict):
+                if value is None or not all(cls._OPERATORS[op](value, bound) for op, bound in condition.items()):
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        keep = [k for k, v in (projection or {}).items() if v == 1 or v is True]
+        return {k: doc[k] for k in keep if k in doc} if keep else dict(doc)
+
+    def find_one(self, filter: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            doc = self.docs.get(self._key(filter))
+            return self._project(doc, projection) if doc is not None else None
+
+    def find(self, filter: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+             sort: Optional[List[Any]] = None, limit: int = 0, **kwargs: Any) -> List[Dict[str, Any]]:
+        with self._lock:
+            docs = [dict(doc) for doc in self.docs.values() if self._matches(doc, filter)]
+        for field_name, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: doc.get(field_name), reverse=direction < 0)
+        if limit:
+            docs = docs[:limit]
+        return [self._project(doc, projection) for doc in docs]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve fake Gemini and AviationStack endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--token-interval-ms", type=float, default=5.0)
+    parser.add_argument("--aviation-latency-ms", type=float, default=80.0)
+    parser.add_argument("--aviation-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeConfig(args.llm_latency_ms, args.llm_jitter_ms, args.token_interval_ms,
+                        args.aviation_latency_ms, args.aviation_error_rate)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
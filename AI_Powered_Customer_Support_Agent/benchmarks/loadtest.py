@@ -0,0 +1,358 @@
+"""Drive the real agent graph against local fakes and report latency percentiles.
+
+    python benchmarks/loadtest.py --conversations 200 --turns 4 --concurrency 50 --output results.json
+    python benchmarks/loadtest.py --compare results.json          # exit 1 on regression
+
+Starts benchmarks/fakes.py in a subprocess (fake Gemini + AviationStack),
+swaps Mongo for an in-process FakeCollection, and runs synthetic
+conversations through ConversationService/TurnRunner exactly as the headless
+service does. Results are written as JSON (schema ``version`` 1) with
+throughput and p50/p95/p99 per turn, per tool and per storage write.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeCollection  # noqa: E402
+
+RESULTS_VERSION = 1
+
+FLIGHTS = ["AA123", "UA456", "DL789", "BA11", "LH400", "AF22", "EK215", "QF1"]
+AIRPORTS = ["SFO", "JFK", "LAX", "LHR", "CDG", "DXB", "SYD", "ORD"]
+AIRLINES = ["AA", "UA", "DL", "BA", "LH", "AF", "EK", "QF"]
+FAQS = ["What's the baggage policy?", "Is there wifi on the plane?", "Can I bring my pet?",
+        "How many seats are on the plane?", "Do you serve meals on board?"]
+NAMES = ["John Smith", "Maria Garcia", "Wei Chen", "Amina Yusuf"]
+
+DEFAULT_MIX = "status=3,faq=3,seat=2,airport=1,airline=1,name=1"
+
+
+def make_message(intent: str, rng: random.Random) -> str:
+    if intent == "status":
+        return f"Check {rng.choice(FLIGHTS)} status"
+    if intent == "seat":
+        return f"Update seat for ABC{rng.randint(100, 999)} to {rng.choice(['1A', '2C', '10F', '15A', '12B'])}"
+    if intent == "airport":
+        return f"Tell me about {rng.choice(AIRPORTS)}"
+    if intent == "airline":
+        return f"Tell me about airline {rng.choice(AIRLINES)}"
+    if intent == "name":
+        return f"My name is {rng.choice(NAMES)}"
+    return rng.choice(FAQS)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": round(rank(0.50), 2),
+        "p95": round(rank(0.95), 2),
+        "p99": round(rank(0.99), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fakes(args: argparse.Namespace) -> "tuple[str, Optional[subprocess.Popen]]":
+    if args.fakes_url:
+        return args.fakes_url.rstrip("/"), None
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fakes.py"), "--port", str(port),
+        "--llm-latency-ms", str(args.llm_latency_ms), "--llm-jitter-ms", str(args.llm_jitter_ms),
+        "--aviation-latency-ms", str(args.aviation_latency_ms),
+        "--aviation-error-rate", str(args.aviation_error_rate),
+    ])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/healthz", timeout=0.5).status_code == 200:
+                return url, process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("fake upstream server did not start within 15 s")
+
+
+def configure_env(args: argparse.Namespace, url: str) -> None:
+    os.environ["AVIATION_BASE_URL"] = f"{url}/aviation/"
+    os.environ.setdefault("AVIATION_API_KEY", "bench")
+    if args.no_cache:
+        for endpoint in ("FLIGHTS", "AIRPORTS", "AIRLINES"):
+            os.environ[f"AVIATION_{endpoint}_TTL"] = "0"
+            os.environ[f"AVIATION_{endpoint}_STALE_TTL"] = "0"
+    if not args.fast_router:
+        os.environ["FAST_ROUTER_ENABLED"] = "false"
+    if not args.prefetch:
+        os.environ["PREFETCH_ENABLED"] = "false"
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    # Unthrottled by default so the numbers measure the code, not the configured quotas.
+    os.environ["GEMINI_RATE_LIMIT"] = str(args.gemini_rate_limit)
+    os.environ["AVIATION_RATE_LIMIT"] = str(args.aviation_rate_limit)
+
+
+class ToolTimer:
+    """RunHooks that record wall time per tool call, keyed by tool name."""
+
+    def __init__(self):
+        from agents import RunHooks
+
+        timer = self
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._started: Dict[Any, List[float]] = defaultdict(list)
+
+        class _Hooks(RunHooks):
+            async def on_tool_start(self, context, agent, tool):
+                timer._started[(id(context), tool.name)].append(time.perf_counter())
+
+            async def on_tool_end(self, context, agent, tool, result):
+                started = timer._started[(id(context), tool.name)]
+                if started:
+                    timer.samples[tool.name].append((time.perf_counter() - started.pop()) * 1000)
+
+        self.hooks = _Hooks()
+
+
+async def run(args: argparse.Namespace, url: str) -> Dict[str, Any]:
+    from agents import AsyncOpenAI
+
+    from airline_agents import build_agents
+    from aviation_client import get_aviation_client
+    from fast_router import get_fast_router
+    from history import HistoryManager
+    from answer_cache import get_answer_cache
+    from prefetch import get_prefetcher
+    from service import ConversationService
+    from storage import ConversationStore
+    from turns import TurnRunner
+    from upstream import scheduled_model, upstream_stats
+
+    model = scheduled_model("fake-model", AsyncOpenAI(api_key="bench", base_url=f"{url}/v1", max_retries=0))
+    conversations_collection = FakeCollection(args.mongo_latency_ms)
+    messages_collection = FakeCollection(args.mongo_latency_ms)
+    store = ConversationStore(conversations_collection, messages_collection,
+                              flush_interval=args.flush_interval)
+    tool_timer = ToolTimer()
+    runner = TurnRunner(build_agents(model), store, HistoryManager.from_env(), get_fast_router(),
+                        hooks=tool_timer.hooks, prefetcher=get_prefetcher(), answer_cache=get_answer_cache())
+    service = ConversationService(runner, max_concurrency=args.concurrency,
+                                  max_conversations=args.conversations)
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    intents, weights = list(mix), list(mix.values())
+    scripts = [[make_message(rng.choices(intents, weights)[0], rng) for _ in range(args.turns)]
+               for _ in range(args.conversations)]
+
+    turn_latencies: List[float] = []
+    ttfts: List[float] = []
+    fast_paths = 0
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def discard(event: Any) -> None:
+        pass
+
+    on_event = discard if args.stream else None
+
+    async def conversation(index: int, messages: List[str]) -> None:
+        nonlocal fast_paths
+        conversation_id = f"bench-{index:06d}"
+        for message in messages:
+            try:
+                result = await service.send(conversation_id, message, on_event=on_event)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                continue
+            turn_latencies.append(result.latency_ms)
+            if result.ttft_ms is not None:
+                ttfts.append(result.ttft_ms)
+            if result.fast_path:
+                fast_paths += 1
+            if args.think_time_ms:
+                await asyncio.sleep(rng.uniform(0, args.think_time_ms) / 1000)
+
+    # A short warm-up keeps connection setup and lazy imports out of the numbers.
+    for message in ("Check AA123 status", "What's the baggage policy?"):
+        await service.send("bench-warmup", message, on_event=on_event)
+    turn_latencies.clear()
+    ttfts.clear()
+    tool_timer.samples.clear()
+    conversations_collection.write_latencies_ms.clear()
+    messages_collection.write_latencies_ms.clear()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(i, messages) for i, messages in enumerate(scripts)))
+    duration = time.perf_counter() - start
+    await store.flush()
+
+    async with httpx.AsyncClient() as client:
+        upstream = (await client.get(f"{url}/stats")).json()
+
+    completed = len(turn_latencies)
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "max_regression", "min_samples")},
+        },
+        "summary": {
+            "turns": completed,
+            "errors": dict(errors),
+            "fast_path_turns": fast_paths,
+            "duration_s": round(duration, 3),
+            "throughput_turns_per_s": round(completed / duration, 2) if duration else 0.0,
+        },
+        "latency_ms": {
+            "turn": percentiles(turn_latencies),
+            "ttft": percentiles(ttfts),
+            "tools": {name: percentiles(samples) for name, samples in sorted(tool_timer.samples.items())},
+            "storage_write": percentiles(conversations_collection.write_latencies_ms
+                                         + messages_collection.write_latencies_ms),
+        },
+        "storage": store.stats(),
+        "aviation_client": get_aviation_client().cache_stats(),
+        "upstream": upstream,
+        "scheduler": upstream_stats(),
+        "prefetch": runner.prefetcher.stats() if runner.prefetcher is not None else None,
+        "answer_cache": runner.answer_cache.stats() if runner.answer_cache is not None else None,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float,
+            min_samples: int) -> List[str]:
+    """Return a line per tracked percentile that got slower by more than ``max_regression``."""
+    regressions = []
+
+    def check(label: str, now: Dict[str, Any], before: Dict[str, Any]) -> None:
+        # Tail percentiles of a handful of samples are mostly noise.
+        if min(now.get("count", 0), before.get("count", 0)) < min_samples:
+            print(f"{label:<32} skipped (fewer than {min_samples} samples)")
+            return
+        for key in ("p50", "p95", "p99"):
+            if key in now and before.get(key):
+                ratio = now[key] / before[key]
+                marker = "REGRESSION" if ratio > 1 + max_regression else "ok"
+                print(f"{label:<32} {key} {before[key]:>9.2f} -> {now[key]:>9.2f} ms ({ratio:5.2f}x) {marker}")
+                if marker != "ok":
+                    regressions.append(f"{label} {key}")
+
+    now, before = current["latency_ms"], baseline["latency_ms"]
+    check("turn", now["turn"], before["turn"])
+    check("storage_write", now["storage_write"], before["storage_write"])
+    for name, stats in now["tools"].items():
+        if name in before["tools"]:
+            check(f"tool:{name}", stats, before["tools"][name])
+    throughput_now = current["summary"]["throughput_turns_per_s"]
+    throughput_before = baseline["summary"]["throughput_turns_per_s"]
+    if throughput_before and throughput_now < throughput_before * (1 - max_regression):
+        regressions.append("throughput")
+    print(f"{'throughput':<32}     {throughput_before:>9.2f} -> {throughput_now:>9.2f} turns/s")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=4, help="turns per conversation")
+    parser.add_argument("--concurrency", type=int, default=50, help="maximum turns in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="intent weights, e.g. status=3,faq=1")
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="random pause between turns")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--aviation-latency-ms", type=float, default=80.0)
+    parser.add_argument("--aviation-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-rate-limit", type=float, default=0.0, help="requests/s, 0 = unlimited")
+    parser.add_argument("--aviation-rate-limit", type=float, default=0.0, help="requests/s, 0 = unlimited")
+    parser.add_argument("--mongo-latency-ms", type=float, default=5.0)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--stream", action="store_true", help="use Runner.run_streamed, as the chat UI does")
+    parser.add_argument("--no-cache", action="store_true", help="disable the AviationStack response cache")
+    parser.add_argument("--fast-router", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--prefetch", action=argparse.BooleanOptionalAction, default=True,
+                        help="speculatively fetch flight data alongside the triage LLM call")
+    parser.add_argument("--answer-cache", action=argparse.BooleanOptionalAction, default=True,
+                        help="reuse answers to near-duplicate questions")
+    parser.add_argument("--fakes-url", help="use an already running benchmarks/fakes.py")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="allowed slowdown ratio")
+    parser.add_argument("--min-samples", type=int, default=30, help="ignore series smaller than this")
+    args = parser.parse_args()
+
+    url, process = start_fakes(args)
+    try:
+        configure_env(args, url)
+        results = asyncio.run(run(args, url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("version") != RESULTS_VERSION:
+            print(f"Baseline has results version {baseline.get('version')}, expected {RESULTS_VERSION}")
+            return 2
+        regressions = compare(results, baseline, args.max_regression, args.min_samples)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
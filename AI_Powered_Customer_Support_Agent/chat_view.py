@@ -0,0 +1,123 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import ConversationStore
+from turns import ConversationState
+
+logger = logging.getLogger(__name__)
+
+ROLE_LABELS = {"user": "You", "assistant": "Assistant"}
+
+
+def format_message(message: Dict[str, Any]) -> str:
+    label = ROLE_LABELS.get(message.get("role", ""), str(message.get("role", "")).title())
+    return f"**{label}:** {message.get('content', '')}"
+
+
+class ChatView:
+    """Which part of a conversation to draw on each rerun, and the cached markdown for the rest.
+
+    Messages are split into fixed pages by seq (``[k * page_size, (k + 1) * page_size)``).
+    Only the live tail, the last one to two pages, is drawn as individual chat
+    messages; while fewer than a page are in memory, the tail is everything in
+    memory and the page it starts in is shown up to there. Older pages stay off screen until the user asks for them with
+    "load earlier messages" (and then stay open as the tail moves on); each is
+    formatted into a single markdown block once and served from ``_pages``
+    afterwards, since history never changes. Pages from before what the
+    session has in memory are read from the store with ``load_page``.
+    Per-rerun work is therefore bounded by the page size and the pages the user
+    opened, not by conversation length.
+
+    main.py draws the pane in an ``st.fragment``, so opening a page reruns only
+    the history. ``sync`` pins the message count at each full run: a fragment
+    rerun then leaves out messages the current turn already drew below the pane.
+    """
+
+    def __init__(self, page_size: int = 20):
+        self.page_size = max(1, page_size)
+        # Oldest history page the user opened; None while only the tail is shown
+        self.first_page: Optional[int] = None
+        self.total: Optional[int] = None
+        # Formatted history keyed by (first seq, end seq); the page before an unaligned tail is partial
+        self._pages: Dict[Tuple[int, int], str] = {}
+
+    @classmethod
+    def from_env(cls) -> "ChatView":
+        return cls(page_size=int(os.getenv("CHAT_PAGE_SIZE", "20")))
+
+    def sync(self, conversation: ConversationState) -> None:
+        """Pin the messages to draw until the next full script run."""
+        self.total = conversation.message_seq_base + len(conversation.messages)
+
+    def _total(self, conversation: ConversationState) -> int:
+        if self.total is None:
+            return conversation.message_seq_base + len(conversation.messages)
+        return self.total
+
+    def tail_start(self, conversation: ConversationState) -> int:
+        """Seq of the first message drawn individually; on a page boundary unless less than a page is loaded."""
+        base = conversation.message_seq_base
+        total = self._total(conversation)
+        if total - base < self.page_size:
+            # E.g. HISTORY_LOAD_LIMIT below CHAT_PAGE_SIZE: draw everything loaded rather than an empty tail
+            return base
+        # The tail must be in memory; a page straddling the loaded range belongs to history
+        in_memory = -(-base // self.page_size) * self.page_size
+        return max(in_memory, (total - self.page_size) // self.page_size * self.page_size)
+
+    def tail(self, conversation: ConversationState) -> List[Dict[str, Any]]:
+        base = conversation.message_seq_base
+        return conversation.messages[self.tail_start(conversation) - base:self._total(conversation) - base]
+
+    def _history_pages(self, conversation: ConversationState) -> int:
+        """Pages before the tail, counting a partial one."""
+        return -(-self.tail_start(conversation) // self.page_size)
+
+    def _first_shown(self, conversation: ConversationState) -> int:
+        last = self._history_pages(conversation)
+        return last if self.first_page is None else min(self.first_page, last)
+
+    def has_earlier(self, conversation: ConversationState) -> bool:
+        return self._first_shown(conversation) > 0
+
+    def show_earlier(self, conversation: ConversationState) -> None:
+        self.first_page = max(0, self._first_shown(conversation) - 1)
+
+    def earlier_pages(self, conversation: ConversationState,
+                      store: ConversationStore) -> List[Tuple[int, int, str]]:
+        """(first seq, end seq, markdown) for the opened pages before the live tail, oldest first."""
+        tail_start = self.tail_start(conversation)
+        pages = []
+        for page in range(self._first_shown(conversation), self._history_pages(conversation)):
+            start, end = page * self.page_size, min((page + 1) * self.page_size, tail_start)
+            text = self._pages.get((start, end))
+            if text is None:
+                text = self._pages[(start, end)] = self._format_page(start, end, conversation, store)
+            pages.append((start, end, text))
+        return pages
+
+    def _format_page(self, start: int, end: int, conversation: ConversationState, store: ConversationStore) -> str:
+        base = conversation.message_seq_base
+        messages: List[Dict[str, Any]] = []
+        if start < base:
+            # Older than what was loaded with the session; read just this page
+            stored_end = min(end, base)
+            messages.extend(store.load_page(conversation.conversation_id, before_seq=stored_end,
+                                            limit=stored_end - start))
+        if end > base:
+            messages.extend(conversation.messages[max(0, start - base):end - base])
+        logger.debug(f"Formatted history {start}-{end} ({len(messages)} messages)")
+        return "\n\n".join(format_message(m) for m in messages)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"page_size": self.page_size, "first_page": self.first_page, "cached_pages": len(self._pages)}
+
+
+def get_chat_view(session_state: Any) -> Optional[ChatView]:
+    """The session's view, or None when CHAT_PAGINATION is off (draw every message each rerun)."""
+    if os.getenv("CHAT_PAGINATION", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if "chat_view" not in session_state:
+        session_state.chat_view = ChatView.from_env()
+    return session_state.chat_view
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAQ_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "faqs.json")
+
+STOPWORDS = frozenset(
+    "a about an and are as at be can do does for from have how i in is it know me my of on or our please "
+    "tell the there to what when where which who why will with you your".split()
+)
+# Words any airline question may contain; they must not decide which entry answers it
+# ("refund policy" is not a question about the baggage policy).
+GENERIC_TERMS = frozenset("airline airplane aircraft flight flying info information plane policy rule".split())
+
+
+@dataclass
+class FaqEntry:
+    question: str
+    answer: str
+    keywords: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FaqMatch:
+    question: str
+    answer: str
+    score: float
+
+
+def tokenize(text: str) -> List[str]:
+    # "Wi-Fi" -> "wifi", "check-in" -> "checkin", plural "bags" -> "bag".
+    tokens = re.findall(r"[a-z0-9]+", re.sub(r"(?<=\w)-(?=\w)", "", text.lower()))
+    return [token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+            for token in tokens if token not in STOPWORDS]
+
+
+def index_terms(text: str) -> List[str]:
+    """Tokens that can decide which FAQ entry matches: ``tokenize`` without GENERIC_TERMS."""
+    return [token for token in tokenize(text) if token not in GENERIC_TERMS]
+
+
+def load_entries(path: str) -> List[FaqEntry]:
+    """Load FAQ entries from JSON (list or {"faqs": [...]}), YAML or Markdown.
+
+    Markdown files use one ``## Question`` heading per entry followed by the
+    answer text; an optional ``Keywords: a, b`` line adds search keywords.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    if path.endswith(".md"):
+        entries = []
+        for block in re.split(r"^##\s+", text, flags=re.M)[1:]:
+            question, _, body = block.partition("\n")
+            keywords: List[str] = []
+            answer_lines = []
+            for line in body.strip().splitlines():
+                if line.lower().startswith("keywords:"):
+                    keywords = [k.strip() for k in line.split(":", 1)[1].split(",") if k.strip()]
+                else:
+                    answer_lines.append(line)
+            entries.append(FaqEntry(question.strip(), "\n".join(answer_lines).strip(), keywords))
+        return entries
+
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError as e:
+            raise RuntimeError("PyYAML is required to load YAML FAQ files (pip install pyyaml)") from e
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("faqs", [])
+    return [FaqEntry(item["question"], item["answer"], list(item.get("keywords", []))) for item in data]
+
+
+class _Index:
+    """Immutable BM25 index: per-term posting arrays with precomputed weights."""
+
+    def __init__(self, entries: List[FaqEntry], k1: float = 1.2, b: float = 0.75):
+        self.entries = entries
+        doc_terms = []
+        for entry in entries:
+            # Questions and keywords describe intent better than answers, so count them twice.
+            tokens = (index_terms(entry.question) * 2 + index_terms(" ".join(entry.keywords)) * 2
+                      + index_terms(entry.answer))
+            doc_terms.append(Counter(tokens))
+        lengths = np.array([sum(terms.values()) for terms in doc_terms], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(entries) else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, terms in enumerate(doc_terms):
+            for term, tf in terms.items():
+                postings[term].append((doc_id, tf))
+
+        n = len(entries)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, docs in postings.items():
+            ids = np.fromiter((doc_id for doc_id, _ in docs), dtype=np.int32, count=len(docs))
+            tf = np.fromiter((count for _, count in docs), dtype=np.float32, count=len(docs))
+            idf = np.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[ids] / avg_length)
+            self.postings[term] = (ids, (idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+        self._scores = np.zeros(n, dtype=np.float32)
+
+    def search(self, query: str, k: int, min_coverage: float = 0.0) -> List[Tuple[int, float]]:
+        """Top ``k`` (entry, score) pairs; entries must contain ``min_coverage`` of the query's terms."""
+        query_terms = set(index_terms(query))
+        terms = [term for term in query_terms if term in self.postings]
+        if not terms:
+            return []
+        scores = np.zeros_like(self._scores)
+        hits = np.zeros(len(scores), dtype=np.int32)
+        for term in terms:
+            ids, weights = self.postings[term]
+            scores[ids] += weights
+            hits[ids] += 1
+        scores[hits < min_coverage * len(query_terms)] = 0.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+class FaqEngine:
+    """BM25 FAQ search over a knowledge file, rebuilt when the file changes.
+
+    A changed file is re-indexed on a background thread while searches keep
+    using the old index; the new one is swapped in atomically, so no caller
+    (the event loop included) ever waits on a rebuild. ``version`` increments
+    on every successful load.
+
+    A match needs a BM25 score of at least ``min_score`` and must contain at
+    least ``min_coverage`` of the question's terms, so one shared word never
+    decides the answer on its own.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 2.0, min_score: float = 0.5,
+                 min_coverage: float = 0.5):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+        self.version = 0
+        self._index: Optional[_Index] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reloader: Optional[threading.Thread] = None
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self._index.entries) if self._index is not None else 0
+
+    def reload(self) -> bool:
+        """Re-index the file if it changed since the last load; blocks while building."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime == self._mtime:
+                    return False
+                start = time.perf_counter()
+                index = _Index(load_entries(self.path))
+            except (OSError, ValueError, KeyError, RuntimeError) as e:
+                logger.error(f"Failed to load FAQ file {self.path}: {str(e)}")
+                return False
+            self._index, self._mtime = index, mtime
+            self.version += 1
+            logger.info(f"Loaded {len(index.entries)} FAQs from {self.path} "
+                        f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return True
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.stat(self.path).st_mtime == self._mtime:
+                return
+        except OSError:
+            return
+        if self._reloader is None or not self._reloader.is_alive():
+            self._reloader = threading.Thread(target=self.reload, name="faq-reload", daemon=True)
+            self._reloader.start()
+
+    def current_version(self) -> int:
+        """``version`` of the index being served; starts a reload if the FAQ file changed."""
+        self._maybe_reload()
+        return self.version
+
+    def search(self, question: str, k: int = 3) -> List[FaqMatch]:
+        """Return up to ``k`` answers ranked by BM25 score, best first."""
+        self._maybe_reload()
+        index = self._index
+        if index is None:
+            return []
+        return [FaqMatch(index.entries[i].question, index.entries[i].answer, score)
+                for i, score in index.search(question, k, self.min_coverage) if score >= self.min_score]
+
+
+_engine: Optional[FaqEngine] = None
+
+
+def get_faq_engine() -> FaqEngine:
+    global _engine
+    if _engine is None:
+        _engine = FaqEngine(
+            os.getenv("FAQ_PATH", DEFAULT_FAQ_PATH),
+            reload_interval=float(os.getenv("FAQ_RELOAD_INTERVAL", "2")),
+            min_score=float(os.getenv("FAQ_MIN_SCORE", "0.5")),
+            min_coverage=float(os.getenv("FAQ_MIN_COVERAGE", "0.5")),
+        )
+    return _engine
@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern
+
+logger = logging.getLogger(__name__)
+
+TRIAGE_AGENT = "Triage Agent"
+FAQ_AGENT = "FAQ Agent"
+SEAT_BOOKING_AGENT = "Seat Booking Agent"
+FLIGHT_STATUS_AGENT = "Flight Status Agent"
+AIRPORT_INFO_AGENT = "Airport Info Agent"
+AIRLINE_INFO_AGENT = "Airline Info Agent"
+
+
+@dataclass
+class Route:
+    agent: str
+    rule: str
+    confidence: float
+    # Set when the turn can be answered by calling a tool directly, with no LLM at all.
+    direct_tool: Optional[str] = None
+    args: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Rule:
+    name: str
+    agent: str
+    pattern: Pattern[str]
+    confidence: float
+    direct_tool: Optional[str] = None
+
+
+# Shapes mirror the validation regexes used by the tools in airline_agents.py.
+FLIGHT = r"(?P<flight_number>\b[A-Za-z]{2}[0-9]{1,4}\b)"
+SEAT = r"(?P<seat>\b[0-9]{1,3}[A-Fa-f]\b)"
+
+# Words that show "my name is ..." / "call me ..." is not followed by a name
+# ("my name is wrong on my booking", "call me back please"). Such turns go to triage.
+NAME_STOPWORDS = (
+    "a about again an and are as asap at back because booking but can could did do does for from get has have "
+    "here how i if in incorrect is it later maybe me misspelled my no not now on or please reservation should "
+    "so soon spelled that the there this ticket to today tomorrow tonight up wrong was we what when why will "
+    "with would you your"
+).split()
+NAME_TOKEN = r"(?!(?:" + "|".join(NAME_STOPWORDS) + r")\b)[A-Za-z]+"
+NAME = r"(?P<name>" + NAME_TOKEN + r"(?:\s+" + NAME_TOKEN + r"){0,3})"
+
+RULES: List[Rule] = [
+    Rule("set_name", TRIAGE_AGENT,
+         re.compile(r"^\s*(?:hi|hello|hey)?[,!.\s]*(?:my name is|call me)\s+" + NAME + r"[.!\s]*$", re.I),
+         0.95, direct_tool="set_passenger_name"),
+    Rule("seat_update", SEAT_BOOKING_AGENT,
+         re.compile(r"\b(?:change|update|switch|move|book|select|pick)\b.*\bseats?\b|\bseats?\b.*" + SEAT, re.I), 0.9),
+    Rule("seat_map", SEAT_BOOKING_AGENT,
+         re.compile(r"\b(?:seat map|available seats|which seats)\b", re.I), 0.85),
+    Rule("flight_status", FLIGHT_STATUS_AGENT,
+         re.compile(r"\b(?:status|delayed?|on time|track|departed|landed|arriv\w*|depart\w*)\b.*" + FLIGHT
+                    + r"|" + FLIGHT.replace("flight_number", "flight_number2")
+                    + r".*\b(?:status|delayed?|on time|departed|landed)\b|^\s*(?:check\s+)?(?:flight\s+)?"
+                    + FLIGHT.replace("flight_number", "flight_number3") + r"\s*\??\s*$", re.I), 0.9),
+    Rule("airport_info", AIRPORT_INFO_AGENT,
+         re.compile(r"\b(?i:airport|tell me about|info(?:rmation)? (?:on|about))\s+(?P<iata_code>[A-Z]{3})\b"
+                    r"|\b(?P<iata_code2>[A-Z]{3})\s+(?i:airport)\b"), 0.9),
+    Rule("airline_info", AIRLINE_INFO_AGENT,
+         re.compile(r"\b(?:tell me about|info(?:rmation)? (?:on|about)|airline)\s+(?:(?P<iata_code>[A-Z0-9]{2})\b"
+                    r"|[A-Za-z ]+\b(?:airlines?|airways)\b)", re.I), 0.85),
+    Rule("faq", FAQ_AGENT,
+         re.compile(r"\b(?:wi-?fi|baggage|luggage|carry-?on|checked bags?|check-in|check in online|online check-?in)\b",
+                    re.I), 0.85),
+]
+
+
+class FastRouter:
+    """Rule-based pre-router that lets confident turns skip the triage LLM hop.
+
+    A message matching rules for exactly one agent is routed there with the
+    rule's confidence; matches for several agents are treated as ambiguous and,
+    like everything below ``threshold``, fall back to the triage agent.
+    """
+
+    def __init__(self, rules: List[Rule] = RULES, threshold: float = 0.8, max_words: int = 25):
+        self.rules = rules
+        self.threshold = threshold
+        self.max_words = max_words
+        self.counts: Counter = Counter()
+
+    def classify(self, text: str) -> Optional[Route]:
+        matches = []
+        for rule in self.rules:
+            match = rule.pattern.search(text)
+            if match:
+                args = {re.sub(r"\d$", "", k): v.strip() for k, v in match.groupdict().items() if v}
+                matches.append(Route(rule.agent, rule.name, rule.confidence, rule.direct_tool, args))
+        if not matches:
+            return None
+
+        best = max(matches, key=lambda route: route.confidence)
+        if len({route.agent for route in matches}) > 1:
+            best.confidence *= 0.5
+        if len(text.split()) > self.max_words:
+            best.confidence *= 0.7
+        return best
+
+    def route(self, text: str) -> Optional[Route]:
+        """Return a confident route, or None to fall back to the triage LLM."""
+        self.counts["turns"] += 1
+        route = self.classify(text)
+        if route is None or route.confidence < self.threshold:
+            self.counts["fallback"] += 1
+            return None
+        self.counts["fast_path"] += 1
+        self.counts[f"rule:{route.rule}"] += 1
+        logger.info(f"Fast path: {route.rule} -> {route.agent} ({route.confidence:.2f})")
+        return route
+
+    def stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = dict(self.counts)
+        if self.counts["turns"]:
+            stats["fast_path_rate"] = self.counts["fast_path"] / self.counts["turns"]
+        return stats
+
+
+_router: Optional[FastRouter] = None
+
+
+def get_fast_router() -> Optional[FastRouter]:
+    """Process-wide router, or None when FAST_ROUTER_ENABLED is off."""
+    global _router
+    if os.getenv("FAST_ROUTER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _router is None:
+        _router = FastRouter(threshold=float(os.getenv("FAST_ROUTER_THRESHOLD", "0.8")))
+    return _router
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of earlier conversation:"
+FACTS_PREFIX = "Known facts:"
+
+
+def estimate_tokens(item: Any) -> int:
+    """Cheap token estimate (~4 characters per token) for an input item."""
+    text = item if isinstance(item, str) else json.dumps(item, default=str)
+    return len(text) // 4 + 1
+
+
+def _is_user_message(item: Dict[str, Any]) -> bool:
+    return item.get("role") == "user" and item.get("type", "message") == "message"
+
+
+def _is_header(item: Dict[str, Any]) -> bool:
+    """The system message ``prepare`` puts in front of the window (summary and/or facts)."""
+    content = item.get("content")
+    return (item.get("role") == "system" and isinstance(content, str)
+            and content.startswith((SUMMARY_PREFIX, FACTS_PREFIX)))
+
+
+def _text_of(item: Dict[str, Any]) -> str:
+    content = item.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def split_turns(items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Group input items into turns, each starting at a user message."""
+    turns: List[List[Dict[str, Any]]] = []
+    for item in items:
+        if _is_header(item):
+            continue
+        if _is_user_message(item) or not turns:
+            turns.append([])
+        turns[-1].append(item)
+    return turns
+
+
+@dataclass
+class HistoryWindow:
+    items: List[Dict[str, Any]]
+    summary: str
+    # Estimated tokens of the full, never-windowed history, and of what is actually sent
+    tokens_before: int
+    tokens_after: int
+    folded_turns: int
+
+
+class HistoryManager:
+    """Keep recent turns verbatim within a token budget and fold older ones into a summary.
+
+    Older turns are folded into a short extractive summary instead of an extra
+    LLM call, and tool outputs outside the latest turn are clipped to
+    ``tool_output_chars``. Facts on ``AirlineAgentContext`` are sent in front of
+    the window on every turn, folded or not, so they are never lost.
+    """
+
+    def __init__(self, token_budget: int = 4000, tool_output_chars: int = 400,
+                 summary_max_chars: int = 2000, min_recent_turns: int = 2):
+        self.token_budget = token_budget
+        self.tool_output_chars = tool_output_chars
+        self.summary_max_chars = summary_max_chars
+        self.min_recent_turns = min_recent_turns
+
+    @classmethod
+    def from_env(cls) -> "HistoryManager":
+        return cls(
+            token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "4000")),
+            tool_output_chars=int(os.getenv("HISTORY_TOOL_OUTPUT_CHARS", "400")),
+            summary_max_chars=int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", "2000")),
+        )
+
+    def _compact(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if item.get("type") == "function_call_output":
+            output = item.get("output")
+            output = output if isinstance(output, str) else json.dumps(output, default=str)
+            if len(output) > self.tool_output_chars:
+                clipped = output[:self.tool_output_chars]
+                return {**item, "output": f"{clipped}… [{len(output)} chars; full result kept in context]"}
+        return item
+
+    def _summarize_turn(self, turn: List[Dict[str, Any]]) -> str:
+        parts = []
+        for item in turn:
+            if _is_user_message(item):
+                parts.append(f"User: {_clip(_text_of(item), 160)}")
+            elif item.get("role") == "assistant":
+                parts.append(f"Assistant: {_clip(_text_of(item), 160)}")
+            elif item.get("type") == "function_call":
+                parts.append(f"[called {item.get('name')}]")
+        return " ".join(parts)
+
+    @staticmethod
+    def _facts(context: Optional[Dict[str, Any]]) -> str:
+        if not context:
+            return ""
+        facts = [f"{key}={json.dumps(value, default=str)}" for key, value in context.items() if value]
+        return f"{FACTS_PREFIX} {', '.join(facts)}." if facts else ""
+
+    def prepare(self, items: List[Dict[str, Any]], summary: str = "",
+                context: Optional[Dict[str, Any]] = None, full_tokens: Optional[int] = None) -> HistoryWindow:
+        """Return the items to send this turn and the updated rolling summary.
+
+        ``items`` must already end with the current user message; callers keep
+        ``window.summary`` and pass it back on the next turn. Once ``items`` is
+        itself an earlier window, pass ``full_tokens``, the estimate for the whole
+        history it was cut from, so ``tokens_before`` reports the real savings.
+        """
+        tokens_before = full_tokens if full_tokens is not None else sum(estimate_tokens(item) for item in items)
+        turns = split_turns(items)
+        turns = [[self._compact(item) for item in turn] for turn in turns[:-1]] + turns[-1:]
+
+        kept: List[List[Dict[str, Any]]] = []
+        used = estimate_tokens(summary) + estimate_tokens(self._facts(context))
+        for index, turn in enumerate(reversed(turns)):
+            cost = sum(estimate_tokens(item) for item in turn)
+            if index >= self.min_recent_turns and used + cost > self.token_budget:
+                break
+            kept.append(turn)
+            used += cost
+        kept.reverse()
+
+        folded = turns[:len(turns) - len(kept)]
+        if folded:
+            summary = " ".join(filter(None, [summary] + [self._summarize_turn(turn) for turn in folded]))
+            if len(summary) > self.summary_max_chars:
+                summary = "…" + summary[-(self.summary_max_chars - 1):]
+
+        window_items = [item for turn in kept for item in turn]
+        header = " ".join(filter(None, [f"{SUMMARY_PREFIX} {summary}" if summary else "", self._facts(context)]))
+        if header:
+            window_items.insert(0, {"role": "system", "content": header})
+        tokens_after = sum(estimate_tokens(item) for item in window_items)
+        if folded or tokens_after != tokens_before:
+            logger.info(f"History: {tokens_before} -> {tokens_after} tokens ({len(folded)} turns folded)")
+        return HistoryWindow(window_items, summary, tokens_before, tokens_after, len(folded))
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Awaitable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Streamlit runs every submit through its own asyncio.run() loop, so anything that
+# must outlive a single turn (connection pools, background refreshes, write-behind
+# flushers) lives on one long-running loop in a daemon thread instead.
+_io_loop: Optional[asyncio.AbstractEventLoop] = None
+_io_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+    asyncio.set_event_loop(loop)
+    loop.call_soon(ready.set)
+    loop.run_forever()
+
+
+def get_io_loop() -> asyncio.AbstractEventLoop:
+    global _io_loop, _io_thread
+    if _io_loop is not None:
+        return _io_loop
+    with _lock:
+        if _io_loop is None:
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            _io_thread = threading.Thread(target=_run_loop, args=(loop, ready), name="io-loop", daemon=True)
+            _io_thread.start()
+            ready.wait()
+            _io_loop = loop
+            logger.info("Started shared I/O event loop")
+    return _io_loop
+
+
+def in_io_loop() -> bool:
+    try:
+        return asyncio.get_running_loop() is _io_loop
+    except RuntimeError:
+        return False
+
+
+def submit(coro: Awaitable[T]) -> "Future[T]":
+    """Schedule a coroutine on the shared I/O loop from any thread."""
+    return asyncio.run_coroutine_threadsafe(coro, get_io_loop())
+
+
+async def run_in_io_loop(coro: Awaitable[T]) -> T:
+    """Await a coroutine on the shared I/O loop without blocking the caller's loop."""
+    if in_io_loop():
+        return await coro
+    return await asyncio.wrap_future(submit(coro))
+
+
+def spawn(coro: Awaitable[Any]) -> "Future[Any]":
+    """Fire-and-forget a coroutine on the shared I/O loop, logging any failure."""
+    future = submit(coro)
+
+    def _log_failure(f: "Future[Any]") -> None:
+        if not f.cancelled() and f.exception() is not None:
+            logger.error(f"Background task failed: {f.exception()}")
+
+    future.add_done_callback(_log_failure)
+    return future
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def approx_size(value: Any) -> int:
+    """Rough in-memory footprint of a JSON-like value, in bytes."""
+    return len(json.dumps(value, default=str)) + 64
+
+
+@dataclass
+class MemoryRecord:
+    context: Dict[str, Any] = field(default_factory=dict)
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    message_sizes: List[int] = field(default_factory=list)
+    # Running total of message_sizes, so size stays O(1) however long the history is
+    messages_size: int = 0
+    context_size: int = 0
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+    last_access: float = field(default_factory=time.monotonic)
+
+    @property
+    def size(self) -> int:
+        return self.context_size + self.messages_size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"context": self.context, "messages": self.messages, "updated_at": self.updated_at.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MemoryRecord":
+        messages = data.get("messages", [])
+        message_sizes = [approx_size(message) for message in messages]
+        return cls(
+            context=data.get("context", {}),
+            messages=messages,
+            message_sizes=message_sizes,
+            messages_size=sum(message_sizes),
+            context_size=approx_size(data.get("context", {})),
+            updated_at=datetime.fromisoformat(data["updated_at"]) if data.get("updated_at") else datetime.utcnow(),
+        )
+
+
+class SpillStore:
+    """File-backed (SQLite) home for conversations evicted from memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (conversation_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def save_many(self, records: Iterable[Tuple[str, MemoryRecord]]) -> None:
+        rows = [(cid, json.dumps(record.to_dict(), default=str)) for cid, record in records]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO conversations VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def pop(self, conversation_id: str) -> Optional[MemoryRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+                self._conn.commit()
+        return MemoryRecord.from_dict(json.loads(row[0])) if row is not None else None
+
+
+class BoundedMemoryStore:
+    """In-memory conversation store bounded by count and approximate bytes.
+
+    Least recently used conversations are evicted first, and anything idle for
+    longer than ``idle_ttl`` seconds is expired. Evicted conversations are
+    handed back to the caller so they can be spilled to a ``SpillStore``; this
+    class itself never does file I/O. Not thread-safe; it is only touched from
+    the shared I/O loop.
+    """
+
+    def __init__(self, max_conversations: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 idle_ttl: float = 3600.0):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._records: "OrderedDict[str, MemoryRecord]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._records
+
+    def get(self, conversation_id: str) -> Optional[MemoryRecord]:
+        record = self._records.get(conversation_id)
+        if record is not None:
+            record.last_access = time.monotonic()
+            self._records.move_to_end(conversation_id)
+        return record
+
+    def admit(self, conversation_id: str, record: MemoryRecord) -> List[Tuple[str, MemoryRecord]]:
+        """Insert a whole record (e.g. one reloaded from the spill store)."""
+        self._discard(conversation_id)
+        record.last_access = time.monotonic()
+        self._records[conversation_id] = record
+        self.bytes += record.size
+        return self._evict(keep=conversation_id)
+
+    def append(self, conversation_id: str, context: Dict[str, Any], messages: List[Dict[str, Any]],
+               first_seq: Optional[int]) -> List[Tuple[str, MemoryRecord]]:
+        """Replace the context and write ``messages`` from ``first_seq`` on; returns evicted records.
+
+        With ``first_seq`` None only the context is replaced.
+        """
+        record = self.get(conversation_id)
+        if record is None:
+            record = MemoryRecord()
+            self._records[conversation_id] = record
+        before = record.size
+
+        record.context = dict(context)
+        record.context_size = approx_size(record.context)
+        if first_seq is not None and first_seq < len(record.messages):
+            # Only a retried turn rewrites messages; the common case truncates nothing.
+            record.messages_size -= sum(record.message_sizes[first_seq:])
+            del record.messages[first_seq:]
+            del record.message_sizes[first_seq:]
+        for message in messages:
+            record.messages.append(dict(message))
+            record.message_sizes.append(approx_size(message))
+            record.messages_size += record.message_sizes[-1]
+        record.updated_at = datetime.utcnow()
+
+        self.bytes += record.size - before
+        return self._evict(keep=conversation_id)
+
+    def _discard(self, conversation_id: str) -> Optional[MemoryRecord]:
+        record = self._records.pop(conversation_id, None)
+        if record is not None:
+            self.bytes -= record.size
+        return record
+
+    def _evict(self, keep: Optional[str] = None) -> List[Tuple[str, MemoryRecord]]:
+        evicted = []
+        now = time.monotonic()
+        # Oldest access first, so expiry can stop at the first live entry.
+        while self._records:
+            cid, record = next(iter(self._records.items()))
+            if cid == keep or now - record.last_access < self.idle_ttl:
+                break
+            evicted.append((cid, self._discard(cid)))
+            self.expirations += 1
+        while len(self._records) > 1 and (len(self._records) > self.max_conversations or self.bytes > self.max_bytes):
+            cid = next(iter(self._records))
+            if cid == keep:
+                self._records.move_to_end(cid)
+                cid = next(iter(self._records))
+            evicted.append((cid, self._discard(cid)))
+            self.evictions += 1
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "conversations": len(self._records),
+            "bytes": self.bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    @classmethod
+    def from_env(cls) -> "BoundedMemoryStore":
+        return cls(
+            max_conversations=int(os.getenv("MEMORY_STORE_MAX_CONVERSATIONS", "1000")),
+            max_bytes=int(os.getenv("MEMORY_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+            idle_ttl=float(os.getenv("MEMORY_STORE_IDLE_TTL", "3600")),
+        )
@@ -0,0 +1,95 @@
+"""One-off migration from embedded ``messages`` arrays to the append-only message log.
+
+For every document in ``conversations`` that still carries a ``messages`` array,
+the messages are copied into ``conversation_messages`` as one document per
+``(conversation_id, seq)``, ``message_count`` is set and the array is removed.
+Safe to re-run: message inserts are idempotent upserts and migrated documents
+no longer match the query.
+
+    python migrate_conversations.py [--dry-run] [--batch-size 500]
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.server_api import ServerApi
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_document(conversations, messages, doc, batch_size: int = 500) -> int:
+    """Copy one document's embedded messages into the log, then drop the array; returns the message count.
+
+    ``doc`` needs ``_id``, ``conversation_id``, ``messages`` and ``updated_at``.
+    """
+    cid = doc["conversation_id"]
+    history = doc.get("messages") or []
+    for start in range(0, len(history), batch_size):
+        operations = [
+            UpdateOne(
+                {"conversation_id": cid, "seq": seq},
+                {"$setOnInsert": {
+                    "conversation_id": cid,
+                    "seq": seq,
+                    "role": message.get("role"),
+                    "content": message.get("content"),
+                    "created_at": doc.get("updated_at"),
+                }},
+                upsert=True,
+            )
+            for seq, message in enumerate(history[start:start + batch_size], start=start)
+        ]
+        messages.bulk_write(operations, ordered=False)
+    # $max, not $set: new messages may already have been counted after the embedded ones
+    conversations.update_one(
+        {"_id": doc["_id"]},
+        {"$max": {"message_count": len(history)}, "$unset": {"messages": ""}},
+    )
+    return len(history)
+
+
+def migrate(db, batch_size: int = 500, dry_run: bool = False) -> int:
+    conversations = db["conversations"]
+    messages = db["conversation_messages"]
+    if not dry_run:
+        messages.create_index([("conversation_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+
+    migrated = 0
+    cursor = conversations.find(
+        {"messages": {"$exists": True}},
+        {"conversation_id": 1, "messages": 1, "updated_at": 1},
+        batch_size=batch_size,
+    )
+    for doc in cursor:
+        if dry_run:
+            logger.info(f"Would migrate {len(doc.get('messages') or [])} messages for {doc['conversation_id']}")
+            migrated += 1
+            continue
+
+        migrate_document(conversations, messages, doc, batch_size)
+        migrated += 1
+        if migrated % 100 == 0:
+            logger.info(f"Migrated {migrated} conversations")
+    return migrated
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1'))
+    count = migrate(client["airline_customer_service"], batch_size=args.batch_size, dry_run=args.dry_run)
+    logger.info(f"{'Would migrate' if args.dry_run else 'Migrated'} {count} conversations")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
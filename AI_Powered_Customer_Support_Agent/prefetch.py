@@ -0,0 +1,115 @@
+import logging
+import os
+import re
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from airline_agents import AirlineAgentContext, start_fetch
+from reference_index import get_reference_index
+from response_cache import cache_key
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Same shapes as the tools' validation regexes, as whole tokens in free text.
+# Reference codes must be upper case and next to the word "airport"/"airline",
+# otherwise every three-letter word would cost an AviationStack call.
+FLIGHT_TOKEN = re.compile(r"\b[A-Za-z]{2}[0-9]{1,4}\b")
+AIRPORT_TOKEN = re.compile(r"\b[A-Z]{3}\b")
+AIRLINE_TOKEN = re.compile(r"\b[A-Z0-9]{2}\b")
+AIRPORT_HINT = re.compile(r"\bairports?\b", re.I)
+AIRLINE_HINT = re.compile(r"\b(?:airlines?|airways|carrier)\b", re.I)
+
+
+class Prefetcher:
+    """Start the AviationStack fetches a turn will probably need before the LLM asks for them.
+
+    Fetches go into the turn's memo (``AirlineAgentContext._fetch_memo``), so
+    when ``get_flight_status`` & co. run after the triage and handoff LLM calls
+    they await a request that is already in flight or done. Whatever no tool
+    consumed is cancelled when the turn ends.
+    """
+
+    def __init__(self, max_per_endpoint: int = 2):
+        self.max_per_endpoint = max_per_endpoint
+        self.started = 0
+        self.hits = 0
+        self.cancelled = 0
+        self.unused = 0
+
+    def candidates(self, text: str) -> List[Tuple[str, Dict[str, str]]]:
+        found: Dict[Hashable, Tuple[str, Dict[str, str]]] = {}
+
+        def add(endpoint: str, params: Dict[str, str], limit: List[int]) -> None:
+            key = cache_key(endpoint, params)
+            if limit[0] < self.max_per_endpoint and key not in found:
+                found[key] = (endpoint, params)
+                limit[0] += 1
+
+        flights = [0]
+        for match in FLIGHT_TOKEN.finditer(text):
+            add("flights", {"flight_iata": match.group()}, flights)
+        for kind, token, hint in (("airports", AIRPORT_TOKEN, AIRPORT_HINT), ("airlines", AIRLINE_TOKEN, AIRLINE_HINT)):
+            if not hint.search(text):
+                continue
+            index = get_reference_index(kind)
+            codes = [0]
+            for match in token.finditer(text):
+                # Codes in the local index never reach the API, so there is nothing to warm.
+                if index is None or index.get(match.group()) is None:
+                    add(kind, {"iata_code": match.group()}, codes)
+        return list(found.values())
+
+    def start(self, context: AirlineAgentContext, text: str) -> Set[Hashable]:
+        """Kick off fetches for ``text`` on the running loop; call ``finish`` when the turn ends."""
+        started: Set[Hashable] = set()
+        for endpoint, params in self.candidates(text):
+            key = cache_key(endpoint, params)
+            if key in context._fetch_memo:
+                continue
+            start_fetch(context, endpoint, params)
+            context._prefetched.add(key)
+            started.add(key)
+        if started:
+            logger.debug(f"Prefetching {sorted(map(str, started))}")
+        self.started += len(started)
+        return started
+
+    def finish(self, context: AirlineAgentContext, started: Set[Hashable]) -> None:
+        for key in started:
+            endpoint = key[0] if isinstance(key, tuple) else str(key)
+            if key not in context._prefetched:
+                self.hits += 1
+                outcome = "hit"
+            else:
+                task = context._fetch_memo.get(key)
+                if task is not None and not task.done():
+                    task.cancel()
+                    self.cancelled += 1
+                    outcome = "cancelled"
+                else:
+                    self.unused += 1
+                    outcome = "unused"
+            get_telemetry().observe_prefetch(endpoint, outcome)
+        context._prefetched.difference_update(started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "cancelled": self.cancelled,
+            "unused": self.unused,
+            "hit_rate": round(self.hits / self.started, 3) if self.started else 0.0,
+        }
+
+
+_prefetcher: Optional[Prefetcher] = None
+
+
+def get_prefetcher() -> Optional[Prefetcher]:
+    """Process-wide prefetcher, or None when PREFETCH_ENABLED is off."""
+    global _prefetcher
+    if os.getenv("PREFETCH_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _prefetcher is None:
+        _prefetcher = Prefetcher(max_per_endpoint=int(os.getenv("PREFETCH_MAX_PER_ENDPOINT", "2")))
+    return _prefetcher
@@ -0,0 +1,263 @@
+"""Memory-mapped local index of AviationStack airport and airline reference data.
+
+Build an index from an AviationStack JSON dump, a JSONL file or a CSV file::
+
+    python reference_index.py build airports airports.json data/airports.idx
+    python reference_index.py build airlines airlines.csv data/airlines.idx
+    python reference_index.py lookup data/airlines.idx "American Airlines"
+
+File layout (little-endian)::
+
+    header   magic(8) code_count(u32) name_count(u32) codes_off(u64) names_off(u64)
+             strings_off(u64) payload_off(u64)
+    codes    code_count x [code(4s) payload_off(u32) payload_len(u32)]   sorted by code
+    names    name_count x [str_off(u32) str_len(u16) pad(u16) code(4s)]  sorted by name
+    strings  normalized names, UTF-8
+    payload  one compact JSON object per record
+"""
+import argparse
+import bisect
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AREFIDX1"
+HEADER = struct.Struct("<8sIIQQQQ")
+CODE_ENTRY = struct.Struct("<4sII")
+NAME_ENTRY = struct.Struct("<IHH4s")
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+NAME_FIELDS = {
+    "airports": ("airport_name", "name"),
+    "airlines": ("airline_name", "name"),
+}
+
+
+# What the codes column can hold: IATA airline (2) and airport (3) codes, at most 4 characters
+CODE_PATTERN = re.compile(r"[A-Za-z0-9]{1,4}")
+
+
+def normalize_name(name: str) -> str:
+    return re.sub(r"[^A-Z0-9]+", " ", name.upper()).strip()
+
+
+def _encode_code(code: str) -> bytes:
+    return code.strip().upper().encode("ascii").ljust(4, b" ")
+
+
+def _decode_code(raw: bytes) -> str:
+    return raw.decode("ascii").rstrip()
+
+
+def load_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield records from an AviationStack JSON dump, JSONL or CSV file."""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        yield from data.get("data", []) if isinstance(data, dict) else data
+
+
+def build_index(kind: str, records: Iterable[Dict[str, Any]], output_path: str) -> int:
+    if kind not in NAME_FIELDS:
+        raise ValueError(f"Unknown reference kind: {kind}")
+
+    by_code: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        code = (record.get("iata_code") or "").strip().upper()
+        if not code or len(code) > 4 or not code.isascii():
+            continue
+        by_code.setdefault(code, {k: v for k, v in record.items() if v not in (None, "")})
+
+    codes = sorted(by_code)
+    payloads = [json.dumps(by_code[code], separators=(",", ":")).encode("utf-8") for code in codes]
+
+    names = []
+    for code in codes:
+        for field in NAME_FIELDS[kind]:
+            if by_code[code].get(field):
+                names.append((normalize_name(str(by_code[code][field])).encode("utf-8"), code))
+                break
+    names.sort()
+
+    codes_off = HEADER.size
+    names_off = codes_off + CODE_ENTRY.size * len(codes)
+    strings_off = names_off + NAME_ENTRY.size * len(names)
+    strings = b"".join(name for name, _ in names)
+    payload_off = strings_off + len(strings)
+
+    tmp_path = f"{output_path}.tmp"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(codes), len(names), codes_off, names_off, strings_off, payload_off))
+        offset = 0
+        for code, payload in zip(codes, payloads):
+            f.write(CODE_ENTRY.pack(_encode_code(code), offset, len(payload)))
+            offset += len(payload)
+        str_offset = 0
+        for name, code in names:
+            f.write(NAME_ENTRY.pack(str_offset, len(name), 0, _encode_code(code)))
+            str_offset += len(name)
+        f.write(strings)
+        for payload in payloads:
+            f.write(payload)
+    os.replace(tmp_path, output_path)
+    return len(codes)
+
+
+class _Column(Sequence):
+    """Read-only view over one key of a sorted fixed-width table, for bisect."""
+
+    def __init__(self, length: int, key_at):
+        self._length = length
+        self._key_at = key_at
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        return self._key_at(index)
+
+
+class ReferenceIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.code_count, self.name_count, self._codes_off, self._names_off,
+         self._strings_off, self._payload_off) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a reference index")
+        self._codes = _Column(self.code_count, self._code_at)
+        self._names = _Column(self.name_count, self._name_at)
+        # Repeat lookups for hot codes skip even the JSON decode.
+        self.get = lru_cache(maxsize=4096)(self._get)
+
+    def __len__(self) -> int:
+        return self.code_count
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _code_at(self, index: int) -> bytes:
+        start = self._codes_off + index * CODE_ENTRY.size
+        return self._mm[start:start + 4]
+
+    def _name_entry(self, index: int):
+        return NAME_ENTRY.unpack_from(self._mm, self._names_off + index * NAME_ENTRY.size)
+
+    def _name_at(self, index: int) -> bytes:
+        str_off, str_len, _, _ = self._name_entry(index)
+        start = self._strings_off + str_off
+        return self._mm[start:start + str_len]
+
+    def _payload(self, index: int) -> Dict[str, Any]:
+        _, offset, length = CODE_ENTRY.unpack_from(self._mm, self._codes_off + index * CODE_ENTRY.size)
+        start = self._payload_off + offset
+        return json.loads(self._mm[start:start + length])
+
+    def _get(self, code: str) -> Optional[Dict[str, Any]]:
+        try:
+            key = _encode_code(code)
+        except UnicodeEncodeError:
+            return None
+        index = bisect.bisect_left(self._codes, key)
+        if index < self.code_count and self._code_at(index) == key:
+            return self._payload(index)
+        return None
+
+    def search_name(self, query: str, limit: int = 20) -> List[str]:
+        """Return codes whose normalized name starts with the normalized query."""
+        key = normalize_name(query).encode("utf-8")
+        if not key:
+            return []
+        results = []
+        index = bisect.bisect_left(self._names, key)
+        while index < self.name_count and len(results) < limit:
+            if not self._name_at(index).startswith(key):
+                break
+            results.append(_decode_code(self._name_entry(index)[3]))
+            index += 1
+        return results
+
+    def resolve(self, query: str) -> Optional[str]:
+        """Resolve a code or a (prefix of a) name to a single IATA code."""
+        # Only code-shaped queries go through the cached get, so free-text names can't evict hot codes
+        code = query.strip()
+        if CODE_PATTERN.fullmatch(code) and self.get(code) is not None:
+            return code.upper()
+        key = normalize_name(query).encode("utf-8")
+        matches = self.search_name(query, limit=2)
+        if not matches:
+            return None
+        index = bisect.bisect_left(self._names, key)
+        if index < self.name_count and self._name_at(index) == key:
+            return _decode_code(self._name_entry(index)[3])
+        return matches[0] if len(matches) == 1 else None
+
+
+_indexes: Dict[str, Optional[ReferenceIndex]] = {}
+
+
+def get_reference_index(kind: str) -> Optional[ReferenceIndex]:
+    """Return the memory-mapped index for ``airports`` or ``airlines``, if built."""
+    if kind not in _indexes:
+        path = os.getenv(f"{kind.upper()}_INDEX_PATH", os.path.join(DEFAULT_INDEX_DIR, f"{kind}.idx"))
+        index = None
+        if os.path.exists(path):
+            try:
+                index = ReferenceIndex(path)
+                logger.info(f"Loaded {len(index)} {kind} from {path}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load reference index {path}: {str(e)}")
+        _indexes[kind] = index
+    return _indexes[kind]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query airport/airline reference indexes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("kind", choices=sorted(NAME_FIELDS))
+    build.add_argument("source", help="AviationStack JSON dump, .jsonl or .csv file")
+    build.add_argument("output")
+    lookup = sub.add_parser("lookup")
+    lookup.add_argument("index")
+    lookup.add_argument("query")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_index(args.kind, load_records(args.source), args.output)
+        print(f"Wrote {count} {args.kind} to {args.output}")
+        return 0
+
+    index = ReferenceIndex(args.index)
+    code = index.resolve(args.query)
+    if code is None:
+        print(f"No match for {args.query!r}; name prefix matches: {index.search_name(args.query)}")
+        return 1
+    print(json.dumps({"code": code, **index.get(code)}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""Replay recorded conversations through the agent graph and write per-turn results as JSONL.
+
+    python replay.py --source mongo --limit 5000 --output replay.jsonl
+    python replay.py --source export.jsonl --concurrency 32 --processes 4 --output replay.jsonl
+
+Each recorded conversation is replayed from the triage agent with a fresh
+context: its user messages are sent in order and every turn's replies,
+final agent, fast path, token counts and timings are written as one JSON
+line, next to the originally recorded reply (``expected``) for diffing.
+Conversations and seat reservations are kept in memory for the replay, so
+replayed seat changes never touch real bookings and nothing is written to
+the source database (AviationStack and Gemini are still called for real).
+
+A JSONL source holds one conversation per line, either
+``{"conversation_id": ..., "messages": [{"role": ..., "content": ...}, ...]}``
+(a ``turns`` list of strings also works) or a single turn
+``{"conversation_id": ..., "message": ...}``; lines with a ``request_id`` and
+``body`` are treated as single turns too. Sources are streamed, and results are
+written as they complete, so memory stays flat however long the run is.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+DATABASE = "airline_customer_service"
+
+
+@dataclass
+class RecordedConversation:
+    conversation_id: str
+    turns: List[str]
+    # Assistant reply that originally followed each user turn, if recorded
+    expected: List[Optional[str]] = field(default_factory=list)
+
+
+def from_messages(conversation_id: str, messages: List[Any]) -> RecordedConversation:
+    conversation = RecordedConversation(conversation_id, [])
+    for message in messages:
+        if isinstance(message, str):
+            message = {"role": "user", "content": message}
+        if message.get("role") == "user":
+            conversation.turns.append(str(message.get("content", "")))
+            conversation.expected.append(None)
+        elif message.get("role") == "assistant" and conversation.expected and conversation.expected[-1] is None:
+            conversation.expected[-1] = message.get("content")
+    return conversation
+
+
+def iter_jsonl(path: str) -> Iterator[RecordedConversation]:
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping line {line_no} of {path}: {str(e)}")
+                continue
+            conversation_id = str(record.get("conversation_id") or record.get("request_id") or f"line-{line_no}")
+            messages = record.get("messages") or record.get("turns")
+            if messages is None:
+                text = record.get("message") or record.get("body")
+                messages = [text] if text else []
+            conversation = from_messages(conversation_id, messages)
+            if conversation.turns:
+                yield conversation
+
+
+def iter_mongo(db: Any, limit: int = 0, batch_size: int = 200) -> Iterator[RecordedConversation]:
+    """Stream conversations, reading legacy embedded arrays or the per-message log."""
+    cursor = db["conversations"].find({}, {"conversation_id": 1, "messages": 1}, batch_size=batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+    for doc in cursor:
+        conversation_id = doc["conversation_id"]
+        messages = doc.get("messages")
+        if messages is None:
+            messages = list(db["conversation_messages"].find(
+                {"conversation_id": conversation_id}, {"_id": 0, "role": 1, "content": 1}).sort("seq", 1))
+        conversation = from_messages(conversation_id, messages)
+        if conversation.turns:
+            yield conversation
+
+
+def open_source(args: argparse.Namespace) -> Iterator[RecordedConversation]:
+    if args.source != "mongo":
+        conversations = iter_jsonl(args.source)
+        if args.limit:
+            conversations = (c for i, c in zip(range(args.limit), conversations))
+        return conversations
+
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+
+    client = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1'))
+    return iter_mongo(client[DATABASE], limit=args.limit)
+
+
+def build_runner(args: argparse.Namespace) -> Any:
+    """A TurnRunner over the production agent graph, with conversations and seats kept in memory."""
+    import resources
+    from answer_cache import get_answer_cache
+    from fast_router import get_fast_router
+    from history import HistoryManager
+    from prefetch import get_prefetcher
+    from seat_inventory import SeatInventory
+    from storage import ConversationStore
+    from turns import TurnRunner
+
+    # update_seat would otherwise reserve seats in the real seat_inventory collection
+    resources.use_seat_inventory(SeatInventory(None))
+
+    return TurnRunner(
+        resources.get_agents(),
+        ConversationStore(None, None),
+        HistoryManager.from_env(),
+        get_fast_router() if args.fast_router else None,
+        prefetcher=get_prefetcher() if args.prefetch else None,
+        # Off by default: cached answers would hide the effect of prompt changes
+        answer_cache=get_answer_cache() if args.answer_cache else None,
+    )
+
+
+class Summary:
+    def __init__(self):
+        self.conversations = 0
+        self.turns = 0
+        self.errors = 0
+        self.skipped_turns = 0
+        self.latencies: List[float] = []
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        self.conversations += other["conversations"]
+        self.turns += other["turns"]
+        self.errors += other["errors"]
+        self.skipped_turns += other["skipped_turns"]
+        self.latencies.extend(other["latencies"])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"conversations": self.conversations, "turns": self.turns, "errors": self.errors,
+                "skipped_turns": self.skipped_turns, "latencies": self.latencies}
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def rank(p: float) -> float:
+            return round(ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))], 1) if ordered else 0.0
+
+        return {
+            "conversations": self.conversations,
+            "turns": self.turns,
+            "errors": self.errors,
+            "skipped_turns": self.skipped_turns,
+            "duration_s": round(duration, 2),
+            "turns_per_s": round(self.turns / duration, 2) if duration else 0.0,
+            "latency_ms": {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99)},
+        }
+
+
+async def replay_one(runner: Any, conversation: RecordedConversation, out: TextIO, summary: Summary,
+                     stream: bool) -> None:
+    from turns import ConversationState
+
+    async def discard(event: Any) -> None:
+        pass
+
+    state = ConversationState(f"replay-{conversation.conversation_id}")
+    for index, (message, expected) in enumerate(zip(conversation.turns, conversation.expected)):
+        record: Dict[str, Any] = {"conversation_id": conversation.conversation_id, "turn": index,
+                                  "input": message, "expected": expected}
+        try:
+            result = await runner.run_turn(state, message, on_event=discard if stream else None)
+        except Exception as e:
+            # The conversation's state is now unreliable; record the failure and move on
+            record["error"] = f"{type(e).__name__}: {str(e)}"
+            out.write(json.dumps(record) + "\n")
+            summary.errors += 1
+            summary.skipped_turns += len(conversation.turns) - index - 1
+            break
+        record.update(
+            replies=result.replies,
+            agent=result.agent,
+            fast_path=result.fast_path,
+            latency_ms=round(result.latency_ms, 1),
+            ttft_ms=round(result.ttft_ms, 1) if result.ttft_ms is not None else None,
+            tokens_before=result.tokens_before,
+            tokens_after=result.tokens_after,
+        )
+        out.write(json.dumps(record) + "\n")
+        summary.turns += 1
+        summary.latencies.append(result.latency_ms)
+    summary.conversations += 1
+
+
+async def replay(args: argparse.Namespace, next_conversation: Any, output: str) -> Summary:
+    """Replay conversations from ``next_conversation()`` (None when exhausted) with bounded concurrency."""
+    runner = build_runner(args)
+    summary = Summary()
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+    # Line-buffered: every turn's line is on disk as soon as it is written
+    with open(output, "a", encoding="utf-8", buffering=1) as out:
+        while True:
+            # Take a slot before pulling the next conversation, so at most
+            # ``concurrency`` conversations are ever held in memory.
+            await slots.acquire()
+            conversation = await next_conversation()
+            if conversation is None:
+                slots.release()
+                break
+
+            async def run(conversation: RecordedConversation = conversation) -> None:
+                try:
+                    await replay_one(runner, conversation, out, summary, args.stream)
+                finally:
+                    slots.release()
+                    if summary.conversations % 100 == 0:
+                        logger.info(f"{os.getpid()}: {summary.conversations} conversations, {summary.turns} turns")
+
+            task = asyncio.create_task(run())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    await runner.store.flush()
+    return summary
+
+
+def worker_main(args: argparse.Namespace, worker: int, queue: "multiprocessing.Queue[Any]",
+                results: "multiprocessing.Queue[Any]") -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    async def next_conversation() -> Optional[RecordedConversation]:
+        return await asyncio.get_running_loop().run_in_executor(None, queue.get)
+
+    summary = asyncio.run(replay(args, next_conversation, f"{args.output}.part{worker}"))
+    results.put(summary.as_dict())
+
+
+def share_rate_limits(processes: int) -> None:
+    """Upstream token buckets are per process; split the configured quota across workers."""
+    from upstream import UPSTREAMS
+
+    for prefix in UPSTREAMS.values():
+        for name, default in ((f"{prefix}_RATE_LIMIT", "5"), (f"{prefix}_BURST", "10")):
+            os.environ[name] = str(float(os.getenv(name, default)) / processes)
+
+
+def run_pool(args: argparse.Namespace, conversations: Iterator[RecordedConversation]) -> Summary:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue(maxsize=args.processes * args.concurrency)
+    results = context.Queue()
+    share_rate_limits(args.processes)
+    workers = [context.Process(target=worker_main, args=(args, i, queue, results))
+               for i in range(args.processes)]
+    for process in workers:
+        process.start()
+    for conversation in conversations:
+        queue.put(conversation)
+    for _ in workers:
+        queue.put(None)
+
+    summary = Summary()
+    for _ in workers:
+        summary.merge(results.get())
+    for process in workers:
+        process.join()
+
+    # Stitch the per-worker shards into the requested output file
+    with open(args.output, "a", encoding="utf-8") as out:
+        for i in range(args.processes):
+            shard = f"{args.output}.part{i}"
+            with open(shard, encoding="utf-8") as f:
+                for line in f:
+                    out.write(line)
+            os.remove(shard)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", required=True, help="'mongo' or a JSONL file of recorded conversations")
+    parser.add_argument("--output", required=True, help="JSONL file to append per-turn results to")
+    parser.add_argument("--limit", type=int, default=0, help="replay at most this many conversations")
+    parser.add_argument("--concurrency", type=int, default=16, help="conversations in flight per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", help="use Runner.run_streamed and record TTFT")
+    parser.add_argument("--fast-router", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--prefetch", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--answer-cache", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    start = time.perf_counter()
+    conversations = open_source(args)
+    if args.processes > 1:
+        summary = run_pool(args, conversations)
+    else:
+        async def next_conversation() -> Optional[RecordedConversation]:
+            # Mongo cursors block; keep them off the event loop
+            return await asyncio.to_thread(next, conversations, None)
+
+        summary = asyncio.run(replay(args, next_conversation, args.output))
+    print(json.dumps(summary.report(time.perf_counter() - start), indent=2))
+    return 1 if summary.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
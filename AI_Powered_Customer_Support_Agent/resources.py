@@ -0,0 +1,203 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from pymongo import MongoClient
+from pymongo.server_api import ServerApi
+
+from io_loop import spawn
+from seat_inventory import SeatInventory
+from storage import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+# Process-wide singletons shared by every Streamlit session and rerun. Streamlit
+# re-executes main.py on each interaction but imported modules stay cached, so
+# anything built here is paid for once per process, on first use.
+_lock = threading.RLock()
+_mongo_client: Optional[MongoClient] = None
+_store: Optional[ConversationStore] = None
+_model: Any = None
+_agents: Optional[Dict[str, Any]] = None
+_turn_runner: Any = None
+_seat_inventory: Optional[SeatInventory] = None
+
+# None until the background ping finishes.
+mongo_healthy: Optional[bool] = None
+mongo_error: Optional[str] = None
+
+startup_timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+
+def startup_report() -> str:
+    lines = [f"{name:<28} {seconds * 1000:8.1f} ms" for name, seconds in
+             sorted(startup_timings.items(), key=lambda item: -item[1])]
+    return "\n".join(lines)
+
+
+def get_mongo_client() -> Optional[MongoClient]:
+    """Build the Mongo client without touching the network; connections open lazily."""
+    global _mongo_client
+    with _lock:
+        if _mongo_client is None and os.getenv("MONGODB_URI"):
+            with timed("mongo_client"):
+                _mongo_client = MongoClient(
+                    os.getenv("MONGODB_URI"),
+                    server_api=ServerApi('1'),
+                    serverSelectionTimeoutMS=10000,
+                    connectTimeoutMS=20000,
+                    socketTimeoutMS=20000,
+                    tls=True,
+                    tlsAllowInvalidCertificates=False,
+                    connect=False,
+                )
+    return _mongo_client
+
+
+async def _check_mongo(client: MongoClient, store: ConversationStore) -> None:
+    global mongo_healthy, mongo_error
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(client.admin.command, 'ping')
+        mongo_healthy = True
+        logger.info("Connected to MongoDB")
+        spawn(_maintain_conversations(store))
+    except Exception as e:
+        mongo_healthy = False
+        mongo_error = str(e)
+        logger.error(f"Failed to connect to MongoDB: {mongo_error}. Using in-memory storage.")
+        await store.use_memory_fallback()
+        if _seat_inventory is not None:
+            _seat_inventory.use_memory_fallback()
+    finally:
+        startup_timings["mongo_ping (background)"] = time.perf_counter() - start
+
+
+async def _maintain_conversations(store: ConversationStore) -> None:
+    """Build indexes once, then archive and expire idle conversations periodically (if enabled)."""
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(store.ensure_indexes)
+    except Exception as e:
+        logger.error(f"Failed to create conversation indexes: {str(e)}")
+    startup_timings["conversation_indexes (background)"] = time.perf_counter() - start
+    interval = float(os.getenv("CONVERSATION_ARCHIVE_INTERVAL_HOURS", "6")) * 3600
+    while store.use_mongodb and (store.archive_after_days > 0 or store.ttl_days > 0):
+        try:
+            await asyncio.to_thread(store.archive_stale)
+            await asyncio.to_thread(store.expire_stale)
+        except Exception as e:
+            logger.error(f"Conversation retention run failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+def get_conversation_store() -> ConversationStore:
+    global _store, mongo_healthy
+    with _lock:
+        if _store is None:
+            client = get_mongo_client()
+            with timed("conversation_store"):
+                if client is not None:
+                    db = client["airline_customer_service"]
+                    _store = ConversationStore.from_env(db["conversations"], db["conversation_messages"])
+                    spawn(_check_mongo(client, _store))
+                else:
+                    mongo_healthy = False
+                    _store = ConversationStore.from_env(None, None)
+            atexit.register(_store.flush_blocking)
+    return _store
+
+
+async def _ensure_seat_indexes(inventory: SeatInventory) -> None:
+    await asyncio.to_thread(inventory.ensure_indexes)
+
+
+def get_seat_inventory() -> SeatInventory:
+    global _seat_inventory
+    with _lock:
+        if _seat_inventory is None:
+            client = get_mongo_client()
+            cache_ttl = float(os.getenv("SEAT_CACHE_TTL", "5"))
+            max_flights = int(os.getenv("SEAT_CACHE_MAX_FLIGHTS", "1000"))
+            if client is not None and mongo_healthy is not False:
+                _seat_inventory = SeatInventory(client["airline_customer_service"]["seat_inventory"], cache_ttl,
+                                                max_flights=max_flights)
+                spawn(_ensure_seat_indexes(_seat_inventory))
+            else:
+                _seat_inventory = SeatInventory(None, cache_ttl, max_flights=max_flights)
+    return _seat_inventory
+
+
+def use_seat_inventory(inventory: SeatInventory) -> None:
+    """Replace the process-wide seat inventory, e.g. with an in-memory one for replays."""
+    global _seat_inventory
+    with _lock:
+        _seat_inventory = inventory
+
+
+def get_model() -> Any:
+    global _model
+    with _lock:
+        if _model is None:
+            from agents import AsyncOpenAI
+
+            from upstream import scheduled_model
+
+            with timed("gemini_provider"):
+                # Retries happen in the shared upstream scheduler, not per client.
+                provider = AsyncOpenAI(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    base_url=os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"),
+                    max_retries=0,
+                )
+                _model = scheduled_model(os.getenv("GEMINI_MODEL", "gemini-2.5-flash"), provider)
+    return _model
+
+
+def get_agents() -> Dict[str, Any]:
+    """Return the agent graph keyed by agent name, building it once per process."""
+    global _agents
+    with _lock:
+        if _agents is None:
+            with timed("import_agents"):
+                from airline_agents import build_agents
+            model = get_model()
+            with timed("build_agents"):
+                _agents = build_agents(model)
+            logger.info(f"Startup timing:\n{startup_report()}")
+    return _agents
+
+
+def get_triage_agent() -> Any:
+    return get_agents()["Triage Agent"]
+
+
+def get_turn_runner() -> Any:
+    """Shared TurnRunner wiring the agents, store, history manager, fast-path router, prefetcher and answer cache."""
+    global _turn_runner
+    with _lock:
+        if _turn_runner is None:
+            from answer_cache import get_answer_cache
+            from fast_router import get_fast_router
+            from history import HistoryManager
+            from prefetch import get_prefetcher
+            from turns import TurnRunner
+
+            _turn_runner = TurnRunner(get_agents(), get_conversation_store(), HistoryManager.from_env(),
+                                      get_fast_router(), prefetcher=get_prefetcher(),
+                                      answer_cache=get_answer_cache())
+    return _turn_runner
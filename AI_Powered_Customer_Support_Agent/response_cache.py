@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from upstream import background_priority
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    refreshes: int = 0
+    refresh_failures: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+@dataclass
+class EndpointPolicy:
+    ttl: float
+    stale_ttl: float = 0.0
+    # Empty results (including error bodies that arrive as 200 with no data) are kept
+    # only this long and never served stale, so an upstream hiccup can't pin "not found".
+    empty_ttl: float = 0.0
+
+
+def cache_key(endpoint: str, params: Dict[str, Any]) -> Tuple[Hashable, ...]:
+    """Normalize request params so 'aa123' and 'AA123 ' share one cache slot."""
+    normalized = []
+    for name, value in params.items():
+        if name == "access_key" or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip().upper()
+        normalized.append((name.lower(), value))
+    return (endpoint, tuple(sorted(normalized)))
+
+
+class ResponseCache:
+    """Bounded LRU cache with per-endpoint TTLs and stale-while-revalidate.
+
+    Not thread-safe: it is only touched from the shared I/O loop.
+    """
+
+    def __init__(self, policies: Dict[str, EndpointPolicy], max_entries: int = 2048,
+                 default_policy: Optional[EndpointPolicy] = None):
+        self.policies = policies
+        self.default_policy = default_policy or EndpointPolicy(ttl=60.0)
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def policy_for(self, endpoint: str) -> EndpointPolicy:
+        return self.policies.get(endpoint, self.default_policy)
+
+    def get(self, key: Hashable) -> Tuple[Optional[CacheEntry], bool]:
+        """Return (entry, is_fresh); expired entries are dropped."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        now = time.monotonic()
+        if now >= entry.stale_until:
+            del self._entries[key]
+            return None, False
+        self._entries.move_to_end(key)
+        return entry, now < entry.fresh_until
+
+    def set(self, key: Hashable, value: Any, policy: EndpointPolicy) -> None:
+        now = time.monotonic()
+        if value:
+            self._entries[key] = CacheEntry(value, now + policy.ttl, now + policy.ttl + policy.stale_ttl)
+        elif policy.empty_ttl > 0:
+            self._entries[key] = CacheEntry(value, now + policy.empty_ttl, now + policy.empty_ttl)
+        else:
+            self._entries.pop(key, None)
+            return
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get_or_fetch(self, endpoint: str, key: Hashable,
+                           fetch: Callable[[], Awaitable[Any]]) -> Any:
+        policy = self.policy_for(endpoint)
+        entry, fresh = self.get(key)
+        if entry is not None and fresh:
+            self.stats.hits += 1
+            return entry.value
+        if entry is not None:
+            self.stats.stale_hits += 1
+            self._schedule_refresh(key, policy, fetch)
+            return entry.value
+
+        self.stats.misses += 1
+        value = await fetch()
+        # Failed lookups (None) are never cached so the next call retries upstream;
+        # empty ones only for the endpoint's empty_ttl.
+        if value is not None and policy.ttl > 0:
+            self.set(key, value, policy)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, policy: EndpointPolicy,
+                          fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+
+        async def _refresh() -> None:
+            try:
+                with background_priority():
+                    value = await fetch()
+                # An empty refresh is as likely an upstream error body; keep serving the last good value.
+                if value:
+                    self.set(key, value, policy)
+                    self.stats.refreshes += 1
+                else:
+                    self.stats.refresh_failures += 1
+            except Exception as e:
+                self.stats.refresh_failures += 1
+                logger.warning(f"Background refresh failed for {key}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.get_running_loop().create_task(_refresh())
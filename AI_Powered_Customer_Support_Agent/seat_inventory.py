@@ -0,0 +1,381 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+SEAT_RE = re.compile(r"^(?P<row>[0-9]{1,3})(?P<letter>[A-Z])$")
+
+
+# Aircraft layouts
+
+@dataclass(frozen=True)
+class SeatLayout:
+    """Row-major seat grid; ``letters`` uses spaces for aisles, e.g. "ABC DEF".
+
+    Seat ``row``/``letter`` maps to bit ``(row - first_row) * width + column``
+    of a flight's occupancy bitmap.
+    """
+    aircraft: str
+    rows: int
+    letters: str
+    first_row: int = 1
+    skipped_rows: Tuple[int, ...] = ()
+
+    @property
+    def columns(self) -> str:
+        return self.letters.replace(" ", "")
+
+    @property
+    def width(self) -> int:
+        return len(self.columns)
+
+    @property
+    def row_numbers(self) -> Tuple[int, ...]:
+        return _row_numbers(self)
+
+    def _build_row_numbers(self) -> Tuple[int, ...]:
+        numbers = []
+        row = self.first_row
+        while len(numbers) < self.rows:
+            if row not in self.skipped_rows:
+                numbers.append(row)
+            row += 1
+        return tuple(numbers)
+
+    @property
+    def seat_count(self) -> int:
+        return self.rows * self.width
+
+    @property
+    def full_mask(self) -> int:
+        return (1 << self.seat_count) - 1
+
+    def index(self, seat: str) -> Optional[int]:
+        match = SEAT_RE.match(seat.upper())
+        if match is None:
+            return None
+        row_index = _row_index(self)
+        row = row_index.get(int(match["row"]))
+        column = self.columns.find(match["letter"])
+        if row is None or column < 0:
+            return None
+        return row * self.width + column
+
+    def seat(self, index: int) -> str:
+        return _seat_names(self)[index]
+
+    def segments(self) -> List[Tuple[int, int]]:
+        """(first column, length) of each run of seats between aisles."""
+        result, column = [], 0
+        for block in self.letters.split(" "):
+            result.append((column, len(block)))
+            column += len(block)
+        return result
+
+
+@lru_cache(maxsize=None)
+def _row_numbers(layout: SeatLayout) -> Tuple[int, ...]:
+    return layout._build_row_numbers()
+
+
+@lru_cache(maxsize=None)
+def _seat_names(layout: SeatLayout) -> Tuple[str, ...]:
+    return tuple(f"{row}{column}" for row in layout.row_numbers for column in layout.columns)
+
+
+@lru_cache(maxsize=None)
+def _row_index(layout: SeatLayout) -> Dict[int, int]:
+    return {row: i for i, row in enumerate(layout.row_numbers)}
+
+
+@lru_cache(maxsize=None)
+def _adjacent_windows(layout: SeatLayout, count: int) -> Tuple[Tuple[int, int], ...]:
+    # (mask, first seat index) for every run of ``count`` seats that doesn't cross an aisle
+    windows = []
+    run = (1 << count) - 1
+    for row in range(layout.rows):
+        for start, length in layout.segments():
+            for offset in range(length - count + 1):
+                first = row * layout.width + start + offset
+                windows.append((run << first, first))
+    return tuple(windows)
+
+
+LAYOUTS: Dict[str, SeatLayout] = {
+    "A319": SeatLayout("A319", 24, "ABC DEF"),
+    "A320": SeatLayout("A320", 30, "ABC DEF", skipped_rows=(13,)),
+    "A321": SeatLayout("A321", 38, "ABC DEF", skipped_rows=(13,)),
+    "B737": SeatLayout("B737", 33, "ABC DEF"),
+    "B738": SeatLayout("B738", 33, "ABC DEF"),
+    "B752": SeatLayout("B752", 36, "ABC DEF"),
+    "A332": SeatLayout("A332", 40, "AB DEFG HK"),
+    "B772": SeatLayout("B772", 42, "ABC DEFG HJK"),
+    "B77W": SeatLayout("B77W", 45, "ABC DEFG HJK"),
+    "B789": SeatLayout("B789", 38, "ABC DEF GHJ"),
+}
+DEFAULT_LAYOUT = LAYOUTS["A320"]
+
+
+def layout_for(aircraft: Optional[str]) -> SeatLayout:
+    return LAYOUTS.get((aircraft or "").upper(), DEFAULT_LAYOUT)
+
+
+# Seat maps
+
+@dataclass
+class SeatMap:
+    layout: SeatLayout
+    occupied: int = 0
+    seats: Dict[str, str] = field(default_factory=dict)        # seat -> confirmation number
+    passengers: Dict[str, str] = field(default_factory=dict)   # confirmation number -> seat
+    version: int = 0
+    loaded_at: float = field(default_factory=time.monotonic)
+    # False until the flight has a Mongo document; reads never create one
+    stored: bool = True
+
+    @classmethod
+    def from_assignments(cls, layout: SeatLayout, seats: Dict[str, str], version: int = 0) -> "SeatMap":
+        seat_map = cls(layout, version=version)
+        for seat, confirmation in seats.items():
+            seat_map._assign(seat, confirmation)
+        return seat_map
+
+    def _assign(self, seat: str, confirmation: str) -> None:
+        index = self.layout.index(seat)
+        if index is not None:
+            self.occupied |= 1 << index
+        self.seats[seat] = confirmation
+        self.passengers[confirmation] = seat
+
+    def _release(self, seat: str) -> None:
+        index = self.layout.index(seat)
+        if index is not None:
+            self.occupied &= ~(1 << index)
+        confirmation = self.seats.pop(seat, None)
+        if confirmation is not None and self.passengers.get(confirmation) == seat:
+            del self.passengers[confirmation]
+
+    @property
+    def free(self) -> int:
+        return ~self.occupied & self.layout.full_mask
+
+    def is_free(self, seat: str) -> bool:
+        index = self.layout.index(seat)
+        return index is not None and not (self.occupied >> index) & 1
+
+    def available(self, limit: Optional[int] = None) -> List[str]:
+        names, seats, free = _seat_names(self.layout), [], self.free
+        while free and (limit is None or len(seats) < limit):
+            low = free & -free
+            seats.append(names[low.bit_length() - 1])
+            free ^= low
+        return seats
+
+    def available_count(self) -> int:
+        return self.free.bit_count()
+
+    def adjacent(self, count: int, limit: int = 5) -> List[List[str]]:
+        """Up to ``limit`` blocks of ``count`` free seats side by side in one row."""
+        if count <= 1:
+            return [[seat] for seat in self.available(limit)]
+        free, blocks = self.free, []
+        for mask, first in _adjacent_windows(self.layout, count):
+            if free & mask == mask:
+                blocks.append([self.layout.seat(first + i) for i in range(count)])
+                if len(blocks) >= limit:
+                    break
+        return blocks
+
+
+@dataclass
+class ReservationResult:
+    ok: bool
+    seat: str
+    reason: str = "reserved"            # reserved | unchanged | taken | invalid_seat | unavailable
+    previous_seat: Optional[str] = None
+    holder: Optional[str] = None
+
+
+class SeatInventory:
+    """Per-flight seat maps with atomic reservations.
+
+    With Mongo, each flight is one document holding ``seats.<seat>`` and
+    ``passengers.<confirmation>``; a reservation is a single conditional
+    update that only matches while the seat is still empty and the
+    passenger still holds the seat we think they hold (compare-and-set), so
+    concurrent requests across processes can never double-book. Without
+    Mongo the same check runs under a process-wide lock. Occupancy is cached
+    as a bitmap for availability queries and refreshed after ``cache_ttl``;
+    at most ``max_flights`` maps are kept, least recently used evicted first
+    (without Mongo, only maps with no reservations, since they are the only copy).
+    """
+
+    def __init__(self, collection: Optional[Collection] = None, cache_ttl: float = 5.0, max_attempts: int = 3,
+                 max_flights: int = 1000):
+        self.collection = collection
+        self.cache_ttl = cache_ttl
+        self.max_attempts = max_attempts
+        self.max_flights = max_flights
+        self._maps: "OrderedDict[str, SeatMap]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.reservations = 0
+        self.conflicts = 0
+        self.retries = 0
+        self.evictions = 0
+
+    @property
+    def use_mongodb(self) -> bool:
+        return self.collection is not None
+
+    def ensure_indexes(self) -> None:
+        if self.collection is not None:
+            self.collection.create_index("flight_key", unique=True)
+
+    def use_memory_fallback(self) -> None:
+        self.collection = None
+        with self._lock:
+            self._maps.clear()
+
+    # Mongo helpers (run in worker threads)
+
+    def _fetch_doc(self, flight_key: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"flight_key": flight_key}, {"_id": 0, "aircraft": 1, "seats": 1, "version": 1})
+
+    def _create_doc(self, flight_key: str, layout: SeatLayout) -> None:
+        try:
+            self.collection.update_one(
+                {"flight_key": flight_key},
+                {"$setOnInsert": {"flight_key": flight_key, "aircraft": layout.aircraft, "seats": {},
+                                  "passengers": {}, "version": 0}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass  # Lost an upsert race with another process; the document exists now.
+
+    def _cas(self, flight_key: str, confirmation: str, seat: str, previous: Optional[str]) -> bool:
+        query: Dict[str, Any] = {"flight_key": flight_key, f"seats.{seat}": {"$exists": False},
+                                 f"passengers.{confirmation}": previous if previous else {"$exists": False}}
+        update: Dict[str, Any] = {"$set": {f"seats.{seat}": confirmation, f"passengers.{confirmation}": seat},
+                                  "$inc": {"version": 1}}
+        if previous:
+            update["$unset"] = {f"seats.{previous}": ""}
+        return self.collection.update_one(query, update).modified_count == 1
+
+    def _map_from_doc(self, doc: Optional[Dict[str, Any]], layout: SeatLayout) -> SeatMap:
+        if doc is None:
+            return SeatMap(layout, stored=False)
+        return SeatMap.from_assignments(layout_for(doc.get("aircraft")) if doc.get("aircraft") else layout,
+                                        doc.get("seats", {}), doc.get("version", 0))
+
+    def _cache(self, flight_key: str, seat_map: SeatMap) -> None:
+        """Store ``seat_map`` as most recently used and evict past ``max_flights``; call with the lock held."""
+        self._maps[flight_key] = seat_map
+        self._maps.move_to_end(flight_key)
+        excess = len(self._maps) - self.max_flights
+        if excess <= 0:
+            return
+        victims = []
+        for key, cached in self._maps.items():
+            if len(victims) >= excess:
+                break
+            if key != flight_key and (self.use_mongodb or not cached.seats):
+                victims.append(key)
+        for key in victims:
+            del self._maps[key]
+        self.evictions += len(victims)
+
+    # Public API
+
+    async def get_map(self, flight_key: str, aircraft: Optional[str] = None, refresh: bool = False) -> SeatMap:
+        layout = layout_for(aircraft)
+        with self._lock:
+            seat_map = self._maps.get(flight_key)
+            if seat_map is not None and (not self.use_mongodb or
+                                         (not refresh and time.monotonic() - seat_map.loaded_at < self.cache_ttl)):
+                self._maps.move_to_end(flight_key)
+                return seat_map
+            if not self.use_mongodb:
+                seat_map = SeatMap(layout)
+                self._cache(flight_key, seat_map)
+                return seat_map
+        doc = await asyncio.to_thread(self._fetch_doc, flight_key)
+        seat_map = self._map_from_doc(doc, layout)
+        with self._lock:
+            current = self._maps.get(flight_key)
+            if current is None or current.version <= seat_map.version:
+                self._cache(flight_key, seat_map)
+        return seat_map
+
+    async def reserve(self, flight_key: str, confirmation: str, seat: str,
+                      aircraft: Optional[str] = None) -> ReservationResult:
+        """Move ``confirmation`` to ``seat``, releasing the seat it held before on this flight."""
+        seat = seat.upper()
+        seat_map = await self.get_map(flight_key, aircraft)
+        if seat_map.layout.index(seat) is None:
+            return ReservationResult(False, seat, "invalid_seat")
+
+        if not self.use_mongodb:
+            with self._lock:
+                holder = seat_map.seats.get(seat)
+                if holder == confirmation:
+                    return ReservationResult(True, seat, "unchanged", seat)
+                if holder is not None:
+                    self.conflicts += 1
+                    return ReservationResult(False, seat, "taken", holder=holder)
+                previous = seat_map.passengers.get(confirmation)
+                if previous:
+                    seat_map._release(previous)
+                seat_map._assign(seat, confirmation)
+                seat_map.version += 1
+                self.reservations += 1
+            return ReservationResult(True, seat, "reserved", previous)
+
+        for attempt in range(self.max_attempts):
+            holder = seat_map.seats.get(seat)
+            if holder == confirmation:
+                return ReservationResult(True, seat, "unchanged", seat)
+            if holder is not None:
+                self.conflicts += 1
+                return ReservationResult(False, seat, "taken", holder=holder)
+            previous = seat_map.passengers.get(confirmation)
+            try:
+                if not seat_map.stored:
+                    # First write for this flight: create its document, then CAS as usual.
+                    await asyncio.to_thread(self._create_doc, flight_key, seat_map.layout)
+                    seat_map.stored = True
+                swapped = await asyncio.to_thread(self._cas, flight_key, confirmation, seat, previous)
+            except Exception as e:
+                logger.error(f"Seat reservation for {flight_key} failed: {str(e)}")
+                return ReservationResult(False, seat, "unavailable")
+            if swapped:
+                with self._lock:
+                    if previous:
+                        seat_map._release(previous)
+                    seat_map._assign(seat, confirmation)
+                    seat_map.version += 1
+                    self.reservations += 1
+                return ReservationResult(True, seat, "reserved", previous)
+            # Our view was stale: reload and decide again.
+            self.retries += 1
+            seat_map = await self.get_map(flight_key, aircraft, refresh=True)
+        self.conflicts += 1
+        return ReservationResult(False, seat, "taken", holder=seat_map.seats.get(seat))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "flights_cached": len(self._maps),
+            "reservations": self.reservations,
+            "conflicts": self.conflicts,
+            "retries": self.retries,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,294 @@
+"""Headless entry point: serve conversations over HTTP or stdio JSON lines.
+
+    python service.py --port 8080            # ASGI app on uvicorn
+    python service.py --stdio < turns.jsonl  # {"conversation_id": "...", "message": "..."} per line
+
+Every conversation runs on one event loop through the same TurnRunner as the
+Streamlit app. Turns of one conversation are serialized in arrival order;
+different conversations run concurrently up to SERVICE_MAX_CONCURRENCY.
+Several worker processes can sit behind a load balancer as long as requests
+for one conversation are routed to the same worker (e.g. hash on the id).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional
+
+from dotenv import load_dotenv
+
+import resources
+from telemetry import get_telemetry
+from turns import ConversationState, StreamHandler, TurnResult, TurnRunner
+from upstream import UpstreamUnavailable, upstream_stats
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Slot:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    state: Optional[ConversationState] = None
+    users: int = 0
+
+
+class ConversationService:
+    """Per-conversation ordering and global concurrency limits around a TurnRunner.
+
+    Conversation states are kept in an LRU of ``max_conversations`` slots; idle
+    slots beyond that are dropped and reloaded from the store on next use.
+    """
+
+    def __init__(self, runner: TurnRunner, max_concurrency: int = 64, max_conversations: int = 1000,
+                 history_load_limit: int = 100):
+        self.runner = runner
+        self.max_conversations = max_conversations
+        self.history_load_limit = history_load_limit
+        self._slots: "OrderedDict[str, _Slot]" = OrderedDict()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.turns = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latency_ms_total = 0.0
+
+    @classmethod
+    def from_env(cls, runner: TurnRunner) -> "ConversationService":
+        return cls(
+            runner,
+            max_concurrency=int(os.getenv("SERVICE_MAX_CONCURRENCY", "64")),
+            max_conversations=int(os.getenv("SERVICE_MAX_CONVERSATIONS", "1000")),
+            history_load_limit=int(os.getenv("HISTORY_LOAD_LIMIT", "100")),
+        )
+
+    def _slot(self, conversation_id: str) -> _Slot:
+        # Synchronous on purpose: callers queue on the lock in the order they arrived.
+        slot = self._slots.get(conversation_id)
+        if slot is None:
+            slot = self._slots[conversation_id] = _Slot()
+        self._slots.move_to_end(conversation_id)
+        slot.users += 1
+        return slot
+
+    def _release(self, slot: _Slot) -> None:
+        slot.users -= 1
+        excess = len(self._slots) - self.max_conversations
+        if excess <= 0:
+            return
+        for conversation_id in [cid for cid, s in self._slots.items() if s.users == 0][:excess]:
+            del self._slots[conversation_id]
+
+    async def _state(self, conversation_id: str, slot: _Slot) -> ConversationState:
+        if slot.state is None:
+            # An evicted or reset slot may still have write-behind data staged; settle it
+            # first so the reloaded message_count (and so the next seq) is current.
+            await self.runner.store.flush_conversation(conversation_id)
+            slot.state = await self.runner.load(conversation_id, last_n=self.history_load_limit)
+        return slot.state
+
+    async def send(self, conversation_id: str, message: str,
+                   on_event: Optional[StreamHandler] = None) -> TurnResult:
+        slot = self._slot(conversation_id)
+        try:
+            async with slot.lock:
+                state = await self._state(conversation_id, slot)
+                async with self._semaphore:
+                    self.in_flight += 1
+                    try:
+                        result = await self.runner.run_turn(state, message, on_event=on_event)
+                    except Exception:
+                        self.errors += 1
+                        # The state may hold a half-applied turn; reload it next time.
+                        slot.state = None
+                        raise
+                    finally:
+                        self.in_flight -= 1
+            self.turns += 1
+            self.latency_ms_total += result.latency_ms
+            return result
+        finally:
+            self._release(slot)
+
+    async def get(self, conversation_id: str) -> ConversationState:
+        slot = self._slot(conversation_id)
+        try:
+            async with slot.lock:
+                return await self._state(conversation_id, slot)
+        finally:
+            self._release(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "conversations_cached": len(self._slots),
+            "mean_latency_ms": round(self.latency_ms_total / self.turns, 1) if self.turns else 0.0,
+        }
+
+
+def _result_payload(conversation_id: str, result: TurnResult) -> Dict[str, Any]:
+    return {
+        "conversation_id": conversation_id,
+        "replies": result.replies,
+        "agent": result.agent,
+        "latency_ms": round(result.latency_ms, 1),
+        "fast_path": result.fast_path,
+    }
+
+
+def create_app(service: Optional[ConversationService] = None) -> Any:
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+
+    holder: Dict[str, ConversationService] = {}
+
+    def current() -> ConversationService:
+        # Built lazily so the semaphore and locks bind to uvicorn's event loop.
+        if "service" not in holder:
+            holder["service"] = service or ConversationService.from_env(resources.get_turn_runner())
+        return holder["service"]
+
+    async def post_message(request: Request) -> JSONResponse:
+        conversation_id = request.path_params["conversation_id"]
+        try:
+            body = await request.json()
+            message = str(body["message"]).strip()
+        except (ValueError, KeyError, TypeError):
+            return JSONResponse({"error": "expected a JSON body with a 'message' field"}, status_code=400)
+        if not message:
+            return JSONResponse({"error": "message must not be empty"}, status_code=400)
+        try:
+            result = await current().send(conversation_id, message)
+        except UpstreamUnavailable as e:
+            logger.warning(f"Turn failed for {conversation_id}: {str(e)}")
+            headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+            return JSONResponse({"error": str(e), "upstream": e.upstream}, status_code=503, headers=headers)
+        except Exception as e:
+            logger.error(f"Turn failed for {conversation_id}: {str(e)}")
+            return JSONResponse({"error": str(e)}, status_code=502)
+        return JSONResponse(_result_payload(conversation_id, result))
+
+    async def get_conversation(request: Request) -> JSONResponse:
+        conversation_id = request.path_params["conversation_id"]
+        state = await current().get(conversation_id)
+        return JSONResponse({
+            "conversation_id": conversation_id,
+            "context": state.context.dict(),
+            "messages": state.messages,
+            "current_agent": state.current_agent,
+        })
+
+    async def healthz(request: Request) -> JSONResponse:
+        return JSONResponse({"ok": True, "mongo_healthy": resources.mongo_healthy})
+
+    async def stats(request: Request) -> JSONResponse:
+        svc = current()
+        payload = {"service": svc.stats(), "storage": svc.runner.store.stats()}
+        if svc.runner.router is not None:
+            payload["fast_router"] = svc.runner.router.stats()
+        if svc.runner.prefetcher is not None:
+            payload["prefetch"] = svc.runner.prefetcher.stats()
+        if svc.runner.answer_cache is not None:
+            payload["answer_cache"] = svc.runner.answer_cache.stats()
+        payload["upstreams"] = upstream_stats()
+        return JSONResponse(payload)
+
+    async def metrics(request: Request) -> PlainTextResponse:
+        return PlainTextResponse(get_telemetry().render_prometheus(),
+                                 media_type="text/plain; version=0.0.4")
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Any) -> AsyncIterator[None]:
+        yield
+        if "service" in holder:
+            await holder["service"].runner.store.flush()
+
+    return Starlette(
+        routes=[
+            Route("/conversations/{conversation_id}/messages", post_message, methods=["POST"]),
+            Route("/conversations/{conversation_id}", get_conversation, methods=["GET"]),
+            Route("/healthz", healthz, methods=["GET"]),
+            Route("/stats", stats, methods=["GET"]),
+            Route("/metrics", metrics, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+async def run_stdio(service: ConversationService) -> None:
+    """Read one JSON request per line from stdin and write one JSON result per line."""
+    loop = asyncio.get_running_loop()
+    write_lock = asyncio.Lock()
+    tasks = set()
+
+    async def handle(line_no: int, request: Dict[str, Any]) -> None:
+        conversation_id = str(request.get("conversation_id") or uuid.uuid4().hex[:16])
+        try:
+            payload = _result_payload(conversation_id, await service.send(conversation_id, str(request["message"])))
+        except Exception as e:
+            payload = {"conversation_id": conversation_id, "error": str(e)}
+        payload["line"] = line_no
+        async with write_lock:
+            sys.stdout.write(json.dumps(payload) + "\n")
+            sys.stdout.flush()
+
+    line_no = 0
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            sys.stdout.write(json.dumps({"line": line_no, "error": f"invalid JSON: {str(e)}"}) + "\n")
+            continue
+        task = asyncio.create_task(handle(line_no, request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    await service.runner.store.flush()
+    logger.info(f"Service stats: {service.stats()}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Headless airline customer service")
+    parser.add_argument("--stdio", action="store_true", help="read JSON lines from stdin instead of serving HTTP")
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+
+    if args.stdio:
+        start = time.perf_counter()
+        asyncio.run(run_stdio(ConversationService.from_env(resources.get_turn_runner())))
+        logger.info(f"Finished in {time.perf_counter() - start:.1f} s")
+        return 0
+
+    import uvicorn
+
+    uvicorn.run("service:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one upstream request.
+
+    The first caller for a key runs ``fetch``; everyone arriving while it is in
+    flight awaits the same future. Results are not retained once it completes —
+    that is the response cache's job. The request is cancelled only once every
+    caller waiting on it has been cancelled.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            future = asyncio.ensure_future(fetch())
+            self._inflight[key] = future
+            self._waiters[key] = 0
+
+            def _done(done: "asyncio.Future[Any]") -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+                    self._waiters.pop(key, None)
+
+            future.add_done_callback(_done)
+
+        self._waiters[key] += 1
+        try:
+            # shield() so one cancelled caller doesn't cancel the request for the others.
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._inflight.get(key) is future and self._waiters[key] == 1 and not future.done():
+                self.abandoned += 1
+                del self._inflight[key]
+                del self._waiters[key]
+                future.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                self._waiters[key] -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "followers": self.followers, "abandoned": self.abandoned,
+                "inflight": len(self._inflight)}
@@ -0,0 +1,476 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure, PyMongoError
+
+from io_loop import run_in_io_loop, submit
+from memory_store import BoundedMemoryStore, MemoryRecord, SpillStore
+from migrate_conversations import migrate_document
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+_MISSING = object()
+
+
+def context_diff(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the top-level context fields that changed since ``previous``."""
+    if previous is None:
+        return dict(current)
+    return {key: value for key, value in current.items() if previous.get(key, _MISSING) != value}
+
+
+class ConversationStore:
+    """Write-behind, append-only persistence for conversations.
+
+    Each conversation is one small document in ``conversations`` holding the
+    context and a ``message_count``; messages live in ``conversation_messages``
+    as one document per ``(conversation_id, seq)`` and are only ever inserted.
+    Context updates are sent as ``$set`` diffs of the fields that changed.
+    Documents from before the message log still embed a ``messages`` array;
+    they are read as they are and migrated by the first flush that writes to them.
+
+    Saves are staged in memory and coalesced per conversation, then written to
+    Mongo in unordered bulk writes per flush (on turn end or every
+    ``flush_interval`` seconds). Staging and flushing run on the shared I/O loop
+    and Mongo calls run in a worker thread, so no caller's event loop ever waits
+    on storage I/O. If more than ``max_pending`` conversations are waiting,
+    ``save`` flushes inline, slowing producers down until Mongo catches up.
+    """
+
+    def __init__(self, collection: Optional[Collection], messages_collection: Optional[Collection] = None,
+                 flush_interval: float = 1.0, max_pending: int = 500, batch_size: int = 200,
+                 max_tracked_contexts: int = 10000, memory: Optional[BoundedMemoryStore] = None,
+                 spill: Optional[SpillStore] = None, ttl_days: float = 0, archive_after_days: float = 0):
+        self.collection = collection
+        self.messages_collection = messages_collection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.max_tracked_contexts = max_tracked_contexts
+        # In-memory fallback when Mongo is unavailable, optionally spilling evictions to disk.
+        self.memory = memory if memory is not None else BoundedMemoryStore()
+        self.spill = spill
+        # Conversations idle longer than ttl_days are deleted with their messages (0 keeps
+        # everything); those idle longer than archive_after_days are moved to *_archive first.
+        self.ttl_days = ttl_days
+        self.archive_after_days = archive_after_days
+        self.archived = 0
+        self.expired = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Loaded conversations whose messages are still embedded; migrated on their next write
+        self._legacy: Set[str] = set()
+        # Last context staged per conversation, used to send diffs. Bounded; an
+        # untracked conversation simply sends its full context once.
+        self._last_context: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    @classmethod
+    def from_env(cls, collection: Optional[Collection],
+                 messages_collection: Optional[Collection]) -> "ConversationStore":
+        return cls(
+            collection,
+            messages_collection,
+            flush_interval=float(os.getenv("STORAGE_FLUSH_INTERVAL", "1.0")),
+            max_pending=int(os.getenv("STORAGE_MAX_PENDING", "500")),
+            batch_size=int(os.getenv("STORAGE_BATCH_SIZE", "200")),
+            memory=BoundedMemoryStore.from_env(),
+            spill=SpillStore(os.getenv("MEMORY_STORE_SPILL_PATH")) if os.getenv("MEMORY_STORE_SPILL_PATH") else None,
+            ttl_days=float(os.getenv("CONVERSATION_TTL_DAYS", "90")),
+            archive_after_days=float(os.getenv("CONVERSATION_ARCHIVE_AFTER_DAYS", "0")),
+        )
+
+    @property
+    def use_mongodb(self) -> bool:
+        return self.collection is not None
+
+    async def use_memory_fallback(self) -> None:
+        """Stop using Mongo (e.g. after a failed health check); nothing staged is lost.
+
+        Must run on the shared I/O loop, where staging happens.
+        """
+        if self.collection is None:
+            return
+        self.collection = None
+        self.messages_collection = None
+        pending, self._pending = self._pending, {}
+        for cid, staged in pending.items():
+            record = await self._memory_record(cid)
+            context = {**(record.context if record else {}), **staged["context"]}
+            staged_messages = sorted(staged["messages"].items())
+            # Written from their staged seq, so a message already in memory is replaced, not repeated
+            first_seq = staged_messages[0][0] if staged_messages else None
+            messages = [message for _, message in staged_messages]
+            await self._spill(self.memory.append(cid, context, messages, first_seq))
+
+    async def _spill(self, evicted: List[Tuple[str, MemoryRecord]]) -> None:
+        if evicted and self.spill is not None:
+            await asyncio.to_thread(self.spill.save_many, evicted)
+        elif evicted:
+            logger.info(f"Evicted {len(evicted)} in-memory conversations")
+
+    async def _memory_record(self, conversation_id: str) -> Optional[MemoryRecord]:
+        record = self.memory.get(conversation_id)
+        if record is None and self.spill is not None:
+            record = await asyncio.to_thread(self.spill.pop, conversation_id)
+            if record is not None:
+                await self._spill(self.memory.admit(conversation_id, record))
+        return record
+
+    # Index management and archiving (blocking; run in a worker thread at startup)
+
+    def _archive_collections(self) -> Tuple[Collection, Collection]:
+        db = self.collection.database
+        return db[f"{self.collection.name}_archive"], db[f"{self.messages_collection.name}_archive"]
+
+    def ensure_indexes(self) -> None:
+        """Create the lookup, ordering and idle-scan indexes every read, write and retention job relies on."""
+        if not self.use_mongodb:
+            return
+        try:
+            self.collection.create_index("conversation_id", unique=True)
+        except OperationFailure as e:
+            logger.error(f"Could not create unique index on {self.collection.name}.conversation_id: {str(e)}")
+        self.messages_collection.create_index([("conversation_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+        # Plain index, not a TTL: expire_stale deletes a conversation together with its
+        # messages, where a TTL would drop an active conversation's early messages
+        self.collection.create_index("updated_at")
+        if self.archive_after_days > 0:
+            if self.ttl_days > 0 and self.archive_after_days >= self.ttl_days:
+                logger.warning(f"CONVERSATION_ARCHIVE_AFTER_DAYS ({self.archive_after_days}) is not below "
+                               f"CONVERSATION_TTL_DAYS ({self.ttl_days}); conversations expire before archiving")
+            conversations, messages = self._archive_collections()
+            conversations.create_index("conversation_id", unique=True)
+            messages.create_index([("conversation_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+
+    def _idle(self, days: float, batch_size: int):
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        return self.collection.find({"updated_at": {"$lt": cutoff}}, {"_id": 0}, batch_size=batch_size)
+
+    def _delete_conversation(self, doc: Dict[str, Any]) -> bool:
+        """Delete a conversation and its messages, unless it was written to after ``doc`` was read."""
+        cid = doc["conversation_id"]
+        if not self.collection.delete_one({"conversation_id": cid, "updated_at": doc["updated_at"]}).deleted_count:
+            return False
+        # Only the messages that document counted; a turn racing the delete keeps its own.
+        self.messages_collection.delete_many({"conversation_id": cid, "seq": {"$lt": doc.get("message_count", 0)}})
+        return True
+
+    def archive_stale(self, batch_size: int = 200) -> int:
+        """Move conversations idle for ``archive_after_days`` into the archive collections."""
+        if not self.use_mongodb or self.archive_after_days <= 0:
+            return 0
+        archive, messages_archive = self._archive_collections()
+        archived = 0
+        for doc in self._idle(self.archive_after_days, batch_size):
+            cid = doc["conversation_id"]
+            try:
+                batch = []
+                for message in self.messages_collection.find({"conversation_id": cid}, {"_id": 0}):
+                    batch.append(ReplaceOne({"conversation_id": cid, "seq": message["seq"]}, message, upsert=True))
+                    if len(batch) >= batch_size:
+                        messages_archive.bulk_write(batch, ordered=False)
+                        batch = []
+                if batch:
+                    messages_archive.bulk_write(batch, ordered=False)
+                archive.replace_one({"conversation_id": cid}, {**doc, "archived_at": datetime.utcnow()}, upsert=True)
+                # Copies are idempotent, so a conversation that changed meanwhile is simply retried next run.
+                archived += self._delete_conversation(doc)
+            except PyMongoError as e:
+                logger.error(f"Failed to archive conversation {cid}: {str(e)}")
+        self.archived += archived
+        if archived:
+            logger.info(f"Archived {archived} conversations idle for {self.archive_after_days} days")
+        return archived
+
+    def expire_stale(self, batch_size: int = 200) -> int:
+        """Delete conversations idle for ``ttl_days``, together with all of their messages."""
+        if not self.use_mongodb or self.ttl_days <= 0:
+            return 0
+        expired = 0
+        for doc in self._idle(self.ttl_days, batch_size):
+            try:
+                expired += self._delete_conversation(doc)
+            except PyMongoError as e:
+                logger.error(f"Failed to expire conversation {doc['conversation_id']}: {str(e)}")
+        self.expired += expired
+        if expired:
+            logger.info(f"Expired {expired} conversations idle for {self.ttl_days} days")
+        return expired
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None:
+            self._flush_lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_forever())
+
+    async def _flush_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush_all()
+
+    def _remember_context(self, conversation_id: str, context: Dict[str, Any]) -> None:
+        self._last_context[conversation_id] = dict(context)
+        self._last_context.move_to_end(conversation_id)
+        while len(self._last_context) > self.max_tracked_contexts:
+            self._last_context.popitem(last=False)
+
+    async def _stage(self, conversation_id: str, context: Dict[str, Any],
+                     messages: List[Dict[str, Any]], first_seq: Optional[int], flush_now: bool) -> None:
+        now = datetime.utcnow()
+        if not self.use_mongodb:
+            # Pull a spilled conversation back first so its history isn't overwritten.
+            await self._memory_record(conversation_id)
+            await self._spill(self.memory.append(conversation_id, context, messages, first_seq))
+            return
+
+        self._ensure_flusher()
+        diff = context_diff(self._last_context.get(conversation_id), context)
+        self._remember_context(conversation_id, context)
+        pending = self._pending.setdefault(conversation_id, {"context": {}, "messages": {}})
+        pending["context"].update(diff)
+        for offset, message in enumerate(messages):
+            pending["messages"][first_seq + offset] = {**message, "created_at": now}
+        pending["updated_at"] = now
+
+        if len(self._pending) >= self.max_pending:
+            logger.warning(f"{len(self._pending)} conversations awaiting persistence; flushing inline")
+            await self._flush_all()
+        elif flush_now:
+            self._wake.set()
+
+    def _operations(self, chunk):
+        conversation_ops, message_ops = [], []
+        for cid, pending in chunk:
+            update: Dict[str, Any] = {"$set": {"updated_at": pending["updated_at"]}}
+            update["$set"].update({f"context.{key}": value for key, value in pending["context"].items()})
+            if pending["messages"]:
+                update["$max"] = {"message_count": max(pending["messages"]) + 1}
+            else:
+                update["$setOnInsert"] = {"message_count": 0}
+            conversation_ops.append(UpdateOne({"conversation_id": cid}, update, upsert=True))
+            for seq, message in sorted(pending["messages"].items()):
+                # $setOnInsert keeps retries of a partially applied batch idempotent.
+                message_ops.append(UpdateOne(
+                    {"conversation_id": cid, "seq": seq},
+                    {"$setOnInsert": {**message, "conversation_id": cid, "seq": seq}},
+                    upsert=True,
+                ))
+        return conversation_ops, message_ops
+
+    def _requeue(self, chunk) -> None:
+        for cid, failed in chunk:
+            current = self._pending.get(cid)
+            if current is None:
+                self._pending[cid] = failed
+                continue
+            current["context"] = {**failed["context"], **current["context"]}
+            current["messages"] = {**failed["messages"], **current["messages"]}
+
+    async def _bulk_write(self, collection: Collection, name: str, operations: List[UpdateOne]) -> None:
+        start = time.perf_counter()
+        ok = False
+        try:
+            await asyncio.to_thread(collection.bulk_write, operations, ordered=False)
+            ok = True
+        finally:
+            get_telemetry().observe_storage_write(name, time.perf_counter() - start, len(operations), ok)
+
+    def _migrate(self, conversation_ids: List[str]) -> None:
+        """Move embedded message arrays into the log, so new messages are written after them."""
+        cursor = self.collection.find({"conversation_id": {"$in": conversation_ids}, "messages": {"$exists": True}},
+                                      {"conversation_id": 1, "messages": 1, "updated_at": 1})
+        for doc in cursor:
+            count = migrate_document(self.collection, self.messages_collection, doc, self.batch_size)
+            logger.info(f"Migrated {count} embedded messages for {doc['conversation_id']}")
+        self._legacy.difference_update(conversation_ids)
+
+    async def _write_chunk(self, chunk) -> None:
+        conversation_ops, message_ops = self._operations(chunk)
+        legacy = [cid for cid, _ in chunk if cid in self._legacy]
+        try:
+            if legacy:
+                await asyncio.to_thread(self._migrate, legacy)
+            if message_ops:
+                await self._bulk_write(self.messages_collection, "conversation_messages", message_ops)
+            await self._bulk_write(self.collection, "conversations", conversation_ops)
+            self.writes += len(conversation_ops) + len(message_ops)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Failed to persist {len(conversation_ops)} conversations: {str(e)}")
+            self._requeue(chunk)
+
+    async def _flush_all(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            items = list(batch.items())
+            for start in range(0, len(items), self.batch_size):
+                await self._write_chunk(items[start:start + self.batch_size])
+            self.flushes += 1
+
+    async def _flush_one(self, conversation_id: str) -> None:
+        async with self._flush_lock:
+            pending = self._pending.pop(conversation_id, None)
+            if pending is not None:
+                await self._write_chunk([(conversation_id, pending)])
+
+    async def _load(self, conversation_id: str, last_n: Optional[int]) -> Optional[Dict[str, Any]]:
+        if not self.use_mongodb:
+            stored = await self._memory_record(conversation_id)
+            if stored is None:
+                return None
+            messages = stored.messages
+            return {
+                "context": dict(stored.context),
+                "messages": [dict(m) for m in (messages[-last_n:] if last_n else messages)],
+                "message_count": len(messages),
+            }
+
+        # Staged writes may not have reached Mongo yet. Holding the flush lock, no
+        # batch is half-written, so everything not in _pending is already stored.
+        staged = None
+        if self._flush_lock is not None:
+            async with self._flush_lock:
+                pending = self._pending.get(conversation_id)
+                if pending is not None:
+                    staged = {"context": dict(pending["context"]), "messages": dict(pending["messages"])}
+
+        # Never pull message arrays with the context; history comes from the message log
+        doc = await asyncio.to_thread(self.collection.find_one, {"conversation_id": conversation_id},
+                                      {"_id": 0, "context": 1, "message_count": 1})
+        if doc is None:
+            if staged is None:
+                return None
+            doc = {"context": {}, "message_count": 0}
+            messages: List[Dict[str, Any]] = []
+            count = 0
+        elif "message_count" not in doc:
+            # Not yet migrated: messages are still embedded in the conversation document,
+            # and are moved to the log before anything new is written after them.
+            self._legacy.add(conversation_id)
+            legacy = await asyncio.to_thread(
+                self.collection.find_one, {"conversation_id": conversation_id},
+                {"_id": 0, "messages": {"$slice": -last_n} if last_n else 1,
+                 "message_total": {"$size": {"$ifNull": ["$messages", []]}}},
+            ) or {}
+            count = legacy.get("message_total", len(legacy.get("messages", [])))
+            messages = [{**m, "seq": count - len(legacy.get("messages", [])) + i}
+                        for i, m in enumerate(legacy.get("messages", []))]
+        else:
+            count = doc.get("message_count", 0)
+            cursor_args = {"filter": {"conversation_id": conversation_id},
+                           "projection": {"_id": 0, "role": 1, "content": 1, "seq": 1}, "sort": [("seq", -1)]}
+            if last_n:
+                cursor_args["limit"] = last_n
+            messages = await asyncio.to_thread(lambda: list(self.messages_collection.find(**cursor_args)))
+            messages.reverse()
+
+        context = doc.get("context", {})
+        if staged is not None:
+            # A flush may have landed some of these since the snapshot; seq keeps them unique.
+            context = {**context, **staged["context"]}
+            by_seq = {m["seq"]: m for m in messages}
+            by_seq.update({seq: {"role": m["role"], "content": m["content"]} for seq, m in staged["messages"].items()})
+            messages = [by_seq[seq] for seq in sorted(by_seq)]
+            if last_n:
+                messages = messages[-last_n:]
+            if staged["messages"]:
+                count = max(count, max(staged["messages"]) + 1)
+        self._remember_context(conversation_id, context)
+        messages = [{"role": m.get("role"), "content": m.get("content")} for m in messages]
+        return {"context": context, "messages": messages, "message_count": count}
+
+    async def _load_page(self, conversation_id: str, before_seq: Optional[int], limit: int) -> List[Dict[str, Any]]:
+        if not self.use_mongodb:
+            stored = await self._memory_record(conversation_id)
+            if stored is None:
+                return []
+            end = len(stored.messages) if before_seq is None else min(before_seq, len(stored.messages))
+            start = max(0, end - limit)
+            return [{**stored.messages[seq], "seq": seq} for seq in range(start, end)]
+
+        query: Dict[str, Any] = {"conversation_id": conversation_id}
+        if before_seq is not None:
+            query["seq"] = {"$lt": before_seq}
+        messages = await asyncio.to_thread(lambda: list(self.messages_collection.find(
+            query, {"_id": 0, "role": 1, "content": 1, "seq": 1}, sort=[("seq", -1)], limit=limit)))
+        messages.reverse()
+        return messages
+
+    async def aload_page(self, conversation_id: str, before_seq: Optional[int] = None,
+                         limit: int = 50) -> List[Dict[str, Any]]:
+        """Up to ``limit`` messages (with ``seq``) preceding ``before_seq``, oldest first.
+
+        Served by the ``(conversation_id, seq)`` index, so a page costs the same
+        however long the conversation is.
+        """
+        return await run_in_io_loop(self._load_page(conversation_id, before_seq, limit))
+
+    def load_page(self, conversation_id: str, before_seq: Optional[int] = None,
+                  limit: int = 50) -> List[Dict[str, Any]]:
+        return submit(self._load_page(conversation_id, before_seq, limit)).result()
+
+    async def save(self, conversation_id: str, context: Dict[str, Any]) -> None:
+        """Stage a context update; written on the next flush."""
+        await run_in_io_loop(self._stage(conversation_id, context, [], None, flush_now=False))
+
+    async def end_turn(self, conversation_id: str, context: Dict[str, Any],
+                       new_messages: List[Dict[str, Any]], first_seq: int) -> None:
+        """Stage the turn's context and new messages (numbered from ``first_seq``) and wake the flusher."""
+        messages = [{"role": m["role"], "content": m["content"]} for m in new_messages]
+        await run_in_io_loop(self._stage(conversation_id, context, messages, first_seq, flush_now=True))
+
+    async def flush(self) -> None:
+        if self.use_mongodb and self._flush_lock is not None:
+            await run_in_io_loop(self._flush_all())
+
+    async def flush_conversation(self, conversation_id: str) -> None:
+        """Write whatever is staged for one conversation now, leaving the others to the flusher."""
+        if self.use_mongodb and self._flush_lock is not None:
+            await run_in_io_loop(self._flush_one(conversation_id))
+
+    def flush_blocking(self, timeout: float = 10.0) -> None:
+        """Flush pending writes from synchronous code, e.g. at interpreter exit."""
+        if self.use_mongodb and self._flush_lock is not None:
+            try:
+                submit(self._flush_all()).result(timeout=timeout)
+            except Exception as e:
+                logger.error(f"Failed to flush conversations: {str(e)}")
+
+    async def aload(self, conversation_id: str, last_n: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Load the context and the last ``last_n`` messages (staged writes included) off the caller's loop."""
+        return await run_in_io_loop(self._load(conversation_id, last_n))
+
+    def load(self, conversation_id: str, last_n: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Blocking load of the context and the last ``last_n`` messages, for synchronous callers."""
+        return submit(self._load(conversation_id, last_n)).result()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "archived": self.archived,
+            "expired": self.expired,
+            **{f"memory_{name}": value for name, value in self.memory.stats().items()},
+        }
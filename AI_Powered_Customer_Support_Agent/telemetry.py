@@ -0,0 +1,410 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from agents import set_trace_processors, set_tracing_disabled
+from agents.tracing import Span, Trace, TracingProcessor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# Prometheus-style metrics
+
+class _Metric:
+    def __init__(self, kind: str, help_text: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.kind = kind
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> counter value, or [bucket counts..., sum, count] for histograms
+        self.series: Dict[Tuple[str, ...], Any] = {}
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str]) -> None:
+        self._metrics.setdefault(name, _Metric("counter", help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str],
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._metrics.setdefault(name, _Metric("histogram", help_text, label_names, buckets))
+
+    def _key(self, metric: _Metric, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in metric.label_names)
+
+    def inc(self, name: str, labels: Dict[str, Any], value: float = 1.0) -> None:
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            metric.series[key] = metric.series.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Dict[str, Any], value: float) -> None:
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            series = metric.series.get(key)
+            if series is None:
+                series = metric.series[key] = [0] * len(metric.buckets) + [0.0, 0]
+            for i, bound in enumerate(metric.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        def label_text(metric: _Metric, key: Tuple[str, ...], extra: str = "") -> str:
+            parts = [f'{name}="{value}"' for name, value in zip(metric.label_names, key) if value]
+            if extra:
+                parts.append(extra)
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines: List[str] = []
+        with self._lock:
+            for name, metric in self._metrics.items():
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                for key, value in sorted(metric.series.items()):
+                    if metric.kind == "counter":
+                        lines.append(f"{name}{label_text(metric, key)} {value:g}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, value):
+                        cumulative += count
+                        le = 'le="%g"' % bound
+                        lines.append(f"{name}_bucket{label_text(metric, key, le)} {cumulative}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{name}_bucket{label_text(metric, key, le)} {value[-1]}")
+                    lines.append(f"{name}_sum{label_text(metric, key)} {value[-2]:.6f}")
+                    lines.append(f"{name}_count{label_text(metric, key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+# OpenTelemetry-compatible export
+
+class OtlpJsonExporter:
+    """Batch finished spans as OTLP/JSON and append them to a file and/or POST them to a collector.
+
+    Export happens on a daemon thread; when the queue is full new spans are
+    dropped rather than slowing down the turn that produced them.
+    """
+
+    def __init__(self, service_name: str, path: Optional[str] = None, endpoint: Optional[str] = None,
+                 flush_interval: float = 5.0, max_batch: int = 512, max_queue: int = 8192):
+        self.service_name = service_name
+        self.path = path
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces" if endpoint and not endpoint.endswith("/v1/traces") else endpoint
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.dropped = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, span: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+
+    def _export(self, spans: List[Dict[str, Any]]) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "airline-customer-service"}, "spans": spans}],
+        }]}
+        try:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(payload) + "\n")
+            if self.endpoint:
+                httpx.post(self.endpoint, json=payload, timeout=5.0).raise_for_status()
+        except (OSError, httpx.HTTPError) as e:
+            logger.error(f"Failed to export {len(spans)} spans: {str(e)}")
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_id(sdk_id: Optional[str], length: int) -> str:
+    # SDK ids look like "trace_<32 hex>" / "span_<24 hex>"; OTLP wants 32 / 16 hex digits.
+    if not sdk_id:
+        return ""
+    return sdk_id.split("_", 1)[-1][-length:].rjust(length, "0")
+
+
+# Span processing
+
+def classify_span(span: Span[Any]) -> Tuple[str, str]:
+    """Map SDK span data to a (kind, name) pair used as metric labels."""
+    data = span.span_data
+    if data.type == "generation":
+        return "llm", str(getattr(data, "model", None) or "model")
+    if data.type == "function":
+        return "tool", data.name
+    if data.type == "handoff":
+        return "handoff", f"{data.from_agent}->{data.to_agent}"
+    if data.type == "agent":
+        return "agent", data.name
+    if data.type == "custom":
+        return data.name, str(data.data.get("endpoint") or data.data.get("op") or data.name)
+    return data.type, data.type
+
+
+class _OpenSpan:
+    __slots__ = ("start", "start_ns", "agent")
+
+    def __init__(self, agent: str):
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.agent = agent
+
+
+class SpanMetricsProcessor(TracingProcessor):
+    """Turn SDK spans into latency histograms, per-turn breakdowns and optional OTLP spans.
+
+    Every span is tagged with the agent it ran under and the conversation id
+    (the trace's ``group_id``).
+    """
+
+    def __init__(self, telemetry: "Telemetry"):
+        self.telemetry = telemetry
+        self._open: Dict[str, _OpenSpan] = {}
+        self._traces: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def on_trace_start(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces[trace.trace_id] = {
+                "conversation_id": getattr(trace, "group_id", None) or "",
+                "breakdown": {"llm_ms": 0.0, "llm_calls": 0, "tool_ms": 0.0, "tool_calls": 0,
+                              "aviation_ms": 0.0, "aviation_calls": 0, "storage_ms": 0.0, "handoffs": 0},
+            }
+
+    def on_trace_end(self, trace: Trace) -> None:
+        with self._lock:
+            state = self._traces.pop(trace.trace_id, None)
+        if state is not None:
+            self.telemetry._finish_breakdown(trace.trace_id, state["conversation_id"], state["breakdown"])
+
+    def on_span_start(self, span: Span[Any]) -> None:
+        with self._lock:
+            parent = self._open.get(span.parent_id) if span.parent_id else None
+            agent = span.span_data.name if span.span_data.type == "agent" else (parent.agent if parent else "")
+            self._open[span.span_id] = _OpenSpan(agent)
+
+    def on_span_end(self, span: Span[Any]) -> None:
+        with self._lock:
+            opened = self._open.pop(span.span_id, None)
+            trace_state = self._traces.get(span.trace_id)
+        if opened is None:
+            return
+        seconds = time.perf_counter() - opened.start
+        kind, name = classify_span(span)
+        labels = {"kind": kind, "name": name, "agent": opened.agent}
+        registry = self.telemetry.registry
+        registry.observe("airline_span_duration_seconds", labels, seconds)
+        if span.error:
+            registry.inc("airline_span_errors_total", labels)
+
+        conversation_id = trace_state["conversation_id"] if trace_state else ""
+        if trace_state is not None:
+            breakdown = trace_state["breakdown"]
+            if kind in ("llm", "tool", "aviation"):
+                breakdown[f"{kind}_ms"] += seconds * 1000
+                breakdown[f"{kind}_calls"] += 1
+            elif kind == "storage":
+                breakdown["storage_ms"] += seconds * 1000
+            elif kind == "handoff":
+                breakdown["handoffs"] += 1
+
+        exporter = self.telemetry.exporter
+        if exporter is not None:
+            attributes = [_attribute("span.kind", kind), _attribute("agent.name", opened.agent),
+                          _attribute("conversation.id", conversation_id), _attribute("span.name", name)]
+            exporter.submit({
+                "traceId": _otlp_id(span.trace_id, 32),
+                "spanId": _otlp_id(span.span_id, 16),
+                "parentSpanId": _otlp_id(span.parent_id, 16),
+                "name": f"{kind} {name}",
+                "kind": 3 if kind in ("llm", "aviation", "storage") else 1,
+                "startTimeUnixNano": str(opened.start_ns),
+                "endTimeUnixNano": str(opened.start_ns + int(seconds * 1e9)),
+                "attributes": attributes,
+                "status": {"code": 2, "message": span.error["message"]} if span.error else {"code": 1},
+            })
+
+    def shutdown(self) -> None:
+        self.force_flush()
+
+    def force_flush(self) -> None:
+        if self.telemetry.exporter is not None:
+            self.telemetry.exporter.flush()
+
+
+class Telemetry:
+    """Process-wide instrumentation: sampled agent spans plus always-on turn/upstream metrics.
+
+    Agent spans (LLM calls, tools, handoffs, AviationStack fetches, storage
+    staging) are only recorded for a ``sample_rate`` fraction of turns; the
+    cheap per-turn, per-request and per-write histograms are always recorded.
+    """
+
+    def __init__(self, enabled: bool = True, sample_rate: float = 0.1, service_name: str = "airline-customer-service",
+                 otlp_file: Optional[str] = None, otlp_endpoint: Optional[str] = None,
+                 max_breakdowns: int = 256):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.registry = MetricsRegistry()
+        self.exporter = (OtlpJsonExporter(service_name, otlp_file, otlp_endpoint)
+                         if enabled and (otlp_file or otlp_endpoint) else None)
+        self.max_breakdowns = max_breakdowns
+        self._breakdowns: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._installed = False
+
+        self.registry.histogram("airline_turn_duration_seconds", "End-to-end latency of a user turn.",
+                                ["agent", "fast_path", "outcome"])
+        self.registry.histogram("airline_span_duration_seconds",
+                                "Latency of sampled agent spans (llm, tool, handoff, aviation, storage).",
+                                ["kind", "name", "agent"])
+        self.registry.counter("airline_span_errors_total", "Sampled agent spans that ended with an error.",
+                              ["kind", "name", "agent"])
+        self.registry.histogram("airline_aviation_request_duration_seconds",
+                                "AviationStack HTTP request latency.", ["endpoint", "outcome"])
+        self.registry.histogram("airline_storage_write_duration_seconds",
+                                "MongoDB bulk_write latency.", ["collection", "outcome"])
+        self.registry.counter("airline_storage_operations_total", "Write operations sent to MongoDB.",
+                              ["collection"])
+        self.registry.counter("airline_upstream_attempts_total",
+                              "Gemini/AviationStack call attempts through the upstream scheduler.",
+                              ["upstream", "outcome"])
+        self.registry.counter("airline_prefetch_total",
+                              "Speculative AviationStack fetches by outcome (hit, cancelled, unused).",
+                              ["endpoint", "outcome"])
+        self.registry.histogram("airline_upstream_queue_wait_seconds", "Time spent waiting for a rate-limit token.",
+                                ["upstream", "priority"])
+
+    @classmethod
+    def from_env(cls) -> "Telemetry":
+        return cls(
+            enabled=os.getenv("TELEMETRY_ENABLED", "true").lower() in ("1", "true", "yes"),
+            sample_rate=float(os.getenv("TELEMETRY_SAMPLE_RATE", "0.1")),
+            service_name=os.getenv("TELEMETRY_SERVICE_NAME", "airline-customer-service"),
+            otlp_file=os.getenv("TELEMETRY_OTLP_FILE"),
+            otlp_endpoint=os.getenv("TELEMETRY_OTLP_ENDPOINT"),
+        )
+
+    def install(self) -> None:
+        """Route SDK traces to this process instead of the OpenAI trace backend."""
+        if self._installed:
+            return
+        self._installed = True
+        if not self.enabled:
+            set_tracing_disabled(disabled=True)
+            return
+        set_tracing_disabled(disabled=False)
+        set_trace_processors([SpanMetricsProcessor(self)])
+
+    def sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def observe_turn(self, seconds: float, agent: str, fast_path: Optional[str], ok: bool = True) -> None:
+        if self.enabled:
+            self.registry.observe("airline_turn_duration_seconds",
+                                  {"agent": agent, "fast_path": fast_path or "", "outcome": "ok" if ok else "error"},
+                                  seconds)
+
+    def observe_aviation(self, endpoint: str, seconds: float, outcome: str) -> None:
+        if self.enabled:
+            self.registry.observe("airline_aviation_request_duration_seconds",
+                                  {"endpoint": endpoint, "outcome": outcome}, seconds)
+
+    def observe_storage_write(self, collection: str, seconds: float, operations: int, ok: bool) -> None:
+        if self.enabled:
+            self.registry.observe("airline_storage_write_duration_seconds",
+                                  {"collection": collection, "outcome": "ok" if ok else "error"}, seconds)
+            self.registry.inc("airline_storage_operations_total", {"collection": collection}, operations)
+
+    def observe_upstream(self, upstream: str, outcome: str) -> None:
+        if self.enabled:
+            self.registry.inc("airline_upstream_attempts_total", {"upstream": upstream, "outcome": outcome})
+
+    def observe_upstream_wait(self, upstream: str, priority: str, seconds: float) -> None:
+        if self.enabled:
+            self.registry.observe("airline_upstream_queue_wait_seconds",
+                                  {"upstream": upstream, "priority": priority}, seconds)
+
+    def observe_prefetch(self, endpoint: str, outcome: str) -> None:
+        if self.enabled:
+            self.registry.inc("airline_prefetch_total", {"endpoint": endpoint, "outcome": outcome})
+
+    def _finish_breakdown(self, trace_id: str, conversation_id: str, breakdown: Dict[str, Any]) -> None:
+        rounded = {key: round(value, 1) if isinstance(value, float) else value for key, value in breakdown.items()}
+        logger.info(f"Turn breakdown for {conversation_id}: {rounded}")
+        with self._lock:
+            self._breakdowns[trace_id] = rounded
+            while len(self._breakdowns) > self.max_breakdowns:
+                self._breakdowns.popitem(last=False)
+
+    def pop_breakdown(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._breakdowns.pop(trace_id, None)
+
+    def render_prometheus(self) -> str:
+        return self.registry.render()
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry.from_env()
+    return _telemetry
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app's modules are imported top-level (``from storage import ...``), as when running from this
+# directory; benchmarks/ provides the same fakes the load test uses
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
@@ -0,0 +1,54 @@
+from chat_view import ChatView
+from storage import ConversationStore
+from turns import ConversationState
+
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+
+def session(count, monkeypatch, history_load_limit=5, page_size=20):
+    """A conversation of ``count`` stored messages, loaded the way main.py loads it."""
+    monkeypatch.setenv("HISTORY_LOAD_LIMIT", str(history_load_limit))
+    monkeypatch.setenv("CHAT_PAGE_SIZE", str(page_size))
+    store = ConversationStore(None)
+    store.memory.append("c1", {}, [{"role": "user", "content": f"m{i}"} for i in range(count)], 0)
+    conversation = ConversationState.from_stored("c1", store.load("c1", last_n=history_load_limit))
+    return store, conversation, ChatView.from_env()
+
+
+def test_tail_shows_everything_loaded_when_less_than_a_page(monkeypatch):
+    store, conversation, view = session(100, monkeypatch)
+    assert conversation.message_seq_base == 95
+
+    assert contents(view.tail(conversation)) == ["m95", "m96", "m97", "m98", "m99"]
+    assert view.has_earlier(conversation)
+    assert view.earlier_pages(conversation, store) == []
+
+    view.show_earlier(conversation)
+    [(start, end, text)] = view.earlier_pages(conversation, store)
+    assert (start, end) == (80, 95)  # the partial page before the tail, read from the store
+    assert "m80" in text and "m94" in text and "m95" not in text
+
+
+def test_unaligned_base_near_the_end(monkeypatch):
+    store, conversation, view = session(42, monkeypatch)
+    assert contents(view.tail(conversation)) == ["m37", "m38", "m39", "m40", "m41"]
+    view.show_earlier(conversation)
+    view.show_earlier(conversation)
+    assert [(start, end) for start, end, _ in view.earlier_pages(conversation, store)] == [(0, 20), (20, 37)]
+
+
+def test_tail_realigns_once_a_page_is_in_memory(monkeypatch):
+    store, conversation, view = session(100, monkeypatch)
+    view.show_earlier(conversation)
+    view.earlier_pages(conversation, store)
+
+    # Turns append to the session; once a full page is in memory the tail is page-aligned again
+    conversation.messages += [{"role": "user", "content": f"m{i}"} for i in range(100, 115)]
+    store.memory.append("c1", {}, conversation.messages[5:], 100)
+    view.sync(conversation)
+    assert contents(view.tail(conversation))[0] == "m100"
+    [(start, end, text)] = view.earlier_pages(conversation, store)
+    assert (start, end) == (80, 100)
+    assert "m94" in text and "m99" in text
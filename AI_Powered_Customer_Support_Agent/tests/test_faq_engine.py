@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import faq_engine
+from airline_agents import faq_answer
+from faq_engine import DEFAULT_FAQ_PATH, FaqEngine
+
+NO_ANSWER = "Sorry, I don't have information on that topic. Can I assist with something else?"
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = FaqEngine(DEFAULT_FAQ_PATH)
+    monkeypatch.setattr(faq_engine, "_engine", engine)
+    return engine
+
+
+@pytest.mark.parametrize("question", ["what is the refund policy", "pet policy", "can I bring my dog"])
+def test_unknown_topic_falls_through_to_no_answer(engine, question):
+    assert engine.search(question) == []
+    assert faq_answer(question) == NO_ANSWER
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What's the baggage policy?", "What is the baggage policy?"),
+    ("is there wifi on the plane", "Is there Wi-Fi on board?"),
+    ("when can I check in", "When can I check in?"),
+    ("business class seats", "How many seats do your aircraft have?"),
+])
+def test_known_topic_is_answered(engine, question, expected):
+    assert engine.search(question)[0].question == expected
+
+
+def test_entry_must_cover_half_of_the_question(tmp_path):
+    path = tmp_path / "faqs.json"
+    path.write_text(json.dumps([
+        {"question": "Can I bring a pet?", "answer": "Small pets travel in the cabin."},
+        {"question": "How do refunds work?", "answer": "Refunds go back to the original payment."},
+    ]))
+    engine = FaqEngine(str(path))
+    assert engine.search("pet refund")  # each entry has one of two terms
+    assert engine.search("pet refund deadline") == []
+
+
+def test_reload_builds_off_the_caller_thread(tmp_path, monkeypatch):
+    path = tmp_path / "faqs.json"
+    other = {"question": "Can I bring a pet?", "answer": "Small pets travel in the cabin."}
+    path.write_text(json.dumps([{"question": "Is there Wi-Fi?", "answer": "Yes, free Wi-Fi."}, other]))
+    engine = FaqEngine(str(path), reload_interval=0)
+
+    building, release = threading.Event(), threading.Event()
+    real_index = faq_engine._Index
+
+    def slow_index(entries):
+        building.set()
+        release.wait(5)
+        return real_index(entries)
+
+    monkeypatch.setattr(faq_engine, "_Index", slow_index)
+    path.write_text(json.dumps([{"question": "Is there Wi-Fi?", "answer": "Wi-Fi costs $8."}, other]))
+    os.utime(path, (time.time() + 10, time.time() + 10))
+
+    start = time.perf_counter()
+    assert engine.search("wifi")[0].answer == "Yes, free Wi-Fi."  # old index, served meanwhile
+    assert building.wait(5)
+    assert engine.search("wifi")[0].answer == "Yes, free Wi-Fi."
+    assert time.perf_counter() - start < 1.0
+    assert engine.current_version() == 1
+
+    release.set()
+    engine._reloader.join(5)
+    assert engine.search("wifi")[0].answer == "Wi-Fi costs $8."
+    assert engine.current_version() == 2
@@ -0,0 +1,62 @@
+from history import FACTS_PREFIX, SUMMARY_PREFIX, HistoryManager, estimate_tokens
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+def headers(items):
+    return [item for item in items if item.get("role") == "system"]
+
+
+def test_facts_are_sent_without_folding():
+    window = HistoryManager(token_budget=4000).prepare([user("hi")], context={"passenger_name": "Ann Lee"})
+    assert window.folded_turns == 0
+    assert window.items[0] == {"role": "system", "content": f'{FACTS_PREFIX} passenger_name="Ann Lee".'}
+    assert window.items[1:] == [user("hi")]
+
+
+def test_no_header_without_summary_or_facts():
+    window = HistoryManager().prepare([user("hi")], context={"passenger_name": None})
+    assert window.items == [user("hi")]
+
+
+def test_header_is_replaced_not_repeated_across_turns():
+    manager = HistoryManager(token_budget=4000)
+    context = {"flight_number": "AA123"}
+    items = manager.prepare([user("status of AA123")], context=context).items
+    for turn in range(3):
+        items = manager.prepare(items + [assistant("On time."), user(f"and now? {turn}")], context=context).items
+        assert len(headers(items)) == 1
+
+
+def test_folding_keeps_summary_and_facts():
+    manager = HistoryManager(token_budget=60, min_recent_turns=1)
+    items = []
+    for turn in range(6):
+        items += [user(f"question {turn} " + "x" * 80), assistant(f"answer {turn} " + "y" * 80)]
+    items.append(user("last question"))
+    window = manager.prepare(items, context={"seat_number": "12A"})
+    assert window.folded_turns > 0
+    header = window.items[0]["content"]
+    assert header.startswith(SUMMARY_PREFIX) and f'{FACTS_PREFIX} seat_number="12A".' in header
+    assert window.items[-1] == user("last question")
+
+
+def test_tokens_before_counts_the_full_history():
+    manager = HistoryManager(token_budget=60, min_recent_turns=1)
+    full = []
+    for turn in range(6):
+        full += [user(f"question {turn} " + "x" * 80), assistant(f"answer {turn} " + "y" * 80)]
+    full.append(user("last question"))
+    first = manager.prepare(full)
+    # The next turn starts from the first window; without full_tokens the savings look smaller than they are
+    follow_up = first.items + [assistant("answer"), user("another question")]
+    full_tokens = sum(estimate_tokens(item) for item in full + follow_up[-2:])
+    window = manager.prepare(follow_up, first.summary, full_tokens=full_tokens)
+    assert window.tokens_before == full_tokens
+    assert window.tokens_after < sum(estimate_tokens(item) for item in follow_up) < full_tokens
@@ -0,0 +1,33 @@
+import pytest
+
+from reference_index import ReferenceIndex, build_index
+
+
+@pytest.fixture
+def airlines(tmp_path):
+    path = str(tmp_path / "airlines.idx")
+    build_index("airlines", [
+        {"iata_code": "AA", "airline_name": "American Airlines"},
+        {"iata_code": "AS", "airline_name": "Alaska Airlines"},
+        {"iata_code": "9W", "airline_name": "Jet Airways"},
+    ], path)
+    index = ReferenceIndex(path)
+    yield index
+    index.close()
+
+
+def test_resolve_codes_and_names(airlines):
+    assert airlines.resolve("aa") == "AA"
+    assert airlines.resolve(" 9w ") == "9W"
+    assert airlines.resolve("American Airlines") == "AA"
+    assert airlines.resolve("alaska") == "AS"
+    assert airlines.resolve("A") is None  # prefix of two names
+    assert airlines.resolve("Lufthansa") is None
+
+
+def test_free_text_names_do_not_enter_the_code_cache(airlines):
+    for phrase in ["American Airlines", "alaska", "the airline with the red logo", "Jet Airways"]:
+        airlines.resolve(phrase)
+    assert airlines.get.cache_info().currsize == 0
+    airlines.resolve("AA")
+    assert airlines.get.cache_info().currsize == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import response_cache
+from response_cache import EndpointPolicy, ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fetcher(*values):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return values[min(len(calls), len(values)) - 1]
+    return fetch, calls
+
+
+def test_empty_result_is_not_cached_without_empty_ttl():
+    cache = ResponseCache({"airports": EndpointPolicy(ttl=86400)})
+    fetch, calls = fetcher([], [{"iata_code": "JFK"}])
+
+    async def run():
+        assert await cache.get_or_fetch("airports", "JFK", fetch) == []
+        assert await cache.get_or_fetch("airports", "JFK", fetch) == [{"iata_code": "JFK"}]
+        assert await cache.get_or_fetch("airports", "JFK", fetch) == [{"iata_code": "JFK"}]
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_empty_result_expires_after_empty_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    cache = ResponseCache({"airports": EndpointPolicy(ttl=86400, stale_ttl=604800, empty_ttl=60)})
+    fetch, calls = fetcher([], [{"iata_code": "JFK"}])
+
+    async def run():
+        assert await cache.get_or_fetch("airports", "JFK", fetch) == []
+        clock.now += 30
+        assert await cache.get_or_fetch("airports", "JFK", fetch) == []
+        clock.now += 31  # past empty_ttl, and an empty entry is never served stale
+        assert await cache.get_or_fetch("airports", "JFK", fetch) == [{"iata_code": "JFK"}]
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_empty_refresh_keeps_the_last_good_value(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    cache = ResponseCache({"flights": EndpointPolicy(ttl=60, stale_ttl=240, empty_ttl=15)})
+    fetch, calls = fetcher([{"flight_status": "active"}], [])
+
+    async def run():
+        await cache.get_or_fetch("flights", "AA123", fetch)
+        clock.now += 90
+        assert await cache.get_or_fetch("flights", "AA123", fetch) == [{"flight_status": "active"}]
+        await asyncio.sleep(0)  # let the background refresh finish
+        await asyncio.sleep(0)
+        assert await cache.get_or_fetch("flights", "AA123", fetch) == [{"flight_status": "active"}]
+    asyncio.run(run())
+    assert (cache.stats.refreshes, cache.stats.refresh_failures) == (0, 2)
@@ -0,0 +1,111 @@
+import asyncio
+import copy
+import threading
+import time
+
+from seat_inventory import SeatInventory
+
+
+class SeatCollection:
+    """The part of a Mongo collection SeatInventory uses; updates are atomic, reads are slow.
+
+    The read delay makes every concurrent reserver load the map before anyone writes,
+    so their compare-and-set updates race on stale views.
+    """
+
+    def __init__(self, read_delay=0.01):
+        self.read_delay = read_delay
+        self.doc = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get(doc, path):
+        for part in path.split("."):
+            if not isinstance(doc, dict) or part not in doc:
+                return False, None
+            doc = doc[part]
+        return True, doc
+
+    def _matches(self, query):
+        for path, expected in query.items():
+            found, value = self._get(self.doc, path)
+            if isinstance(expected, dict) and "$exists" in expected:
+                if found != expected["$exists"]:
+                    return False
+            elif not found or value != expected:
+                return False
+        return True
+
+    def find_one(self, query, projection=None):
+        time.sleep(self.read_delay)
+        with self._lock:
+            return copy.deepcopy(self.doc) if self.doc is not None and self._matches(query) else None
+
+    def update_one(self, query, update, upsert=False):
+        class Result:
+            modified_count = 0
+
+        with self._lock:
+            if self.doc is None:
+                if upsert:
+                    self.doc = copy.deepcopy(update["$setOnInsert"])
+                return Result()
+            if not self._matches(query):
+                return Result()
+            for path, value in update.get("$set", {}).items():
+                parent, leaf = path.split(".")
+                self.doc[parent][leaf] = value
+            for path in update.get("$unset", {}):
+                parent, leaf = path.split(".")
+                self.doc[parent].pop(leaf, None)
+            for path, step in update.get("$inc", {}).items():
+                self.doc[path] += step
+            Result.modified_count = 1
+            return Result()
+
+
+def test_only_one_of_many_processes_gets_a_contested_seat():
+    collection = SeatCollection()
+    # One inventory per process, each with its own cache, sharing the collection
+    inventories = [SeatInventory(collection) for _ in range(6)]
+
+    async def run():
+        return await asyncio.gather(*(
+            inventory.reserve("AA100-2025-01-01", f"CONF{i}", "12A") for i, inventory in enumerate(inventories)
+        ))
+
+    results = asyncio.run(run())
+    winners = [i for i, result in enumerate(results) if result.ok]
+    assert len(winners) == 1
+    assert collection.doc["seats"] == {"12A": f"CONF{winners[0]}"}
+    assert all(result.reason == "taken" for result in results if not result.ok)
+    assert all(result.holder == f"CONF{winners[0]}" for result in results if not result.ok)
+
+
+def test_concurrent_moves_of_one_passenger_leave_them_in_one_seat():
+    collection = SeatCollection()
+    inventories = [SeatInventory(collection) for _ in range(3)]
+
+    async def run():
+        seats = ("12A", "14C", "20F")
+        return await asyncio.gather(*(
+            inventory.reserve("AA100-2025-01-01", "ABC123", seat) for inventory, seat in zip(inventories, seats)
+        ))
+
+    results = asyncio.run(run())
+    assert all(result.ok for result in results)
+    seat = collection.doc["passengers"]["ABC123"]
+    # The CAS on the passenger's previous seat releases it on every move: no orphaned seats
+    assert collection.doc["seats"] == {seat: "ABC123"}
+    assert sum(inventory.retries for inventory in inventories) >= 1
+
+
+def test_memory_mode_has_one_winner_under_contention():
+    inventory = SeatInventory(None)
+
+    async def run():
+        return await asyncio.gather(*(inventory.reserve("AA100-2025-01-01", f"CONF{i}", "12A") for i in range(20)))
+
+    results = asyncio.run(run())
+    assert sum(result.ok for result in results) == 1
+    assert inventory.stats()["conflicts"] == 19
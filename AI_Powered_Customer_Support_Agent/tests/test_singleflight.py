@@ -0,0 +1,70 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+class Upstream:
+    """A fetch that blocks until released and records whether it was cancelled."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"result {self.calls}"
+
+
+def test_concurrent_callers_share_one_fetch():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.create_task(flight.do("AA123", upstream.fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await asyncio.gather(*callers) == ["result 1"] * 3
+        assert upstream.calls == 1
+        assert flight.stats() == {"leaders": 1, "followers": 2, "abandoned": 0, "inflight": 0}
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_does_not_cancel_the_fetch_for_followers():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        leader = asyncio.create_task(flight.do("AA123", upstream.fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("AA123", upstream.fetch))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        assert leader.cancelled()
+        upstream.release.set()
+        assert await follower == "result 1"
+        assert (upstream.calls, upstream.cancelled, flight.abandoned) == (1, 0, 0)
+
+    asyncio.run(run())
+
+
+def test_fetch_is_cancelled_once_every_caller_is():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.create_task(flight.do("AA123", upstream.fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert (upstream.cancelled, flight.abandoned, len(flight)) == (1, 1, 0)
+
+        # The abandoned key is free again: the next caller starts a fresh fetch
+        upstream.release.set()
+        assert await flight.do("AA123", upstream.fetch) == "result 2"
+
+    asyncio.run(run())
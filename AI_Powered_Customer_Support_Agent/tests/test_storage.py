@@ -0,0 +1,102 @@
+from fakes import FakeCollection
+from io_loop import submit
+from storage import ConversationStore
+
+
+def message(text, role="user"):
+    return {"role": role, "content": text}
+
+
+def make_store(**kwargs):
+    kwargs.setdefault("flush_interval", 3600)
+    return ConversationStore(FakeCollection(latency_ms=0), FakeCollection(latency_ms=0), **kwargs)
+
+
+def stage(store, cid, context, messages, first_seq):
+    submit(store._stage(cid, context, messages, first_seq, flush_now=False)).result()
+
+
+def test_memory_fallback_writes_staged_messages_at_their_seq():
+    store = make_store()
+    store.memory.append("c1", {}, [message("m0"), message("m1"), message("m2")], 0)
+    # A retried turn re-stages seq 1 onwards; nothing may be repeated or renumbered
+    stage(store, "c1", {"passenger_name": "Ann"}, [message("m1"), message("m2"), message("m3")], 1)
+
+    submit(store.use_memory_fallback()).result()
+
+    assert not store.use_mongodb
+    loaded = store.load("c1")
+    assert [m["content"] for m in loaded["messages"]] == ["m0", "m1", "m2", "m3"]
+    assert loaded["message_count"] == 4
+    assert loaded["context"] == {"passenger_name": "Ann"}
+
+
+def test_memory_fallback_keeps_context_only_saves():
+    store = make_store()
+    store.memory.append("c1", {"seat_number": "12A"}, [message("m0")], 0)
+    stage(store, "c1", {"seat_number": "14C"}, [], None)
+
+    submit(store.use_memory_fallback()).result()
+
+    loaded = store.load("c1")
+    assert loaded["context"] == {"seat_number": "14C"}
+    assert [m["content"] for m in loaded["messages"]] == ["m0"]
+
+
+class FailingCollection(FakeCollection):
+    """Fails the next ``failures`` bulk writes, running ``on_failure`` first (from the writer thread)."""
+
+    def __init__(self, failures=1, on_failure=None):
+        super().__init__(latency_ms=0)
+        self.failures = failures
+        self.on_failure = on_failure
+
+    def bulk_write(self, requests, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            if self.on_failure is not None:
+                self.on_failure()
+            raise ConnectionError("primary stepped down")
+        return super().bulk_write(requests, ordered)
+
+
+def stored_messages(collection, cid):
+    return sorted((doc["seq"], doc["content"]) for doc in collection.docs.values() if doc["conversation_id"] == cid)
+
+
+def test_failed_flush_requeues_and_the_next_flush_writes_everything():
+    messages = FailingCollection()
+    store = ConversationStore(FakeCollection(latency_ms=0), messages, flush_interval=3600)
+    stage(store, "c1", {"seat_number": "12A"}, [message("m0"), message("m1")], 0)
+
+    submit(store._flush_all()).result()
+    assert store.stats()["failed_flushes"] == 1
+    assert store.stats()["pending"] == 1
+    assert stored_messages(messages, "c1") == []
+
+    submit(store._flush_all()).result()
+    assert store.stats()["pending"] == 0
+    assert stored_messages(messages, "c1") == [(0, "m0"), (1, "m1")]
+    [conversation] = store.collection.docs.values()
+    assert conversation["message_count"] == 2
+    assert conversation["context"] == {"seat_number": "12A"}
+
+
+def test_requeue_keeps_what_was_staged_during_the_failed_write():
+    # A turn that ends while the flush is in flight must win over the requeued, older context
+    store = None
+
+    def next_turn():
+        stage(store, "c1", {"seat_number": "14C"}, [message("m2")], 2)
+
+    messages = FailingCollection(on_failure=next_turn)
+    store = ConversationStore(FakeCollection(latency_ms=0), messages, flush_interval=3600)
+    stage(store, "c1", {"seat_number": "12A"}, [message("m0"), message("m1")], 0)
+
+    submit(store._flush_all()).result()
+    submit(store._flush_all()).result()
+
+    assert stored_messages(messages, "c1") == [(0, "m0"), (1, "m1"), (2, "m2")]
+    [conversation] = store.collection.docs.values()
+    assert conversation["message_count"] == 3
+    assert conversation["context"] == {"seat_number": "14C"}
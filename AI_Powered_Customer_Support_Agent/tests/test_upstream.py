@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from upstream import (BACKGROUND, INTERACTIVE, CircuitBreaker, CircuitOpenError, RateLimitedError, RetryPolicy,
+                      TokenBucket, Upstream, UpstreamUnavailable)
+
+
+def test_interactive_callers_queue_behind_the_burst():
+    bucket = TokenBucket(rate=20, burst=2)
+
+    async def run():
+        return [await bucket.acquire(INTERACTIVE, max_wait=1) for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert first == second == 0
+    assert 0.03 < third <= 0.05
+
+
+def test_interactive_caller_is_rejected_past_max_wait_and_keeps_no_token():
+    bucket = TokenBucket(rate=1, burst=1)
+
+    async def run():
+        await bucket.acquire(INTERACTIVE, max_wait=0.5)
+        with pytest.raises(RateLimitedError) as rejected:
+            await bucket.acquire(INTERACTIVE, max_wait=0.5)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.retry_after == pytest.approx(1, abs=0.05)
+    assert bucket._tokens == pytest.approx(0, abs=0.05)
+
+
+def test_cancelled_interactive_caller_refunds_its_token():
+    bucket = TokenBucket(rate=1, burst=1)
+
+    async def run():
+        await bucket.acquire(INTERACTIVE, max_wait=5)
+        waiter = asyncio.create_task(bucket.acquire(INTERACTIVE, max_wait=5))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(run())
+    assert bucket._tokens == pytest.approx(0, abs=0.05)
+
+
+def test_background_callers_leave_the_reserve_for_interactive_ones():
+    bucket = TokenBucket(rate=1, burst=4, background_reserve=0.5)
+
+    async def run():
+        for _ in range(2):
+            assert await bucket.acquire(BACKGROUND, max_wait=0) < 0.01
+        with pytest.raises(RateLimitedError):
+            await bucket.acquire(BACKGROUND, max_wait=0.1)
+        # The reserved half of the burst is still there for a user turn
+        assert await bucket.acquire(INTERACTIVE, max_wait=0) == 0
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_after_threshold_and_admits_one_probe_after_reset():
+    breaker = CircuitBreaker("aviationstack", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one probe at a time
+
+    breaker.record_failure()
+    assert (breaker.state, breaker.opened) == ("open", 2)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_unused_probe_slot_is_released():
+    breaker = CircuitBreaker("aviationstack", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.release()
+    breaker.allow()
+
+
+def upstream(threshold=2):
+    return Upstream("aviationstack", None, CircuitBreaker("aviationstack", failure_threshold=threshold),
+                    RetryPolicy(max_attempts=5, base_delay=0.001, max_delay=0.01))
+
+
+def test_transient_failures_open_the_circuit_and_later_calls_fail_fast():
+    limiter, calls = upstream(), []
+
+    async def fetch():
+        calls.append(1)
+        raise httpx.ConnectError("connection refused")
+
+    async def run():
+        with pytest.raises(UpstreamUnavailable):
+            await limiter.call(fetch)
+        assert len(calls) == 2  # retried until the breaker opened, not to max_attempts
+        with pytest.raises(CircuitOpenError):
+            await limiter.call(fetch)
+        assert len(calls) == 2
+
+    asyncio.run(run())
+    assert limiter.stats()["circuit"] == "open"
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_client_errors_are_not_retried_and_do_not_trip_the_breaker():
+    limiter, calls = upstream(threshold=1), []
+
+    async def fetch():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await limiter.call(fetch)
+
+    asyncio.run(run())
+    assert len(calls) == 3
+    assert limiter.stats()["circuit"] == "closed"
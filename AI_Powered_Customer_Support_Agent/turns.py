@@ -0,0 +1,228 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agents import (
+    Agent,
+    ItemHelpers,
+    RunHooks,
+    MessageOutputItem,
+    ToolCallItem,
+    RunContextWrapper,
+    Runner,
+    custom_span,
+    trace,
+)
+from openai.types.responses import ResponseTextDeltaEvent
+
+from answer_cache import AnswerCache, cacheable_run, tool_entities
+from airline_agents import AirlineAgentContext, apply_passenger_name, on_seat_booking_handoff
+from fast_router import SEAT_BOOKING_AGENT, TRIAGE_AGENT, FastRouter
+from history import HistoryManager, estimate_tokens
+from prefetch import Prefetcher
+from storage import ConversationStore
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+StreamHandler = Callable[[Any], Awaitable[None]]
+
+
+@dataclass
+class ConversationState:
+    """Everything one conversation needs between turns, independent of any UI.
+
+    ``messages[i]`` is persisted with seq ``message_seq_base + i``; messages from
+    ``persisted_messages`` onward have not been handed to the store yet.
+    ``input_items`` is the last window sent plus what came after it;
+    ``history_tokens`` estimates the full input list had nothing been windowed.
+    """
+    conversation_id: str
+    context: AirlineAgentContext = field(default_factory=AirlineAgentContext)
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    input_items: List[Any] = field(default_factory=list)
+    history_summary: str = ""
+    history_tokens: int = 0
+    current_agent: str = TRIAGE_AGENT
+    persisted_messages: int = 0
+    message_seq_base: int = 0
+
+    @classmethod
+    def from_stored(cls, conversation_id: str, stored: Optional[Dict[str, Any]]) -> "ConversationState":
+        state = cls(conversation_id)
+        if stored:
+            state.context = AirlineAgentContext(**stored.get("context", {}))
+            state.messages = list(stored.get("messages", []))
+            state.persisted_messages = len(state.messages)
+            state.message_seq_base = stored.get("message_count", 0) - state.persisted_messages
+        return state
+
+    def add_input(self, item: Dict[str, Any]) -> None:
+        self.input_items.append(item)
+        self.history_tokens += estimate_tokens(item)
+
+
+@dataclass
+class TurnResult:
+    replies: List[str]
+    agent: str
+    latency_ms: float
+    ttft_ms: Optional[float] = None
+    fast_path: Optional[str] = None
+    tokens_before: int = 0
+    tokens_after: int = 0
+    # Sampled turns only: time spent in LLM calls, tools, AviationStack and storage
+    breakdown: Optional[Dict[str, Any]] = None
+
+
+class TurnRunner:
+    """Runs one user turn through the agent graph for any front end.
+
+    Shared by the Streamlit app and the headless service: fast-path routing,
+    history windowing, the agent run (optionally streamed to ``on_event``) and
+    write-behind persistence all happen here. Callers must not run two turns of
+    the same conversation concurrently. With a ``prefetcher``, AviationStack
+    lookups for codes in the user's message start alongside the agent run; with
+    an ``answer_cache``, repeat questions are answered without running agents.
+    """
+
+    def __init__(self, agents: Dict[str, Agent[AirlineAgentContext]], store: ConversationStore,
+                 history: HistoryManager, router: Optional[FastRouter] = None,
+                 hooks: Optional[RunHooks] = None, prefetcher: Optional[Prefetcher] = None,
+                 answer_cache: Optional[AnswerCache] = None):
+        self.agents = agents
+        self.store = store
+        self.history = history
+        self.router = router
+        self.hooks = hooks
+        self.prefetcher = prefetcher
+        self.answer_cache = answer_cache
+
+    async def load(self, conversation_id: str, last_n: Optional[int] = None) -> ConversationState:
+        return ConversationState.from_stored(conversation_id, await self.store.aload(conversation_id, last_n))
+
+    async def _run_agents(self, state: ConversationState, start_agent: Agent[AirlineAgentContext], user_input: str,
+                          context_before: Dict[str, Any],
+                          on_event: Optional[StreamHandler]) -> Tuple[int, int, Optional[float]]:
+        """Run the agent graph for one turn; returns (tokens_before, tokens_after, first_token_at)."""
+        # Flight numbers and codes are known before any LLM call; start those fetches now
+        prefetched = self.prefetcher.start(state.context, user_input) if self.prefetcher is not None else set()
+
+        # Send recent turns verbatim within the token budget; older ones are summarized
+        window = self.history.prepare(state.input_items, state.history_summary, context_before,
+                                      full_tokens=state.history_tokens)
+        state.history_summary = window.summary
+        first_token_at: Optional[float] = None
+
+        try:
+            if on_event is not None:
+                result = Runner.run_streamed(start_agent, window.items, context=state.context, hooks=self.hooks)
+                async for event in result.stream_events():
+                    if (first_token_at is None and event.type == "raw_response_event"
+                            and isinstance(event.data, ResponseTextDeltaEvent)):
+                        first_token_at = time.perf_counter()
+                    await on_event(event)
+            else:
+                result = await Runner.run(start_agent, window.items, context=state.context, hooks=self.hooks)
+        finally:
+            if prefetched:
+                self.prefetcher.finish(state.context, prefetched)
+
+        replies = []
+        for new_item in result.new_items:
+            if isinstance(new_item, MessageOutputItem):
+                replies.append(ItemHelpers.text_message_output(new_item))
+                state.messages.append({"role": "assistant", "content": replies[-1]})
+
+        # Only turns that read (never wrote) state are safe to replay for someone else
+        if self.answer_cache is not None:
+            calls = [(item.raw_item.name, getattr(item.raw_item, "arguments", None))
+                     for item in result.new_items if isinstance(item, ToolCallItem)]
+            if cacheable_run([name for name, _ in calls], context_before, state.context.dict()):
+                self.answer_cache.put(user_input, start_agent.name, context_before, replies, result.last_agent.name,
+                                      bound=tool_entities(calls))
+            else:
+                self.answer_cache.skip()
+
+        state.input_items = result.to_input_list()
+        state.history_tokens += sum(estimate_tokens(item) for item in state.input_items[len(window.items):])
+        state.current_agent = result.last_agent.name
+        return window.tokens_before, window.tokens_after, first_token_at
+
+    async def run_turn(self, state: ConversationState, user_input: str,
+                       on_event: Optional[StreamHandler] = None) -> TurnResult:
+        turn_start = time.perf_counter()
+        first_token_at: Optional[float] = None
+        state.messages.append({"role": "user", "content": user_input})
+        state.add_input({"content": user_input, "role": "user"})
+        state.context.start_turn(state.conversation_id, self.store)
+        first_reply = len(state.messages)
+
+        # Confident, trivially classifiable turns skip the triage LLM hop
+        start_agent = self.agents.get(state.current_agent, self.agents[TRIAGE_AGENT])
+        route = None
+        if self.router is not None and start_agent.name == TRIAGE_AGENT:
+            route = self.router.route(user_input)
+        fast_path = route.rule if route is not None else None
+        tokens_before = tokens_after = 0
+        telemetry = get_telemetry()
+        sampled = telemetry.sample()
+
+        try:
+            with trace("Customer service", group_id=state.conversation_id,
+                       metadata={"conversation_id": state.conversation_id}, disabled=not sampled) as turn_trace:
+                wrapper = RunContextWrapper(context=state.context)
+                if route is not None and route.direct_tool == "set_passenger_name":
+                    reply = await apply_passenger_name(wrapper, route.args["name"])
+                    state.messages.append({"role": "assistant", "content": reply})
+                    state.add_input({"role": "assistant", "content": reply})
+                else:
+                    if route is not None:
+                        start_agent = self.agents[route.agent]
+                        if route.agent == SEAT_BOOKING_AGENT:
+                            await on_seat_booking_handoff(wrapper)
+
+                    # Near-duplicate questions (mostly FAQs) reuse an earlier answer with no LLM call
+                    context_before = state.context.dict()
+                    cached = (self.answer_cache.get(user_input, start_agent.name, context_before)
+                              if self.answer_cache is not None else None)
+                    if cached is not None:
+                        fast_path = "answer_cache"
+                        for reply in cached.replies:
+                            state.messages.append({"role": "assistant", "content": reply})
+                            state.add_input({"role": "assistant", "content": reply})
+                        state.current_agent = cached.agent
+                    else:
+                        tokens_before, tokens_after, first_token_at = await self._run_agents(
+                            state, start_agent, user_input, context_before, on_event)
+
+                # Persist once, after the run (or stream) has finished
+                persisted = state.persisted_messages
+                with custom_span("storage", {"op": "end_turn"}):
+                    await self.store.end_turn(
+                        state.conversation_id,
+                        state.context.dict(),
+                        state.messages[persisted:],
+                        state.message_seq_base + persisted,
+                    )
+                state.persisted_messages = len(state.messages)
+        except Exception:
+            telemetry.observe_turn(time.perf_counter() - turn_start, state.current_agent, fast_path, ok=False)
+            raise
+
+        latency = (time.perf_counter() - turn_start) * 1000
+        ttft = (first_token_at - turn_start) * 1000 if first_token_at is not None else None
+        ttft_text = f"{ttft:.0f} ms" if ttft is not None else "n/a"
+        logger.info(f"Turn latency: ttft={ttft_text} total={latency:.0f} ms streaming={on_event is not None}")
+        telemetry.observe_turn(latency / 1000, state.current_agent, fast_path)
+        return TurnResult(
+            replies=[m["content"] for m in state.messages[first_reply:]],
+            agent=state.current_agent,
+            latency_ms=latency,
+            ttft_ms=ttft,
+            fast_path=fast_path,
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+            breakdown=telemetry.pop_breakdown(turn_trace.trace_id) if sampled else None,
+        )
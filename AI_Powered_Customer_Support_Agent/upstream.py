@@ -0,0 +1,380 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Callers inherit the priority of the task that spawned them, so everything a
+# stale-while-revalidate refresh awaits is queued behind user-facing turns.
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream call was not made or gave up; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(f"{upstream} is unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class RateLimitedError(UpstreamUnavailable):
+    pass
+
+
+def classify_error(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """Return (transient, retry_after) for an error raised by an httpx or OpenAI client call."""
+    if isinstance(exc, (httpx.TransportError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True, None
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if not isinstance(status, int):
+        return False, None
+    if status not in (408, 429) and status < 500:
+        return False, None
+    retry_after = None
+    try:
+        retry_after = float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return True, retry_after
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every event loop in the process.
+
+    Interactive callers reserve a token immediately, driving the balance
+    negative if needed, and sleep until their slot comes up, so they are
+    served in arrival order. Background callers only take a token when the
+    bucket holds more than ``background_reserve`` of its burst and nobody is
+    queued, which leaves headroom for the next user turn.
+    """
+
+    def __init__(self, rate: float, burst: float, background_reserve: float = 0.5):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = burst * background_reserve
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _refund(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    async def acquire(self, priority: str, max_wait: float) -> float:
+        """Wait for a token and return the seconds spent waiting; raise RateLimitedError past ``max_wait``."""
+        start = time.monotonic()
+        if priority == INTERACTIVE:
+            with self._lock:
+                self._refill(start)
+                self._tokens -= 1
+                wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+                if wait > max_wait:
+                    self._tokens += 1
+                    raise RateLimitedError("", f"queue is {wait:.1f}s deep", retry_after=wait)
+            if wait:
+                try:
+                    await asyncio.sleep(wait)
+                except asyncio.CancelledError:
+                    self._refund()
+                    raise
+            return wait
+
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._refill(now)
+                if self._tokens - 1 >= self.reserve:
+                    self._tokens -= 1
+                    return now - start
+                wait = (self.reserve + 1 - self._tokens) / self.rate
+            if now - start + wait > max_wait:
+                raise RateLimitedError("", "background budget exhausted", retry_after=wait)
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive transient failures.
+
+    While open, calls fail immediately. After ``reset_timeout`` one probe is let
+    through (half-open); its success closes the circuit, its failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpenError(self.name, "circuit open", retry_after=max(remaining, 1.0))
+
+    def release(self) -> None:
+        """Give back a half-open probe slot that was admitted but never used."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._probing = False
+            self.failures = 0
+            if self.state != "closed":
+                logger.info(f"Circuit for {self.name} closed")
+                self.state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._probing = False
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After up to ``max_delay``."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to sleep before retry number ``attempt + 1``, or None to give up."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay if delay <= self.max_delay else None
+
+
+class Upstream:
+    """Rate limit, retry and circuit-break calls to one external service."""
+
+    def __init__(self, name: str, bucket: Optional[TokenBucket], breaker: CircuitBreaker, retry: RetryPolicy,
+                 max_queue_wait: float = 10.0, max_background_wait: float = 30.0):
+        self.name = name
+        self.bucket = bucket
+        self.breaker = breaker
+        self.retry = retry
+        self.max_queue_wait = max_queue_wait
+        self.max_background_wait = max_background_wait
+        self.stats_counts = {"calls": 0, "retries": 0, "transient_errors": 0, "rejected": 0,
+                             "rate_limited": 0, "throttled": 0}
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "Upstream":
+        # A rate of 0 disables the bucket; retries and the breaker still apply.
+        rate = float(os.getenv(f"{prefix}_RATE_LIMIT", "5"))
+        burst = float(os.getenv(f"{prefix}_BURST", "10"))
+        return cls(
+            name,
+            TokenBucket(rate, burst, float(os.getenv(f"{prefix}_BACKGROUND_RESERVE", "0.5"))) if rate > 0 else None,
+            CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv(f"{prefix}_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET", "30")),
+            ),
+            RetryPolicy(
+                max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", "3")),
+                base_delay=float(os.getenv(f"{prefix}_RETRY_BASE_DELAY", "0.5")),
+                max_delay=float(os.getenv(f"{prefix}_RETRY_MAX_DELAY", "8")),
+            ),
+            max_queue_wait=float(os.getenv(f"{prefix}_MAX_QUEUE_WAIT", "10")),
+        )
+
+    def _count(self, key: str, outcome: Optional[str] = None) -> None:
+        self.stats_counts[key] += 1
+        if outcome is not None:
+            get_telemetry().observe_upstream(self.name, outcome)
+
+    async def _admit(self, priority: str) -> None:
+        self.stats_counts["calls"] += 1
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self._count("rejected", "circuit_open")
+            raise
+        if self.bucket is None:
+            return
+        max_wait = self.max_queue_wait if priority == INTERACTIVE else self.max_background_wait
+        try:
+            waited = await self.bucket.acquire(priority, max_wait)
+        except RateLimitedError as e:
+            self.breaker.release()
+            self._count("rate_limited", "rate_limited")
+            raise RateLimitedError(self.name, e.reason, e.retry_after) from None
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        if waited:
+            self.stats_counts["throttled"] += 1
+            get_telemetry().observe_upstream_wait(self.name, priority, waited)
+
+    def _backoff(self, exc: Exception, attempt: int) -> float:
+        """Record a failed attempt and return the retry delay, or raise if the call should not be retried."""
+        transient, retry_after = classify_error(exc)
+        if not transient:
+            # The upstream answered; a bad request says nothing about its health.
+            self.breaker.record_success()
+            get_telemetry().observe_upstream(self.name, "error")
+            raise exc
+        self.breaker.record_failure()
+        self._count("transient_errors", "transient_error")
+        delay = None if self.breaker.is_open else self.retry.delay(attempt, retry_after)
+        if delay is None:
+            raise UpstreamUnavailable(self.name, f"{type(exc).__name__} after {attempt + 1} attempt(s)",
+                                      retry_after=retry_after) from exc
+        self.stats_counts["retries"] += 1
+        logger.warning(f"{self.name} call failed ({type(exc).__name__}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    async def call(self, fn: Callable[[], Awaitable[T]], priority: Optional[str] = None) -> T:
+        """Run ``fn()`` under the rate limit and breaker, retrying transient failures with a fresh call."""
+        priority = priority or _priority.get()
+        attempt = 0
+        while True:
+            await self._admit(priority)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            get_telemetry().observe_upstream(self.name, "ok")
+            return result
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]],
+                     priority: Optional[str] = None) -> AsyncIterator[T]:
+        """Like ``call`` for streams: failures before the first item are retried, later ones propagate."""
+        priority = priority or _priority.get()
+        attempt = 0
+        while True:
+            await self._admit(priority)
+            events = open_stream()
+            try:
+                first = await events.__anext__()
+            except StopAsyncIteration:
+                self.breaker.record_success()
+                return
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                delay = self._backoff(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            get_telemetry().observe_upstream(self.name, "ok")
+            break
+        yield first
+        async for event in events:
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counts, "circuit": self.breaker.state, "circuit_opened": self.breaker.opened,
+                "consecutive_failures": self.breaker.failures}
+
+
+# Upstream name -> env prefix for its limits.
+UPSTREAMS = {"gemini": "GEMINI", "aviationstack": "AVIATION"}
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    """Process-wide limiter for ``name``, shared by every session, loop and thread."""
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            upstream = _upstreams[name] = Upstream.from_env(name, UPSTREAMS.get(name, name.upper()))
+    return upstream
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    with _upstreams_lock:
+        return {name: upstream.stats() for name, upstream in _upstreams.items()}
+
+
+def scheduled_model(model_name: str, openai_client: Any, upstream: str = "gemini") -> Any:
+    """An OpenAIChatCompletionsModel whose requests go through ``get_upstream(upstream)``.
+
+    The client's own retries should be disabled (``max_retries=0``) so they
+    don't multiply with the scheduler's.
+    """
+    from agents import OpenAIChatCompletionsModel
+
+    class ScheduledChatCompletionsModel(OpenAIChatCompletionsModel):
+        async def get_response(self, *args: Any, **kwargs: Any) -> Any:
+            parent = super().get_response
+            return await get_upstream(upstream).call(lambda: parent(*args, **kwargs))
+
+        async def stream_response(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+            parent = super().stream_response
+            async for event in get_upstream(upstream).stream(lambda: parent(*args, **kwargs)):
+                yield event
+
+    return ScheduledChatCompletionsModel(model=model_name, openai_client=openai_client)